@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Book, Author, Genre, BookInstance, Language, Country
+from .models import Book, Author, Genre, BookInstance, Hold, Language, Country, OverdueLoan
+from .overdue import overdue_loans
 # Register your models here.
 
 # admin.site.register(Book)
@@ -21,15 +22,30 @@ class BooksInline(admin.TabularInline):
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'display_genre')
+    list_display = ('title', 'author', 'display_genre', 'num_available', 'num_copies')
+    readonly_fields = ('num_copies', 'num_available', 'num_on_loan', 'next_due_back')
     inlines = [BooksInstanceInline]
     # fields = ['title', 'isbn', ('author', 'language'), 'summary', 'display_genre']
 
 
+class OverdueListFilter(admin.SimpleListFilter):
+    """ Copies on loan past their due date, filtered in the database rather than with is_overdue(). """
+    title = 'overdue'
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('yes', 'Overdue'),)
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return overdue_loans(queryset)
+        return queryset
+
+
 @admin.register(BookInstance)
 class BookInstanceAdmin(admin.ModelAdmin):
     list_display = ('book', 'display_author','borrower', 'status', 'due_back', 'id')
-    list_filter = ('status', 'due_back')
+    list_filter = ('status', OverdueListFilter, 'due_back')
     fieldsets = (
         ('Information', {
             'fields': ('book', 'imprint')
@@ -40,6 +56,22 @@ class BookInstanceAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'patron', 'status', 'placed', 'allocated')
+    list_filter = ('status',)
+    # Changing these by hand would bypass the queue (see catalog/holds.py).
+    readonly_fields = ('copy', 'allocated')
+    raw_id_fields = ('book', 'patron')
+
+
+@admin.register(OverdueLoan)
+class OverdueLoanAdmin(admin.ModelAdmin):
+    list_display = ('copy', 'borrower', 'due_back', 'recorded', 'notified')
+    list_filter = ('recorded',)
+    raw_id_fields = ('copy', 'borrower')
+
+
 # Define the admin class
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
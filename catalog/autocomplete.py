@@ -0,0 +1,160 @@
+""" In-memory prefix index for search box suggestions.
+
+Book titles and author names are normalized (accents removed, case folded,
+whitespace collapsed) and kept in one sorted list of distinct keys, so the
+suggestions for a prefix are found with a binary search followed by a short
+scan, without touching the database. Authors are indexed both as
+"first last" and "last first".
+
+The index is built from the database on first use. Each process has its own
+copy, tagged with a version shared through the cache (see ProcessIndex in
+catalog/caching.py). The Book and Author signal handlers in catalog/signals.py
+write a new version once a change commits, and every process then rebuilds
+its copy on its next lookup. Bulk commands, which send no signals, call
+expire_index().
+
+To bound memory use, at most CATALOG_AUTOCOMPLETE_TOP_K objects are kept for
+any one key (seeded catalogs have thousands of books sharing a title), which
+is also the most suggestions returned for a prefix.
+"""
+import bisect
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.urls import reverse
+
+from .caching import ProcessIndex
+from .models import Author, Book
+
+SUGGESTIONS_VERSION_KEY = 'catalog:suggestions-version'
+
+
+def normalize(text):
+    """ Reduce `text` to the form it is indexed and looked up under. """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+
+def book_keys(title):
+    return [normalize(title)]
+
+
+def author_keys(first_name, last_name):
+    return [normalize(f'{first_name} {last_name}'), normalize(f'{last_name} {first_name}')]
+
+
+class PrefixIndex:
+    def __init__(self, top_k):
+        self.top_k = top_k
+        self.keys = []     # Sorted distinct keys.
+        self.entries = {}  # key -> [(kind, pk, label), ...], at most top_k long.
+        self.owners = {}   # (kind, pk) -> the keys that object is indexed under.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def build(self, objects):
+        """ Replace the contents with `objects`, an iterable of (kind, pk, label, keys). """
+        entries, owners = {}, {}
+        for kind, pk, label, keys in objects:
+            owners[kind, pk] = keys
+            for key in keys:
+                stored = entries.setdefault(key, [])
+                if len(stored) < self.top_k:
+                    stored.append((kind, pk, label))
+        with self.lock:
+            self.entries, self.owners = entries, owners
+            self.keys = sorted(entries)
+
+    def add(self, kind, pk, label, keys):
+        with self.lock:
+            self._remove(kind, pk)
+            self.owners[kind, pk] = keys
+            for key in keys:
+                stored = self.entries.get(key)
+                if stored is None:
+                    # Fill in the entry before the key becomes visible to lookups.
+                    self.entries[key] = [(kind, pk, label)]
+                    bisect.insort(self.keys, key)
+                elif len(stored) < self.top_k:
+                    stored.append((kind, pk, label))
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        for key in self.owners.pop((kind, pk), ()):
+            stored = [entry for entry in self.entries.get(key, ()) if entry[:2] != (kind, pk)]
+            if stored:
+                self.entries[key] = stored
+            elif key in self.entries:
+                # Hide the key from lookups before dropping its entry.
+                del self.keys[bisect.bisect_left(self.keys, key)]
+                del self.entries[key]
+
+    def lookup(self, prefix, limit=None):
+        """ Return up to `limit` (kind, pk, label) entries whose key starts with `prefix`, in key order. """
+        prefix = normalize(prefix)
+        limit = min(limit or self.top_k, self.top_k)
+        if not prefix:
+            return []
+        results = []
+        with self.lock:
+            keys = self.keys
+            for position in range(bisect.bisect_left(keys, prefix), len(keys)):
+                key = keys[position]
+                if not key.startswith(prefix) or len(results) >= limit:
+                    break
+                stored = self.entries.get(key)
+                if stored:
+                    results.append(stored[0])
+        return results
+
+
+def build_index():
+    index = PrefixIndex(settings.CATALOG_AUTOCOMPLETE_TOP_K)
+    index.build(load_objects())
+    return index
+
+
+_index = ProcessIndex(SUGGESTIONS_VERSION_KEY, build_index)
+
+
+def get_index():
+    """ Return this process's index, (re)building it when missing or out of date. """
+    return _index.get()
+
+
+def reset_index():
+    """ Forget this process's index so the next lookup rebuilds it from the database. """
+    _index.reset()
+
+
+def expire_index():
+    """ Make every process rebuild its index on its next lookup. """
+    _index.expire()
+
+
+def expire_index_on_commit():
+    """ expire_index() once the current transaction commits. """
+    _index.expire_on_commit()
+
+
+def load_objects():
+    for pk, title in Book.objects.values_list('pk', 'title').iterator(chunk_size=5000):
+        yield 'book', pk, title, book_keys(title)
+    for pk, first_name, last_name in Author.objects.values_list('pk', 'first_name', 'last_name').iterator(chunk_size=5000):
+        yield 'author', pk, f'{last_name}, {first_name}', author_keys(first_name, last_name)
+
+
+def suggest(prefix, limit=None):
+    """ Return search box suggestions for `prefix` as JSON-ready dicts. """
+    urls = {'book': 'book-detail', 'author': 'author-detail'}
+    return [
+        {'label': label, 'type': kind, 'url': reverse(urls[kind], args=[pk])}
+        for kind, pk, label in get_index().lookup(prefix, limit)
+    ]
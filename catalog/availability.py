@@ -0,0 +1,76 @@
+""" Copy counts kept on each Book.
+
+Book.num_copies, num_available, num_on_loan and next_due_back save the book
+list, book and author pages from counting BookInstance rows for every book
+they show. Each recount is a single UPDATE that computes all four values from
+the book's copies, so a recount is always correct no matter what changed.
+
+The signal handlers in catalog/signals.py recount a book whenever one of its
+copies is saved or deleted, which covers the admin, the renewal form and
+everything else that goes through the ORM one object at a time. Bulk writes
+(bulk_create(), queryset.update()) send no signals and must call
+recount_books() themselves; `manage.py recount_availability` rebuilds every
+book's counts.
+"""
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Book, BookInstance
+
+
+def counter_values():
+    """ Expressions computing each counter from the copies of the book being updated. """
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+
+    def count(**filters):
+        return Coalesce(Subquery(copies.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+    return {
+        'num_copies': count(),
+        'num_available': count(status__exact='a'),
+        'num_on_loan': count(status__exact='o'),
+        'next_due_back': Subquery(
+            copies.filter(status__exact='o').annotate(due_back=Min('due_back')).values('due_back')
+        ),
+    }
+
+
+def recount_book(book_id):
+    """ Recount the copies of one book. """
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Lock the book first, so the UPDATE reads the copies as committed by
+            # any concurrent recount of the same book it had to wait for.
+            list(Book.objects.select_for_update().filter(pk=book_id).order_by().values_list('pk'))
+        Book.objects.filter(pk=book_id).update(**counter_values())
+
+
+def recount_books_of_copies(copy_ids):
+    """ Recount the books owning the copies `copy_ids`, in one UPDATE. Returns the pks of the books. """
+    books = Book.objects.filter(pk__in=BookInstance.objects.filter(pk__in=copy_ids).values('book'))
+    with transaction.atomic():
+        if connection.features.has_select_for_update:
+            # Lock in id order, so two recounts sharing books cannot deadlock.
+            books = books.select_for_update()
+        book_ids = list(books.order_by('pk').values_list('pk', flat=True))
+        Book.objects.filter(pk__in=book_ids).update(**counter_values())
+    return book_ids
+
+
+def recount_books(queryset=None, batch_size=5000):
+    """ Recount the books in `queryset` (all books by default), in short transactions of `batch_size` pks.
+
+    Returns the number of books updated.
+    """
+    if queryset is None:
+        queryset = Book.objects.all()
+    bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+
+    updated = 0
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        with transaction.atomic():
+            updated += queryset.filter(pk__gte=start, pk__lt=start + batch_size).update(**counter_values())
+    return updated
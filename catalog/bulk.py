@@ -0,0 +1,46 @@
+""" Set-based writes the ORM has no API for. """
+from django.db import connections
+
+
+def _insert_select_sql(model, queryset, columns):
+    aliases = {f'insert_{name}': expression for name, expression in columns.items()}
+    # Annotations are selected in the order they were added, which is the order of `columns`.
+    rows = queryset.order_by().annotate(**aliases).values_list(*aliases)
+    connection = connections[queryset.db]
+    select, params = rows.query.get_compiler(connection=connection).as_sql()
+    names = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in columns)
+    return connection, f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({names}) {select}', params
+
+
+def insert_select(model, queryset, **columns):
+    """ Insert a `model` row for each row of `queryset` with one INSERT ... SELECT.
+
+    `columns` maps the fields of `model` to expressions over `queryset`, e.g.
+    insert_select(OverdueLoan, copies, copy=F('pk'), due_back=F('due_back')).
+    Returns the number of rows inserted.
+    """
+    connection, sql, params = _insert_select_sql(model, queryset, columns)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def add_select(model, queryset, unique, total, **columns):
+    """ insert_select(), but adding to the `total` field of the existing row whose `unique` fields match.
+
+    `unique` must be the fields of a unique constraint of `model`, and no two
+    rows of `queryset` may share them (group on them, e.g. with .values()).
+    Uses INSERT ... ON CONFLICT DO UPDATE, which SQLite and PostgreSQL support.
+    Returns the number of rows inserted or added to.
+    """
+    connection, sql, params = _insert_select_sql(model, queryset, columns)
+    quote = connection.ops.quote_name
+    keys = ', '.join(quote(model._meta.get_field(name).column) for name in unique)
+    column = quote(model._meta.get_field(total).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{sql} ON CONFLICT ({keys}) DO UPDATE SET {column} = '
+            f'{quote(model._meta.db_table)}.{column} + EXCLUDED.{column}',
+            params,
+        )
+        return cursor.rowcount
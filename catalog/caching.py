@@ -0,0 +1,179 @@
+""" Whole-page and template fragment caching for the catalog.
+
+Cached entries are keyed on version numbers kept in the shared cache, and
+each page only on the versions of what it shows. The signal handlers in
+catalog/signals.py bump the catalog version once a change to a book, author,
+genre, language or country commits, and the permissions version whenever a
+user's permissions may have changed. Copies change far more often (every checkout and
+return), so they only bump the availability version, read by the pages that
+show copy counts, and their book's copies version, read by that book's page.
+Old entries are then simply never read again and expire on their own, so edits
+made through the catalog forms or the admin show up on the next request.
+
+ProcessIndex uses the same kind of shared version to keep the in-memory
+indexes of every process (see catalog/autocomplete.py and catalog/fuzzy.py)
+in step with edits made by any of them.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .stats import invalidate_index_stats
+
+CATALOG_VERSION_KEY = 'catalog:version'
+AVAILABILITY_VERSION_KEY = 'catalog:availability-version'
+PERMISSIONS_VERSION_KEY = 'catalog:permissions-version'
+
+
+def copies_version_key(book_id):
+    return f'catalog:copies-version:{book_id}'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # A fresh value (rather than 1) so a lost version never matches entries cached before it was lost.
+        version = time.time_ns()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def get_versions(keys):
+    """ get_version() for each of `keys`, with one cache lookup when they are all set. """
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else get_version(key) for key in keys]
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), None)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def bump_copies_versions(book_ids):
+    """ Expire the cached pages showing copy counts, and those showing the copies of `book_ids`. """
+    version = time.time_ns()
+    keys = [AVAILABILITY_VERSION_KEY, *(copies_version_key(book_id) for book_id in book_ids)]
+    cache.set_many(dict.fromkeys(keys, version), None)
+
+
+def expire_copies_on_commit(book_ids):
+    """ bump_copies_versions() and expire the home page counts once the current transaction commits.
+
+    For changes made with queryset.update(), which sends no signals. Expiring
+    them before the commit would let a concurrent request cache the old rows
+    under the new version, where they would stay until the next change.
+    """
+    book_ids = list(book_ids)
+    transaction.on_commit(invalidate_index_stats)
+    transaction.on_commit(lambda: bump_copies_versions(book_ids))
+
+
+class ProcessIndex:
+    """ An index kept in each process's memory, rebuilt whenever what it covers changes in any process.
+
+    get() returns this process's index, calling `build` to make it from the
+    database when there is none yet, or when the shared version under `key` has
+    changed since it was built. expire_on_commit() writes a fresh version once
+    the current transaction commits, so every process, this one included,
+    rebuilds its index on its next get().
+
+    Edits are not applied to the index in place: the shared version cannot be
+    moved on atomically with every cache backend (FileBasedCache's incr() is a
+    get and a set), so two processes editing at once could each believe their
+    partly updated index current. A rebuild from the database cannot miss a
+    committed change, as the version is only written after the commit.
+    """
+
+    def __init__(self, key, build):
+        self.key = key
+        self.build = build
+        self.current = None  # (version, index), replaced as a whole.
+        self.lock = threading.Lock()
+
+    def get(self):
+        version = get_version(self.key)
+        current = self.current
+        if current is None or current[0] != version:
+            with self.lock:
+                current = self.current
+                if current is None or current[0] != version:
+                    current = self.current = (version, self.build())
+        return current[1]
+
+    def expire_on_commit(self):
+        """ Make every process rebuild its index once the current transaction commits. """
+        transaction.on_commit(self.expire)
+
+    def expire(self):
+        """ Make every process rebuild its index, e.g. after bulk changes that send no signals. """
+        bump_version(self.key)
+
+    def reset(self):
+        """ Forget this process's index. """
+        self.current = None
+
+
+def bump_permissions_version():
+    bump_version(PERMISSIONS_VERSION_KEY)
+
+
+def get_permissions_version():
+    return get_version(PERMISSIONS_VERSION_KEY)
+
+
+def page_cache_key(request, version_keys=(CATALOG_VERSION_KEY,)):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    versions = '.'.join(str(version) for version in get_versions(list(version_keys)))
+    return f'catalog:page:{versions}:{request.method}:{path}'
+
+
+class CachedPageMixin:
+    """ View mixin caching the whole response of anonymous GET requests.
+
+    The timeout comes from CATALOG_PAGE_CACHE_TIMEOUT unless `page_cache_timeout`
+    is set on the view; 0 disables the cache. Pages are keyed on the versions in
+    `page_cache_versions`, the things they show (see get_page_cache_versions()).
+    """
+    page_cache_timeout = None
+    page_cache_versions = (CATALOG_VERSION_KEY,)
+
+    def get_page_cache_versions(self):
+        return self.page_cache_versions
+
+    def get_page_cache_timeout(self):
+        if self.page_cache_timeout is not None:
+            return self.page_cache_timeout
+        return settings.CATALOG_PAGE_CACHE_TIMEOUT
+
+    def dispatch(self, request, *args, **kwargs):
+        timeout = self.get_page_cache_timeout()
+        if not timeout or request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(request, self.get_page_cache_versions())
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().dispatch(request, *args, **kwargs)
+
+        def store(response):
+            # Responses setting cookies are specific to one visitor.
+            if response.status_code == 200 and not response.cookies:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+
+        if hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
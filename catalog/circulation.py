@@ -0,0 +1,182 @@
+""" Checking copies out and in.
+
+Every operation is one conditional UPDATE: it only changes the copy if the
+copy is still in a status the operation applies to (e.g. a checkout needs an
+available copy), and it only writes the columns the operation changes. Two
+librarians acting on the same copy at once therefore cannot overwrite each
+other: the database applies one UPDATE, and the other finds the status has
+moved on and raises CirculationConflict instead of silently winning.
+
+queryset.update() sends no signals, so each operation also recounts the
+copy's book (see catalog/availability.py) and expires the cached pages and
+home page counts itself, once the transaction commits.
+
+batch() applies one action to many copies (a stack scanned at the desk) with
+one IN query to check them and one UPDATE to change them.
+
+Copies that become available (returned, or back from maintenance) are set
+aside for the next reader waiting for the book, in the same transaction (see
+catalog/holds.py).
+
+Every change is also appended to the loan history (see catalog/history.py),
+in the same transaction.
+"""
+import datetime
+
+from django.db import connection, transaction
+
+from .availability import recount_books_of_copies
+from .caching import expire_copies_on_commit
+from .history import record
+from .holds import allocate, rebalance, release
+from .models import BookInstance, Hold
+
+# Default loan period for checkouts.
+LOAN_PERIOD = datetime.timedelta(weeks=3)
+
+STATUS_LABELS = dict(BookInstance.LOAN_STATUS)
+
+# The loan history event each operation records.
+EVENTS = {
+    'check out': 'o',
+    'renew': 'n',
+    'return': 'a',
+    'send to maintenance': 'm',
+    'return from maintenance': 'f',
+}
+
+
+class CirculationConflict(Exception):
+    """ The copy was not in a status the operation applies to (usually because someone else just changed it). """
+
+    def __init__(self, copy_id, action, status):
+        self.copy_id = copy_id
+        self.action = action
+        self.status = status
+        super().__init__(f'Cannot {action} copy {copy_id}: it is {STATUS_LABELS.get(status, status).lower()}.')
+
+
+class BatchConflict(Exception):
+    """ Copies changed between being checked and updated, so the whole batch was rolled back. """
+
+
+def copies_changed(copy_ids):
+    """ Bring the derived data up to date after changing `copy_ids` with queryset.update(). """
+    expire_copies_on_commit(recount_books_of_copies(copy_ids))
+
+
+def transition(copy_id, action, from_statuses, **changes):
+    """ Apply `changes` to the copy if its status is one of `from_statuses`, or raise CirculationConflict. """
+    with transaction.atomic():
+        copy = BookInstance.objects.filter(pk=copy_id, status__in=from_statuses)
+        # Record the event first, while the copy still has the borrower and due date a return clears.
+        recorded = record(
+            EVENTS[action], copy,
+            borrower=changes.get('borrower', changes.get('borrower_id')), due_back=changes.get('due_back'),
+        )
+        if not (recorded and copy.update(**changes)):
+            status = BookInstance.objects.filter(pk=copy_id).values_list('status', flat=True).first()
+            if status is None:
+                raise BookInstance.DoesNotExist(f'No copy with id {copy_id}.')
+            raise CirculationConflict(copy_id, action, status)
+        copies_changed([copy_id])
+
+
+def checkout(copy_id, borrower, due_back=None):
+    """ Lend an available copy to `borrower` until `due_back` (by default, one loan period from today). """
+    if due_back is None:
+        due_back = datetime.date.today() + LOAN_PERIOD
+    transition(copy_id, 'check out', ['a'], status='o', borrower=borrower, due_back=due_back)
+
+
+def return_copy(copy_id):
+    """ Check a copy on loan back in, making it available or reserving it for the next hold on its book. """
+    with transaction.atomic():
+        transition(copy_id, 'return', ['o'], status='a', borrower=None, due_back=None)
+        allocate(copy_id)
+
+
+def renew(copy_id, due_back):
+    """ Move the due date of a copy on loan. """
+    transition(copy_id, 'renew', ['o'], due_back=due_back)
+
+
+def mark_maintenance(copy_id):
+    """ Take an available or reserved copy out of circulation; a hold it was set aside for goes back in the queue. """
+    with transaction.atomic():
+        transition(copy_id, 'send to maintenance', ['a', 'r'], status='m', borrower=None, due_back=None)
+        release(copy_id)
+
+
+def complete_maintenance(copy_id):
+    """ Put a copy back into circulation after maintenance, reserving it for the next hold on its book. """
+    with transaction.atomic():
+        transition(copy_id, 'return from maintenance', ['m'], status='a')
+        allocate(copy_id)
+
+
+def collect_hold(hold_id, due_back=None):
+    """ Lend the copy set aside for a hold to the reader who placed it. """
+    if due_back is None:
+        due_back = datetime.date.today() + LOAN_PERIOD
+    with transaction.atomic():
+        hold = Hold.objects.filter(pk=hold_id, status='r', copy__isnull=False).values('patron_id', 'copy_id').first()
+        if hold is None:
+            raise Hold.DoesNotExist(f'No hold ready for collection with id {hold_id}.')
+        transition(hold['copy_id'], 'check out', ['r'], status='o', borrower_id=hold['patron_id'], due_back=due_back)
+        Hold.objects.filter(pk=hold_id).update(status='f')
+
+
+# What each batch action is called in messages, and the statuses it applies to.
+BATCH_ACTIONS = {
+    'return': ('return', ['o']),
+    'renew': ('renew', ['o']),
+    'checkout': ('check out', ['a']),
+}
+
+
+def batch(action, copy_ids, borrower=None, due_back=None):
+    """ Apply `action` ('return', 'renew' or 'checkout') to many copies in one transaction.
+
+    Returns {copy_id: None if the copy was changed, otherwise why it was not}, in
+    the order given. Renewals need `due_back`; checkouts need `borrower` and
+    default to one loan period. The cached pages and counts are expired once,
+    when the whole batch has committed.
+    """
+    verb, from_statuses = BATCH_ACTIONS[action]
+    if action == 'return':
+        changes = {'status': 'a', 'borrower': None, 'due_back': None}
+    elif action == 'renew':
+        changes = {'due_back': due_back}
+    else:
+        changes = {'status': 'o', 'borrower': borrower, 'due_back': due_back or datetime.date.today() + LOAN_PERIOD}
+
+    copy_ids = list(dict.fromkeys(copy_ids))
+    with transaction.atomic():
+        copies = BookInstance.objects.filter(pk__in=copy_ids).order_by('pk')
+        if connection.features.has_select_for_update:
+            copies = copies.select_for_update()
+        statuses = dict(copies.values_list('pk', 'status'))
+
+        results, eligible = {}, []
+        for copy_id in copy_ids:
+            status = statuses.get(copy_id)
+            if status is None:
+                results[copy_id] = f'No copy with id {copy_id}.'
+            elif status not in from_statuses:
+                results[copy_id] = str(CirculationConflict(copy_id, verb, status))
+            else:
+                results[copy_id] = None
+                eligible.append(copy_id)
+
+        if eligible:
+            copies = BookInstance.objects.filter(pk__in=eligible, status__in=from_statuses)
+            recorded = record(EVENTS[verb], copies, borrower=changes.get('borrower'), due_back=changes.get('due_back'))
+            updated = copies.update(**changes)
+            if not recorded == updated == len(eligible):
+                # Only possible where the copies could not be locked above.
+                raise BatchConflict('Some copies changed while the batch was being processed; nothing was changed.')
+            copies_changed(eligible)
+            if action == 'return':
+                rebalance(BookInstance.objects.filter(pk__in=eligible).values('book'))
+    return results
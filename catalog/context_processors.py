@@ -0,0 +1,12 @@
+from django.conf import settings
+
+from .caching import get_permissions_version
+
+
+def sidebar_cache(request):
+    """ Timeout and version for the per-user sidebar fragment cached in base_generic.html. """
+    return {
+        'sidebar_cache_timeout': settings.CATALOG_FRAGMENT_CACHE_TIMEOUT,
+        # A callable, so the cache is only read when a template actually uses it.
+        'sidebar_cache_version': get_permissions_version,
+    }
@@ -0,0 +1,92 @@
+""" The circulation dashboard, served from precomputed tables.
+
+Every number on the dashboard comes from small tables that refresh() keeps up
+to date, never from grouping BookInstance or LoanEvent rows on the web path:
+
+- loans per day and average loan length come from the whole-library rows of
+  the daily and monthly rollups (catalog/history.py): one indexed range read
+  of at most WINDOW_DAYS and 12 rows;
+- the most borrowed books and genres come from LoanLeader, a ready-made top
+  LEADERS list per dimension.
+
+refresh() first brings the rollups up to date incrementally (only the events
+after the rollup watermark are read), then rebuilds the leader lists from the
+daily rollups of the last WINDOW_DAYS days, so its cost depends on recent
+activity rather than on the size of the catalog or of the history. Run it
+every few minutes with `manage.py refresh_dashboard`.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .history import ROLLUP_WATERMARK, loan_totals, months_ago, roll_up
+from .models import Book, Genre, LoanLeader, LoanRollup, Watermark
+
+DASHBOARD_WATERMARK = 'dashboard'
+
+# The dashboard covers this many days up to today.
+WINDOW_DAYS = 30
+
+# Books and genres listed as the most borrowed.
+LEADERS = 10
+
+
+def refresh(batch_size=10000, today=None):
+    """ Bring the rollups up to date and rebuild the most borrowed lists. Returns the number of new events counted. """
+    counted = roll_up(batch_size=batch_size)
+    since = (today or timezone.localdate()) - datetime.timedelta(days=WINDOW_DAYS - 1)
+
+    leaders = []
+    for dimension, model, field in (('book', Book, 'title'), ('genre', Genre, 'name')):
+        top = list(loan_totals(dimension, 'd', since=since).filter(checkouts__gt=0)[:LEADERS])
+        names = dict(model.objects.filter(pk__in=[row['key'] for row in top]).values_list('pk', field))
+        leaders += [
+            LoanLeader(
+                dimension=dimension, rank=rank, key=row['key'],
+                name=names.get(row['key'], f'Deleted {dimension}'), checkouts=row['checkouts'],
+            )
+            for rank, row in enumerate(top, 1)
+        ]
+
+    position = Watermark.objects.filter(name=ROLLUP_WATERMARK).values_list('position', flat=True).first() or 0
+    with transaction.atomic():
+        LoanLeader.objects.all().delete()
+        LoanLeader.objects.bulk_create(leaders)
+        Watermark.objects.update_or_create(name=DASHBOARD_WATERMARK, defaults={'position': position})
+    return counted
+
+
+def dashboard(today=None):
+    """ Everything the dashboard shows, as template context. Reads four small tables, one query each. """
+    today = today or timezone.localdate()
+    since = today - datetime.timedelta(days=WINDOW_DAYS - 1)
+
+    leaders = defaultdict(list)
+    for leader in LoanLeader.objects.all():
+        leaders[leader.dimension].append(leader)
+
+    library = LoanRollup.objects.filter(dimension='library', key=0)
+    daily = {rollup.start: rollup for rollup in library.filter(period='d', start__gte=since, start__lte=today)}
+    busiest = max([rollup.checkouts for rollup in daily.values()] + [1])
+    days = []
+    for offset in range(WINDOW_DAYS):
+        day = since + datetime.timedelta(days=offset)
+        rollup = daily.get(day) or LoanRollup(period='d', dimension='library', start=day, key=0)
+        days.append({'rollup': rollup, 'percent': round(100 * rollup.checkouts / busiest)})
+
+    months = list(library.filter(period='m', start__gte=months_ago(11, today).date()).order_by('start'))
+    loan_days = sum(month.loan_days for month in months)
+    returns_timed = sum(month.returns_timed for month in months)
+
+    return {
+        'top_books': leaders['book'],
+        'top_genres': leaders['genre'],
+        'days': days,
+        'window_checkouts': sum(rollup.checkouts for rollup in daily.values()),
+        'months': months,
+        'average_loan_days': loan_days / returns_timed if returns_timed else None,
+        'refreshed': Watermark.objects.filter(name=DASHBOARD_WATERMARK).first(),
+        'window_days': WINDOW_DAYS,
+    }
@@ -0,0 +1,134 @@
+""" Faceted browsing of the book list.
+
+Books can be narrowed down by genre, language, author country and whether a
+copy is available. Next to each facet value the sidebar shows how many books
+the list would have if it were picked, given the other filters in use. Each
+facet's counts come from one grouped query (GROUP BY genre, language or
+country) rather than a query per value, and are cached per combination of
+filters. The cache keys include the catalog version (see catalog/caching.py),
+so any edit to the catalog makes the cached counts stale at once. Only the
+"has a copy available" count, and the counts under that filter, also include
+the availability version: the other counts survive checkouts and returns.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .caching import AVAILABILITY_VERSION_KEY, CATALOG_VERSION_KEY, get_versions
+
+# Query string parameter -> the Book field it filters on.
+FACET_FIELDS = {
+    'genre': 'genre',
+    'language': 'language',
+    'country': 'author__country',
+}
+AVAILABLE = 'available'
+
+FACET_LABELS = {'genre': 'Genre', 'language': 'Language', 'country': 'Author country'}
+
+# Most values shown per facet (the most common first).
+FACET_VALUES_SHOWN = 20
+
+
+def parse_filters(params):
+    """ Return the valid facet filters in the query string `params`, e.g. {'genre': 3, 'available': True}. """
+    filters = {}
+    for name in FACET_FIELDS:
+        value = params.get(name, '')
+        if value.isdigit():
+            filters[name] = int(value)
+    if params.get(AVAILABLE) == '1':
+        filters[AVAILABLE] = True
+    return filters
+
+
+def filter_books(queryset, filters, exclude=None):
+    """ Apply `filters` to a Book queryset, leaving out the facet named `exclude`. """
+    for name, field in FACET_FIELDS.items():
+        if name in filters and name != exclude:
+            queryset = queryset.filter(**{field: filters[name]})
+    if filters.get(AVAILABLE) and exclude != AVAILABLE:
+        queryset = queryset.filter(num_available__gt=0)
+    return queryset
+
+
+def compute_facet_counts(queryset, filters):
+    """ Count the books for every facet value, one grouped query per facet. """
+    return {**compute_value_counts(queryset, filters), AVAILABLE: compute_available_count(queryset, filters)}
+
+
+def compute_value_counts(queryset, filters):
+    """ The genre, language and country counts of compute_facet_counts(). """
+    counts = {}
+    for name, field in FACET_FIELDS.items():
+        rows = (
+            filter_books(queryset, filters, exclude=name)
+            .exclude(**{f'{field}__isnull': True})
+            .values_list(field, f'{field}__name')
+            .annotate(count=Count('pk'))
+            .order_by('-count', f'{field}__name')
+        )
+        counts[name] = list(rows[:FACET_VALUES_SHOWN])
+    return counts
+
+
+def compute_available_count(queryset, filters):
+    """ The "has a copy available" count of compute_facet_counts(). """
+    return filter_books(queryset, filters, exclude=AVAILABLE).filter(num_available__gt=0).count()
+
+
+def get_facet_counts(queryset, filters):
+    """ Cached compute_facet_counts(); `queryset` must be the same for the same filters. """
+    catalog, availability = get_versions([CATALOG_VERSION_KEY, AVAILABILITY_VERSION_KEY])
+    combination = ','.join(f'{name}={value}' for name, value in sorted(filters.items()))
+    # The available count leaves out its own filter, so it is shared with and without it.
+    others = ','.join(f'{name}={value}' for name, value in sorted(filters.items()) if name != AVAILABLE)
+    values_key = (
+        f'catalog:facets:{catalog}.{availability}:{combination}' if AVAILABLE in filters
+        else f'catalog:facets:{catalog}:{combination}'
+    )
+    available_key = f'catalog:facets-available:{catalog}.{availability}:{others}'
+
+    cached = cache.get_many([values_key, available_key])
+    missing = {}
+    if values_key not in cached:
+        missing[values_key] = compute_value_counts(queryset, filters)
+    if available_key not in cached:
+        missing[available_key] = compute_available_count(queryset, filters)
+    if missing:
+        cache.set_many(missing, settings.CATALOG_FACET_CACHE_TIMEOUT)
+    cached.update(missing)
+    return {**cached[values_key], AVAILABLE: cached[available_key]}
+
+
+def facet_url(params, name, value):
+    """ Query string for the list with facet `name` set to `value` (or cleared, for None), from the first page. """
+    params = params.copy()
+    for key in (name, 'cursor', 'page'):
+        params.pop(key, None)
+    if value is not None:
+        params[name] = value
+    return f'?{params.urlencode()}'
+
+
+def build_facets(counts, filters, params):
+    """ Arrange the counts for the template, with links for picking and clearing each value. """
+    facets = []
+    for name in FACET_FIELDS:
+        values = [
+            {'name': label, 'count': count, 'selected': filters.get(name) == pk, 'url': facet_url(params, name, pk)}
+            for pk, label, count in counts[name]
+        ]
+        facets.append({
+            'label': FACET_LABELS[name], 'values': values,
+            'clear_url': facet_url(params, name, None) if name in filters else None,
+        })
+    facets.append({
+        'label': 'Availability',
+        'values': [{
+            'name': 'Has a copy available', 'count': counts[AVAILABLE], 'selected': AVAILABLE in filters,
+            'url': facet_url(params, AVAILABLE, '1'),
+        }],
+        'clear_url': facet_url(params, AVAILABLE, None) if AVAILABLE in filters else None,
+    })
+    return facets
@@ -1,5 +1,9 @@
 import datetime
+import re
+import uuid
+
 from django import forms
+from django.contrib.auth import get_user_model
 # from django.forms import ModelForm
 
 from django.core.exceptions import ValidationError
@@ -7,6 +11,17 @@ from django.utils.translation import gettext_lazy as _
 
 from .models import BookInstance
 
+def validate_due_back(data):
+    """ Due dates must be between today and 4 weeks ahead. """
+    # Check if a date is not in the past.
+    if data < datetime.date.today():
+        raise ValidationError(_('Invalid date - Due date cannot be in the past'))
+
+    # Check if a date is in the allowed range (+4 weeks from today).
+    if data > datetime.date.today() + datetime.timedelta(weeks=4):
+        raise ValidationError(_('Invalid date - New due date cannot be more than 4 weeks ahead'))
+
+
 class RenewBookModelForm(forms.ModelForm):
 
     def clean_due_back(self):
@@ -20,13 +35,7 @@ class RenewBookModelForm(forms.ModelForm):
         if data is None:
             raise ValidationError(_('This field cannot be empty.'))
 
-        # Check if a date is not in the past.
-        if data < datetime.date.today():
-            raise ValidationError(_('Invalid date - Due date cannot be in the past'))
-        
-        # Check if a date is in the allowed range (+4 weeks from today).
-        if data > datetime.date.today() + datetime.timedelta(weeks=4):
-            raise ValidationError(_('Invalid date - New due date cannot be more than 4 weeks ahead'))
+        validate_due_back(data)
 
         # Remember to always return the cleaned data.
         return data
@@ -56,3 +65,54 @@ class RenewBookForm(forms.Form):
         # Remember to always return the cleaned date
         return data
 
+
+class BatchCirculationForm(forms.Form):
+    """ Return, renew or check out a stack of scanned copies at once. """
+    MAX_COPIES = 200
+
+    action = forms.ChoiceField(choices=(('return', 'Return'), ('renew', 'Renew'), ('checkout', 'Check out')))
+    copies = forms.CharField(
+        widget=forms.Textarea(attrs={'rows': 10}),
+        help_text=f'Scan or paste up to {MAX_COPIES} copy ids, one per line.',
+    )
+    due_back = forms.DateField(
+        required=False, help_text='For renewals and checkouts: a date between now and 4 weeks (checkouts default to 3).',
+    )
+    borrower = forms.CharField(required=False, help_text='For checkouts: the username of the borrower.')
+
+    def clean_copies(self):
+        ids, invalid = [], []
+        for token in re.split(r'[\s,]+', self.cleaned_data['copies'].strip()):
+            try:
+                ids.append(uuid.UUID(token))
+            except ValueError:
+                invalid.append(token)
+        if invalid:
+            raise ValidationError(_('Not copy ids: %(ids)s'), params={'ids': ', '.join(invalid[:10])})
+        if len(ids) > self.MAX_COPIES:
+            raise ValidationError(_('At most %(max)d copies can be processed at once.'), params={'max': self.MAX_COPIES})
+        return ids
+
+    def clean_due_back(self):
+        data = self.cleaned_data.get('due_back')
+        if data is not None:
+            validate_due_back(data)
+        return data
+
+    def clean_borrower(self):
+        username = self.cleaned_data.get('borrower', '').strip()
+        if not username:
+            return None
+        try:
+            return get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise ValidationError(_('No user with this username.'))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        action = cleaned_data.get('action')
+        if action == 'renew' and 'due_back' not in self.errors and cleaned_data.get('due_back') is None:
+            self.add_error('due_back', _('This field cannot be empty.'))
+        if action == 'checkout' and 'borrower' not in self.errors and cleaned_data.get('borrower') is None:
+            self.add_error('borrower', _('Enter the borrower to check the copies out to.'))
+        return cleaned_data
@@ -0,0 +1,192 @@
+""" Typo tolerant book title matching.
+
+Titles are split into trigrams (three letter pieces of each word, padded with
+spaces the way PostgreSQL's pg_trgm does it) and kept in an in-memory inverted
+index: trigram -> the titles containing it. A misspelled query still shares
+most of its trigrams with the title it was meant to be, so counting shared
+trigrams over the query's posting lists finds a handful of candidates quickly,
+which are then re-ranked by edit distance.
+
+Like the autocomplete index (catalog/autocomplete.py), the index is built from
+the database on first use, local to each process, and rebuilt in every process
+once a change to a book commits. Books sharing a title are stored once per title.
+
+Re-ranking costs time proportional to the query's length times each
+candidate's, so queries are cut to MAX_QUERY_LENGTH characters.
+"""
+import heapq
+import threading
+from array import array
+from collections import Counter
+
+from django.conf import settings
+
+from .autocomplete import normalize
+from .caching import ProcessIndex
+from .models import Book
+
+TITLES_VERSION_KEY = 'catalog:titles-version'
+
+# Longer queries are cut short; no title is found by its first hundred characters alone anyway.
+MAX_QUERY_LENGTH = 100
+
+# How many of the titles most similar to the query are re-ranked by edit distance.
+CANDIDATES = 50
+
+# Trigrams found in more than this share of the titles (like "the") do little to narrow down the
+# candidates but cost the most to count, so they are skipped when the query has enough rarer ones.
+COMMON_TRIGRAM_SHARE = 0.05
+
+
+def trigrams(text):
+    """ Return the set of trigrams of the words in `text` (which should already be normalized). """
+    grams = set()
+    for word in text.split():
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """ Share of trigrams two trigram sets have in common (0 to 1), as pg_trgm's similarity(). """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def edit_distance(a, b):
+    """ Levenshtein distance between two strings. """
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.titles = []    # title id -> normalized title, or None once no book has it.
+        self.books = []     # title id -> list of book pks with that title.
+        self.sizes = array('H')  # title id -> number of trigrams in the title.
+        self.title_ids = {}  # normalized title -> title id.
+        self.book_titles = {}  # book pk -> title id.
+        self.postings = {}  # trigram -> array of title ids, in the order they were added.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.title_ids)
+
+    def add(self, pk, title):
+        with self.lock:
+            self._remove(pk)
+            key = normalize(title)
+            title_id = self.title_ids.get(key)
+            if title_id is None:
+                title_id = self.title_ids[key] = len(self.titles)
+                self.titles.append(key)
+                self.books.append([])
+                grams = trigrams(key)
+                self.sizes.append(min(len(grams), 65535))
+                for gram in grams:
+                    self.postings.setdefault(gram, array('I')).append(title_id)
+            self.books[title_id].append(pk)
+            self.book_titles[pk] = title_id
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        title_id = self.book_titles.pop(pk, None)
+        if title_id is None:
+            return
+        self.books[title_id].remove(pk)
+        if not self.books[title_id]:
+            # Leave the title's postings in place (removing ids from arrays is slow); lookups skip it.
+            del self.title_ids[self.titles[title_id]]
+            self.titles[title_id] = None
+
+    def search(self, query, limit=10):
+        """ Return the pks of books whose titles best match `query`, best first. """
+        query = normalize(query[:MAX_QUERY_LENGTH])
+        query_grams = trigrams(query)
+        with self.lock:
+            return self._search(query, query_grams, limit)
+
+    def _search(self, query, query_grams, limit):
+        postings = sorted((self.postings[gram] for gram in query_grams if gram in self.postings), key=len)
+        if not postings:
+            return []
+
+        # Count shared trigrams using only the rarer posting lists, as long as they are at
+        # least half of the query's trigrams (otherwise they cannot rank the candidates).
+        common = max(COMMON_TRIGRAM_SHARE * len(self.title_ids), 1000)
+        rare = [posting for posting in postings if len(posting) <= common]
+        counts = Counter()
+        for posting in rare if len(rare) * 2 >= len(postings) else postings:
+            counts.update(posting)
+
+        # Shortlist the titles with the highest similarity (shared trigrams over all trigrams of both).
+        size, sizes = len(query_grams), self.sizes
+        candidates = heapq.nlargest(
+            CANDIDATES, counts.items(), key=lambda item: item[1] / (size + sizes[item[0]] - item[1]),
+        )
+
+        min_similarity = settings.CATALOG_FUZZY_MIN_SIMILARITY
+        ranked = []
+        for title_id, shared in candidates:
+            title = self.titles[title_id]
+            if title is None:
+                continue
+            score = similarity(query_grams, trigrams(title))
+            if score >= min_similarity:
+                ranked.append((edit_distance(query, title), -score, title, title_id))
+        ranked.sort()
+
+        pks = []
+        for distance, score, title, title_id in ranked:
+            pks.extend(self.books[title_id])
+            if len(pks) >= limit:
+                break
+        return pks[:limit]
+
+
+def build_index():
+    index = TrigramIndex()
+    for pk, title in Book.objects.values_list('pk', 'title').iterator(chunk_size=5000):
+        index.add(pk, title)
+    return index
+
+
+_index = ProcessIndex(TITLES_VERSION_KEY, build_index)
+
+
+def get_index():
+    """ Return this process's index, (re)building it when missing or out of date. """
+    return _index.get()
+
+
+def reset_index():
+    """ Forget this process's index so the next search rebuilds it from the database. """
+    _index.reset()
+
+
+def expire_index():
+    """ Make every process rebuild its index on its next search. """
+    _index.expire()
+
+
+def expire_index_on_commit():
+    """ expire_index() once the current transaction commits. """
+    _index.expire_on_commit()
+
+
+def fuzzy_search(query, limit=10):
+    """ Return up to `limit` books with titles close to `query`, best match first. """
+    pks = get_index().search(query, limit)
+    books = Book.objects.select_related('author').order_by().in_bulk(pks)
+    return [books[pk] for pk in pks if pk in books]
@@ -0,0 +1,211 @@
+""" Loan history: an append-only log of circulation events, its rollups and its archive.
+
+BookInstance only holds the current borrower and due date, so every change made
+by catalog/circulation.py and catalog/holds.py is also appended to LoanEvent,
+with the copy's book, borrower and due date at the time. Events are written
+with INSERT ... SELECT from the copies being changed, so recording costs one
+statement however many copies change. Changes made outside those modules
+(e.g. editing a copy in the admin) are not recorded.
+
+roll_up() adds new events to LoanRollup, which counts checkouts, renewals,
+returns and days on loan per book, genre and language, and for the whole
+library, for every day and month. It works through the events after a
+watermark, so each run only reads what was added since the last one, and the
+watermark moves in the same transaction as the counts, so no event is counted
+twice. Reports (loan_totals(), catalog/dashboard.py) read the rollups rather
+than scanning the events.
+
+archive() moves events older than a cutoff, which have been rolled up and do
+not belong to a loan that is still open, to the compact LoanEventArchive table
+in short batches, so the live table stays small.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import (
+    Count, DateField, DateTimeField, Exists, F, IntegerField, Max, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .bulk import insert_select
+from .models import Book, BookInstance, LoanEvent, LoanEventArchive, LoanRollup, Watermark
+
+ROLLUP_WATERMARK = 'loan-rollups'
+# How far catalog/recommendations.py has read the checkouts.
+READERS_WATERMARK = 'book-readers'
+
+# Events counted by the rollups -> the counter they add to.
+COUNTED = {'o': 'checkouts', 'n': 'renewals', 'a': 'returns'}
+
+# Only events at least this old are rolled up, so an event whose transaction
+# commits after a later event's (and so gets a lower id) is never skipped.
+SETTLE_TIME = datetime.timedelta(minutes=1)
+
+
+def record(action, copies, borrower=None, due_back=None):
+    """ Append an `action` event for each copy in the BookInstance queryset `copies`.
+
+    The events get the copies' current borrower and due date unless `borrower`
+    or `due_back` are given, so call this before changing the copies. Returns the
+    number of events recorded.
+    """
+    borrower = getattr(borrower, 'pk', borrower)
+    return insert_select(
+        LoanEvent, copies,
+        copy=F('pk'),
+        book=F('book'),
+        borrower=F('borrower') if borrower is None else Value(borrower, output_field=IntegerField()),
+        due_back=F('due_back') if due_back is None else Value(due_back, output_field=DateField()),
+        action=Value(action),
+        occurred=Value(timezone.now(), output_field=DateTimeField()),
+    )
+
+
+def roll_up(batch_size=10000):
+    """ Add the events recorded since the last run to the rollups, `batch_size` event ids per transaction.
+
+    Returns the number of events counted.
+    """
+    last = LoanEvent.objects.filter(occurred__lt=timezone.now() - SETTLE_TIME).aggregate(last=Max('pk'))['last']
+    counted = 0
+    while last is not None:
+        with transaction.atomic():
+            watermark, created = Watermark.objects.select_for_update().get_or_create(name=ROLLUP_WATERMARK)
+            if watermark.position >= last:
+                break
+            upper = min(watermark.position + batch_size, last)
+            events = (
+                LoanEvent.objects
+                .filter(pk__gt=watermark.position, pk__lte=upper, action__in=COUNTED)
+                .annotate(day=TruncDate('occurred'))
+                .order_by()
+            )
+            rows = [
+                (day, book_id, language_id, COUNTED[action], count)
+                for day, book_id, language_id, action, count in
+                events.values_list('day', 'book', 'book__language', 'action').annotate(count=Count('pk'))
+            ]
+            counted += sum(row[-1] for row in rows)
+            add_to_rollups(rows + loan_lengths(events))
+            watermark.position = upper
+            watermark.save()
+    return counted
+
+
+def loan_lengths(events):
+    """ (day, book id, language id, counter, amount) rows adding the length of each loan returned in `events`. """
+    checkout = (
+        LoanEvent.objects
+        .filter(copy=OuterRef('copy'), borrower=OuterRef('borrower'), action='o', pk__lt=OuterRef('pk'))
+        .order_by('-pk')
+        .values('occurred')[:1]
+    )
+    rows = []
+    for day, book_id, language_id, returned, loaned in (
+        events.filter(action='a').annotate(loaned=Subquery(checkout))
+        .values_list('day', 'book', 'book__language', 'occurred', 'loaned')
+    ):
+        if loaned is not None:
+            days = (timezone.localdate(returned) - timezone.localdate(loaned)).days
+            rows += [(day, book_id, language_id, 'loan_days', days), (day, book_id, language_id, 'returns_timed', 1)]
+    return rows
+
+
+def add_to_rollups(rows):
+    """ Add (day, book id, language id, counter, amount) rows to the daily and monthly rollups. """
+    genres = defaultdict(list)
+    for book_id, genre_id in Book.genre.through.objects.filter(
+        book_id__in={row[1] for row in rows},
+    ).values_list('book_id', 'genre_id'):
+        genres[book_id].append(genre_id)
+
+    # (period, dimension) -> {(start, key): Counter of the amounts to add to each counter}
+    changes = defaultdict(lambda: defaultdict(Counter))
+    for day, book_id, language_id, counter, amount in rows:
+        keys = [('library', 0), ('book', book_id), ('language', language_id)]
+        keys += [('genre', genre_id) for genre_id in genres[book_id]]
+        for period, start in (('d', day), ('m', day.replace(day=1))):
+            for dimension, key in keys:
+                if key is not None:
+                    changes[period, dimension][start, key][counter] += amount
+
+    for (period, dimension), groups in changes.items():
+        existing = {
+            (rollup.start, rollup.key): rollup
+            for rollup in LoanRollup.objects.filter(
+                period=period, dimension=dimension,
+                start__in={start for start, key in groups}, key__in={key for start, key in groups},
+            )
+        }
+        rollups, replaced = [], []
+        for (start, key), amounts in groups.items():
+            rollup = existing.get((start, key))
+            if rollup is None:
+                rollup = LoanRollup(period=period, dimension=dimension, start=start, key=key)
+            else:
+                replaced.append(rollup.pk)
+            for counter, amount in amounts.items():
+                setattr(rollup, counter, getattr(rollup, counter) + amount)
+            rollups.append(rollup)
+        # Rows that change are replaced rather than updated: a DELETE and an
+        # INSERT per chunk cost far less than bulk_update()'s CASE per row.
+        # Nothing refers to rollups by id, and the watermark's lock keeps
+        # other runs out meanwhile.
+        for start in range(0, len(replaced), 500):
+            LoanRollup.objects.filter(pk__in=replaced[start:start + 500]).delete()
+        for rollup in rollups:
+            rollup.pk = None
+        LoanRollup.objects.bulk_create(rollups, batch_size=500)
+
+
+def loan_totals(dimension, period='m', since=None, until=None):
+    """ Checkouts, renewals and returns per book, genre or language from the rollups, busiest first.
+
+    Covers the days or months starting from `since` up to and including `until`.
+    """
+    rollups = LoanRollup.objects.filter(period=period, dimension=dimension)
+    if since is not None:
+        rollups = rollups.filter(start__gte=since)
+    if until is not None:
+        rollups = rollups.filter(start__lte=until)
+    return (
+        rollups.values('key')
+        .annotate(checkouts=Sum('checkouts'), renewals=Sum('renewals'), returns=Sum('returns'))
+        .order_by('-checkouts', 'key')
+    )
+
+
+def months_ago(months, today=None):
+    """ The start of the month `months` months before this one, as an aware datetime. """
+    today = today or timezone.localdate()
+    month = today.year * 12 + today.month - 1 - months
+    return timezone.make_aware(datetime.datetime(month // 12, month % 12 + 1, 1))
+
+
+def archive(before, batch_size=5000):
+    """ Move closed events that happened before `before` to LoanEventArchive, `batch_size` per transaction.
+
+    Events that have not been rolled up yet (or read by the recommendations,
+    once they are in use), or belong to a loan still open (the copy is on loan
+    to the same borrower), stay. Returns the number moved.
+    """
+    positions = dict(
+        Watermark.objects.filter(name__in=[ROLLUP_WATERMARK, READERS_WATERMARK]).values_list('name', 'position')
+    )
+    position = min(positions.values()) if ROLLUP_WATERMARK in positions else 0
+    open_loans = BookInstance.objects.filter(pk=OuterRef('copy'), status__exact='o', borrower=OuterRef('borrower'))
+    closed = LoanEvent.objects.filter(occurred__lt=before, pk__lte=position).exclude(Exists(open_loans))
+
+    moved = 0
+    while ids := list(closed.order_by('pk').values_list('pk', flat=True)[:batch_size]):
+        with transaction.atomic():
+            events = LoanEvent.objects.filter(pk__in=ids)
+            insert_select(
+                LoanEventArchive, events,
+                id=F('pk'), copy_id=F('copy'), book_id=F('book'), borrower_id=F('borrower'),
+                action=F('action'), day=TruncDate('occurred'),
+            )
+            moved += events.delete()[0]
+    return moved
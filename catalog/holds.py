@@ -0,0 +1,204 @@
+""" Hold queues: setting returned copies aside for the readers waiting for them.
+
+Each book has a first come, first served queue of waiting holds. Whenever a
+copy becomes available (it is returned, or comes back from maintenance) it is
+reserved for the oldest waiting hold on its book in the same transaction,
+before anyone else can check it out. The oldest hold is found with the partial
+index hold_queue_idx (book, placed, id) over waiting holds only, so it is one
+index probe however many holds are open on other books, or have been
+collected and cancelled.
+
+rebalance() does the same for many books at once, e.g. after a batch return:
+it pairs every available copy with the oldest waiting holds on its book using
+a handful of set-based queries per batch of books.
+
+Every change to a book's queue or to its available copies locks the book's
+row first (as the recounts in catalog/availability.py do), so allocations of
+the same book never interleave. Reserving and releasing copies is recorded in
+the loan history (see catalog/history.py).
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .availability import counter_values
+from .caching import expire_copies_on_commit
+from .history import record
+from .models import Book, BookInstance, Hold
+
+# Most holds given their copy by one UPDATE in rebalance().
+CASE_SIZE = 100
+
+
+def lock_books(book_ids):
+    """ Lock the rows of `book_ids`, in id order so two lockers sharing books cannot deadlock. """
+    if connection.features.has_select_for_update:
+        list(Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk').values_list('pk'))
+
+
+def queue(book_id):
+    """ The waiting holds on a book, oldest first. """
+    return Hold.objects.filter(book_id=book_id, status='w').order_by('placed', 'id')
+
+
+def reserve(copy_id, hold_id, book_id):
+    """ Set an available copy aside for a hold. Returns False if the copy is no longer available. """
+    copy = BookInstance.objects.filter(pk=copy_id, status='a')
+    if not record('r', copy):
+        return False
+    copy.update(status='r')
+    Hold.objects.filter(pk=hold_id).update(status='r', copy=copy_id, allocated=timezone.now())
+    Book.objects.filter(pk=book_id).update(**counter_values())
+    return True
+
+
+def allocate(copy_id):
+    """ Reserve a copy that has just become available for the oldest waiting hold on its book.
+
+    Returns the hold's id, or None if the copy is not available or nobody is waiting for it.
+    """
+    with transaction.atomic():
+        book_id = BookInstance.objects.filter(pk=copy_id, status='a').values_list('book_id', flat=True).first()
+        if book_id is None:
+            return None
+        lock_books([book_id])
+        hold_id = queue(book_id).values_list('pk', flat=True).first()
+        if hold_id is None or not reserve(copy_id, hold_id, book_id):
+            return None
+    return hold_id
+
+
+def release(copy_id):
+    """ Put the hold a copy was set aside for back in its queue, e.g. as the copy goes to maintenance.
+
+    The hold keeps its place (the time it was placed), so it is first in line
+    again, and is given another available copy of the book if there is one.
+    Returns the hold's id, or None if no hold had the copy.
+    """
+    with transaction.atomic():
+        hold = Hold.objects.filter(copy_id=copy_id, status='r').values_list('pk', 'book_id').first()
+        if hold is None:
+            return None
+        hold_id, book_id = hold
+        lock_books([book_id])
+        Hold.objects.filter(pk=hold_id, status='r').update(status='w', copy=None, allocated=None)
+        _rebalance_books([book_id])
+    return hold_id
+
+
+def place_hold(book_id, patron):
+    """ Join the queue for a book, or return the reader's open hold on it if they have one.
+
+    If a copy is available (so nobody else is waiting) it is reserved straight away.
+    """
+    with transaction.atomic():
+        lock_books([book_id])
+        try:
+            with transaction.atomic():
+                hold = Hold.objects.create(book_id=book_id, patron=patron)
+        except IntegrityError:
+            return Hold.objects.get(book_id=book_id, patron=patron, status__in=['w', 'r'])
+        copy_id = BookInstance.objects.filter(book_id=book_id, status='a').values_list('pk', flat=True).first()
+        if copy_id is None or allocate(copy_id) is None:
+            return hold
+    hold.refresh_from_db()
+    expire_copies_on_commit([book_id])
+    return hold
+
+
+def cancel_hold(hold_id):
+    """ Leave the queue. A copy already set aside for the hold goes to the next reader waiting, if any. """
+    with transaction.atomic():
+        book_id = Hold.objects.filter(pk=hold_id).values_list('book_id', flat=True).first()
+        if book_id is None:
+            raise Hold.DoesNotExist(f'No hold with id {hold_id}.')
+        lock_books([book_id])
+        status, copy_id = Hold.objects.filter(pk=hold_id).values_list('status', 'copy_id').get()
+        if status not in ('w', 'r'):
+            return
+        Hold.objects.filter(pk=hold_id).update(status='c')
+        if status == 'w' or copy_id is None:
+            return
+        copy = BookInstance.objects.filter(pk=copy_id, status='r')
+        record('c', copy)
+        copy.update(status='a')
+        Book.objects.filter(pk=book_id).update(**counter_values())
+        allocate(copy_id)
+    expire_copies_on_commit([book_id])
+
+
+def rebalance(book_ids=None, batch_size=500):
+    """ Reserve available copies for the oldest waiting holds on every book that has both.
+
+    Only looks at `book_ids` if given. Works through the books in transactions
+    of `batch_size` books, and returns the number of holds given a copy.
+    """
+    if book_ids is None:
+        # Holds left ready for collection without a copy (their copy was deleted before
+        # Hold.copy requeued them) go back in their queues first.
+        Hold.objects.filter(status='r', copy__isnull=True).update(status='w', allocated=None)
+    books = Book.objects.filter(
+        Exists(Hold.objects.filter(book=OuterRef('pk'), status='w')),
+        Exists(BookInstance.objects.filter(book=OuterRef('pk'), status='a')),
+    )
+    if book_ids is not None:
+        books = books.filter(pk__in=book_ids)
+    candidates = list(books.order_by('pk').values_list('pk', flat=True))
+
+    allocated, changed = 0, []
+    for start in range(0, len(candidates), batch_size):
+        books = candidates[start:start + batch_size]
+        if count := _rebalance_books(books):
+            allocated += count
+            changed.extend(books)
+    if allocated:
+        # queryset.update() sends no signals.
+        expire_copies_on_commit(changed)
+    return allocated
+
+
+def _rebalance_books(book_ids):
+    with transaction.atomic():
+        lock_books(book_ids)
+        copies = defaultdict(list)
+        for book_id, copy_id in (
+            BookInstance.objects.filter(book_id__in=book_ids, status='a').order_by('book_id', 'pk')
+            .values_list('book_id', 'pk')
+        ):
+            copies[book_id].append(copy_id)
+        if not copies:
+            return 0
+
+        # The oldest waiting holds on each book, as many as the book with the most copies available needs.
+        holds = (
+            Hold.objects.filter(book_id__in=list(copies), status='w')
+            .annotate(position=Window(RowNumber(), partition_by=F('book_id'), order_by=[F('placed'), F('id')]))
+            .filter(position__lte=max(len(book_copies) for book_copies in copies.values()))
+            .values_list('book_id', 'position', 'pk')
+        )
+        pairs = {
+            hold_id: copies[book_id][position - 1]
+            for book_id, position, hold_id in holds if position <= len(copies[book_id])
+        }
+        if not pairs:
+            return 0
+
+        reserved = BookInstance.objects.filter(pk__in=pairs.values(), status='a')
+        record('r', reserved)
+        reserved.update(status='r')
+        # Each hold gets its own copy through a CASE; keep them short, as they are matched row by row.
+        now, pairs = timezone.now(), list(pairs.items())
+        for start in range(0, len(pairs), CASE_SIZE):
+            group = dict(pairs[start:start + CASE_SIZE])
+            Hold.objects.filter(pk__in=list(group)).update(
+                status='r', allocated=now,
+                copy=Case(
+                    *[When(pk=hold_id, then=Value(copy_id)) for hold_id, copy_id in group.items()],
+                    output_field=BookInstance._meta.pk,
+                ),
+            )
+        Book.objects.filter(pk__in=list(copies)).update(**counter_values())
+    return len(pairs)
@@ -0,0 +1,36 @@
+# Move old, closed loan history to the compact archive table.
+#
+# Usage: python manage.py archive_loan_history [--months 12] [--batch-size 5000]
+#
+# Brings the rollups up to date first, then moves every event from before the
+# start of the month --months months ago that does not belong to a loan still
+# open, one short transaction per batch (see catalog/history.py). Reports keep
+# working from the rollups, which are never archived.
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.history import archive, months_ago, roll_up
+
+
+class Command(BaseCommand):
+    help = 'Move loan history older than --months months to the archive table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=12, help='Months of history to keep in the live table')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Events moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['months'] < 0:
+            raise CommandError('--months cannot be negative.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        start = time.perf_counter()
+        roll_up()
+        before = months_ago(options['months'])
+        moved = archive(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} events from before {before:%Y-%m-%d} in {time.perf_counter() - start:.2f}s.'
+        ))
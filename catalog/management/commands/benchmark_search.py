@@ -0,0 +1,78 @@
+# Compare fuzzy title matching with a plain icontains scan on misspelled titles.
+#
+# Usage: python manage.py benchmark_search [--queries 200] [--typos 1] [--seed 1]
+#
+# Picks random book titles from the database, misspells each one (dropping,
+# doubling, swapping or replacing letters), then looks the misspelling up with
+# Book.objects.filter(title__icontains=...), the full-text search and the fuzzy
+# trigram index. For each it reports latency percentiles and how often the
+# intended title came back. Fill the database first, e.g. with seed_library.
+
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog import fuzzy
+from catalog.management.commands.benchmark_views import percentile
+from catalog.models import Book
+from catalog.search import SearchResults
+
+
+def misspell(title, typos, rng):
+    for typo in range(typos):
+        position = rng.randrange(len(title))
+        kind = rng.choice(['drop', 'double', 'swap', 'replace'])
+        if kind == 'drop' and len(title) > 1:
+            title = title[:position] + title[position + 1:]
+        elif kind == 'double':
+            title = title[:position] + title[position] + title[position:]
+        elif kind == 'swap' and position < len(title) - 1:
+            title = title[:position] + title[position + 1] + title[position] + title[position + 2:]
+        else:
+            title = title[:position] + rng.choice(string.ascii_lowercase) + title[position + 1:]
+    return title
+
+
+class Command(BaseCommand):
+    help = 'Benchmark fuzzy title matching against an icontains scan on misspelled titles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Misspelled titles to look up')
+        parser.add_argument('--typos', type=int, default=1, help='Typos per title')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable runs')
+
+    def handle(self, *args, **options):
+        if options['queries'] < 1:
+            raise CommandError('--queries must be positive.')
+        pks = list(Book.objects.values_list('pk', flat=True))
+        if not pks:
+            raise CommandError('The database has no books; run seed_library first.')
+
+        rng = random.Random(options['seed'])
+        titles = Book.objects.in_bulk([rng.choice(pks) for query in range(options['queries'])])
+        queries = [(book.title, misspell(book.title, options['typos'], rng)) for book in titles.values()]
+
+        start = time.perf_counter()
+        fuzzy.reset_index()
+        fuzzy.get_index()
+        self.stdout.write(f'Fuzzy index built over {Book.objects.count()} books in {time.perf_counter() - start:.2f}s.')
+
+        methods = {
+            'icontains': lambda query: list(Book.objects.filter(title__icontains=query)[:10]),
+            'full-text': lambda query: SearchResults(query)[:10],
+            'fuzzy': lambda query: fuzzy.fuzzy_search(query),
+        }
+        for name, method in methods.items():
+            timings, found = [], 0
+            for title, query in queries:
+                start = time.perf_counter()
+                books = method(query)
+                timings.append((time.perf_counter() - start) * 1000)
+                found += any(book.title == title for book in books)
+            self.stdout.write(
+                f'{name:<10} p50 {percentile(timings, 50):8.2f}ms  p95 {percentile(timings, 95):8.2f}ms  '
+                f'found {found}/{len(queries)}'
+            )
+        self.stdout.write(self.style.SUCCESS('Done.'))
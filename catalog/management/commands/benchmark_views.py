@@ -0,0 +1,191 @@
+# Benchmark every catalog URL against the current database.
+#
+# Usage: python manage.py benchmark_views [--requests 50] [--cached] [--output bench.json] [--compare previous.json]
+#
+# Fill the database first (e.g. with seed_library) and run collectstatic, since the
+# templates need the static files manifest. Requests go through the Django test client
+# in-process, so no server is needed. For each view the command records latency
+# percentiles, SQL queries per request and peak Python memory (in a separate traced
+# request, so tracing does not skew the timings), and writes the results as JSON.
+# Everything runs in a transaction that is rolled back, so the database is unchanged.
+#
+# The page, fragment, home page count and facet caches are switched off, so the
+# numbers are those of the views themselves; with --cached they stay on and the
+# anonymous pages are timed as cache hits. Compare results taken the same way.
+
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.models import Author, Book, BookInstance
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(values, percent):
+    """ Nearest-rank percentile of a non-empty list. """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Measure latency, queries and memory for every catalog view and write the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Timed requests per view')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per view before timing')
+        parser.add_argument('--output', default='bench_output.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+        parser.add_argument('--view', action='append', help='Only run the named view(s)')
+        parser.add_argument('--cached', action='store_true', help='Leave the page and count caches on')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive.')
+
+        caches = {} if options['cached'] else {
+            'CATALOG_PAGE_CACHE_TIMEOUT': 0,
+            'CATALOG_FRAGMENT_CACHE_TIMEOUT': 0,
+            'CATALOG_INDEX_STATS_TTL': 0,
+            'CATALOG_FACET_CACHE_TIMEOUT': 0,
+        }
+        results = []
+        try:
+            with override_settings(**caches), transaction.atomic():
+                for name, method, client, url, data in self.targets():
+                    if options['view'] and name not in options['view']:
+                        continue
+                    result = self.measure(name, method, client, url, data, options['requests'], options['warmup'])
+                    results.append(result)
+                    self.stdout.write(
+                        f"{name:<26} {result['status']} p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  "
+                        f"p99 {result['p99_ms']:8.2f}ms  {result['queries']:3d} queries  "
+                        f"{result['peak_memory_kb']:8.1f}KB"
+                    )
+                raise Rollback
+        except Rollback:
+            pass
+
+        report = {'meta': {**self.metadata(), 'cached': options['cached']}, 'results': results}
+        with open(options['output'], 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+
+        if options['compare']:
+            self.compare(options['compare'], results, options['cached'])
+
+    def targets(self):
+        """ Yield (name, method, client, url, data) for each view, against sample rows of the database. """
+        book = Book.objects.order_by('pk').first()
+        author = Author.objects.order_by('pk').first()
+        loan = BookInstance.objects.filter(status__exact='o', borrower__isnull=False).order_by('due_back').first()
+        if not (book and author and loan):
+            raise CommandError('The database needs at least one book, author and copy on loan; run seed_library first.')
+
+        # The test client defaults to the 'testserver' host, which ALLOWED_HOSTS does not list.
+        anonymous = Client(SERVER_NAME='127.0.0.1')
+        borrower = Client(SERVER_NAME='127.0.0.1')
+        borrower.force_login(loan.borrower)
+        librarian = Client(SERVER_NAME='127.0.0.1')
+        librarian.force_login(get_user_model().objects.create_superuser('benchmark-librarian', password=None))
+
+        renewal_date = datetime.date.today() + datetime.timedelta(weeks=2)
+        yield 'index', 'get', anonymous, reverse('index'), None
+        yield 'books', 'get', anonymous, reverse('books'), None
+        yield 'book-detail', 'get', anonymous, reverse('book-detail', args=[book.pk]), None
+        yield 'search', 'get', anonymous, reverse('search'), {'q': book.title.split()[0]}
+        yield 'authors', 'get', anonymous, reverse('authors'), None
+        yield 'author-detail', 'get', anonymous, reverse('author-detail', args=[author.pk]), None
+        yield 'my-borrowed', 'get', borrower, reverse('my-borrowed'), None
+        yield 'all-borrowed', 'get', librarian, reverse('all-borrowed'), None
+        yield 'renew-book-librarian', 'get', librarian, reverse('renew-book-librarian', args=[loan.pk]), None
+        yield 'circulation-dashboard', 'get', librarian, reverse('circulation-dashboard'), None
+        yield 'renew-book-librarian-post', 'post', librarian, reverse('renew-book-librarian', args=[loan.pk]), {'due_back': renewal_date}
+        yield 'author-create', 'get', librarian, reverse('author-create'), None
+        yield 'author-update', 'get', librarian, reverse('author-update', args=[author.pk]), None
+        yield 'book-create', 'get', librarian, reverse('book-create'), None
+        yield 'book-update', 'get', librarian, reverse('book-update', args=[book.pk]), None
+
+    def measure(self, name, method, client, url, data, requests, warmup):
+        request = getattr(client, method)
+        for attempt in range(warmup):
+            request(url, data)
+
+        timings, queries = [], []
+        for attempt in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(url, data)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+
+        tracemalloc.start()
+        request(url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'name': name,
+            'method': method.upper(),
+            'url': url,
+            'status': response.status_code,
+            'requests': requests,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def metadata(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'rows': {
+                'books': Book.objects.count(),
+                'authors': Author.objects.count(),
+                'copies': BookInstance.objects.count(),
+            },
+        }
+
+    def compare(self, path, results, cached):
+        with open(path, encoding='utf-8') as stream:
+            report = json.load(stream)
+        previous = {result['name']: result for result in report['results']}
+        self.stdout.write(f'\nCompared with {path}:')
+        if report['meta'].get('cached', True) != cached:
+            self.stdout.write(self.style.WARNING('One run had the caches on and the other off.'))
+        for result in results:
+            before = previous.get(result['name'])
+            if before is None:
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            self.stdout.write(
+                f"{result['name']:<26} p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f}ms ({change:+.0f}%)  "
+                f"queries {before['queries']} -> {result['queries']}"
+            )
@@ -0,0 +1,197 @@
+# Bulk import books, authors and copies from a CSV or JSON Lines file.
+#
+# Usage: python manage.py import_catalog books.csv [--format csv|jsonl] [--batch-size 1000]
+#
+# Each record describes one book:
+#   title, isbn, summary, author_first_name, author_last_name, author_country (ISO alpha-3 code),
+#   language, genre (a list in JSONL, ';' separated in CSV), imprint, copies, status
+#
+# Records are read lazily and written in batches, so memory use depends on the
+# batch size and the number of distinct authors/genres/languages, not on the file size.
+# Books whose ISBN already exists are skipped.
+
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from catalog import autocomplete, fuzzy
+from catalog.caching import bump_catalog_version
+from catalog.models import Author, Book, BookInstance, Country, Genre, Language
+from catalog.stats import invalidate_index_stats
+
+
+def read_records(stream, fmt):
+    """ Yield one dict per record of the input stream. """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            row['genre'] = (row.get('genre') or '').split(';')
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                record = json.loads(line)
+                if isinstance(record.get('genre'), str):
+                    record['genre'] = record['genre'].split(';')
+                yield record
+
+
+def clean_records(records):
+    """ Normalise whitespace and types, dropping records without a title or ISBN. """
+    for record in records:
+        record = {key: value.strip() if isinstance(value, str) else value for key, value in record.items()}
+        if not record.get('title') or not record.get('isbn'):
+            continue
+        record['genre'] = [name.strip() for name in record.get('genre') or [] if name and name.strip()]
+        record['copies'] = int(record.get('copies') or 0)
+        record['status'] = record.get('status') or BookInstance._meta.get_field('status').default
+        if record['status'] not in dict(BookInstance.LOAN_STATUS):
+            raise ValueError(f"unknown copy status {record['status']!r}")
+        yield record
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Import books, authors, genres and copies from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for standard input")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records written per transaction')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        # Small lookup tables are loaded up front; authors are resolved per batch.
+        self.countries = dict(Country.objects.values_list('code', 'pk'))
+        self.genres = dict(Genre.objects.annotate(key=Lower('name')).values_list('key', 'pk'))
+        self.languages = dict(Language.objects.annotate(key=Lower('name')).values_list('key', 'pk'))
+        self.authors = {}
+
+        totals = {'records': 0, 'books': 0, 'copies': 0}
+        start = time.perf_counter()
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            for batch in batched(clean_records(read_records(stream, fmt)), batch_size):
+                with transaction.atomic():
+                    books, copies = self.import_batch(batch)
+                totals['records'] += len(batch)
+                totals['books'] += books
+                totals['copies'] += copies
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{totals['records']} records read...")
+        except (ValueError, KeyError) as e:
+            raise CommandError(f"Bad input after record {totals['records']}: {e}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if totals['records']:
+                # bulk_create() sends no signals, so expire the cached counts, pages and title indexes
+                # here, including when a bad record stops the import after some batches committed.
+                invalidate_index_stats()
+                bump_catalog_version()
+                autocomplete.expire_index()
+                fuzzy.expire_index()
+
+        elapsed = time.perf_counter() - start
+        rate = totals['records'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['books']} books and {totals['copies']} copies from {totals['records']} records "
+            f"in {elapsed:.2f}s ({rate:.0f} rows/s)."
+        ))
+
+    def import_batch(self, batch):
+        """ Write one batch of records; returns (books created, copies created). """
+        self.resolve_names(Genre, self.genres, {name for record in batch for name in record['genre']})
+        self.resolve_names(Language, self.languages, {record['language'] for record in batch if record.get('language')})
+        self.resolve_authors(batch)
+
+        # Skip ISBNs already in the catalog, or repeated within this batch.
+        existing = set(Book.objects.filter(isbn__in=[record['isbn'] for record in batch]).values_list('isbn', flat=True))
+        records = []
+        for record in batch:
+            if record['isbn'] not in existing:
+                existing.add(record['isbn'])
+                records.append(record)
+
+        books = Book.objects.bulk_create([
+            Book(
+                title=record['title'],
+                isbn=record['isbn'],
+                summary=record.get('summary') or '',
+                author_id=self.authors.get(self.author_key(record)),
+                language_id=self.languages.get((record.get('language') or '').lower()),
+                # The copies below are new, so the counts are known without recounting.
+                num_copies=record['copies'],
+                num_available=record['copies'] if record['status'] == 'a' else 0,
+                num_on_loan=record['copies'] if record['status'] == 'o' else 0,
+            )
+            for record in records
+        ])
+
+        Book.genre.through.objects.bulk_create([
+            Book.genre.through(book_id=book.pk, genre_id=genre_id)
+            for book, record in zip(books, records)
+            for genre_id in {self.genres[name.lower()] for name in record['genre']}
+        ])
+
+        copies = BookInstance.objects.bulk_create([
+            BookInstance(book_id=book.pk, imprint=record.get('imprint') or '', status=record['status'])
+            for book, record in zip(books, records)
+            for copy in range(record['copies'])
+        ])
+
+        return len(books), len(copies)
+
+    @staticmethod
+    def author_key(record):
+        if not record.get('author_last_name'):
+            return None
+        return (record.get('author_first_name') or '', record['author_last_name'])
+
+    def resolve_names(self, model, lookup, names):
+        """ Add missing case insensitive names of `model` to `lookup`, creating the rows. """
+        missing = {name.lower(): name for name in names if name.lower() not in lookup}
+        if not missing:
+            return
+        model.objects.bulk_create([model(name=name) for name in missing.values()], ignore_conflicts=True)
+        lookup.update(model.objects.annotate(key=Lower('name')).filter(key__in=missing).values_list('key', 'pk'))
+
+    def resolve_authors(self, batch):
+        """ Map (first name, last name) to an Author id, creating missing authors. """
+        wanted = {}
+        for record in batch:
+            key = self.author_key(record)
+            if key and key not in self.authors:
+                wanted[key] = self.countries.get((record.get('author_country') or '').upper())
+        if not wanted:
+            return
+
+        for pk, first_name, last_name in (
+            Author.objects
+            .filter(last_name__in={last for first, last in wanted}, first_name__in={first for first, last in wanted})
+            .values_list('pk', 'first_name', 'last_name')
+        ):
+            if (first_name, last_name) in wanted:
+                self.authors.setdefault((first_name, last_name), pk)
+
+        created = Author.objects.bulk_create([
+            Author(first_name=first, last_name=last, country_id=country_id)
+            for (first, last), country_id in wanted.items()
+            if (first, last) not in self.authors
+        ])
+        self.authors.update({(author.first_name, author.last_name): author.pk for author in created})
@@ -1,14 +1,14 @@
 # Populate this Django Country model with the full list of ISO 3166-1 alpha-3 country codes and names 
 # listed on: https://en.wikipedia.org/wiki/ISO_3166-1_alpha-3 
+#
+# Usage: python manage.py load_countries
 
-import os
-import django
+import time
 
-# Set up Django environment
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'locallibrary.settings')  # Replace 'myproject' with your project name
-django.setup()
+from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from catalog.models import Country  # Replace 'myapp' with your app name
+from catalog.models import Country
 
 # List of countries with ISO 3166-1 alpha-3 codes
 countries = [
@@ -263,8 +263,44 @@ countries = [
     {"name": "Zimbabwe", "code": "ZWE"}
 ]
 
-# Insert or get countries into the database
-for country in countries:
-    Country.objects.get_or_create(name=country["name"], code=country["code"])
 
-print(f"Totally {len(countries)} country data populated successfully.")
\ No newline at end of file
+class Command(BaseCommand):
+    help = 'Load the ISO 3166-1 alpha-3 country list, adding missing countries and renaming changed ones.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        with transaction.atomic():
+            # The country code is the stable key; read every existing row once.
+            existing = {code: (pk, name) for pk, code, name in Country.objects.values_list('pk', 'code', 'name')}
+
+            to_create = [
+                Country(name=country['name'], code=country['code'])
+                for country in countries
+                if country['code'] not in existing
+            ]
+            to_update = [
+                Country(pk=existing[country['code']][0], name=country['name'], code=country['code'])
+                for country in countries
+                if country['code'] in existing and existing[country['code']][1] != country['name']
+            ]
+            # A new name still used by another code would break the unique constraint and abort the load.
+            taken = {name for pk, name in existing.values()}
+            conflicts = [country for country in to_update if country.name in taken]
+            to_update = [country for country in to_update if country.name not in taken]
+
+            added = 0
+            if to_create:
+                # Rows whose name is already taken (by another code) are skipped, so count what was inserted.
+                Country.objects.bulk_create(to_create, ignore_conflicts=True)
+                added = Country.objects.count() - len(existing)
+            Country.objects.bulk_update(to_update, ['name'])
+
+        skipped = len(to_create) - added + len(conflicts)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(countries)} countries loaded: {added} added, {len(to_update)} renamed, '
+            f'{len(countries) - len(to_create) - len(to_update) - len(conflicts)} unchanged'
+            + (f', {skipped} skipped (name already used by another code)' if skipped else '')
+            + f' in {elapsed:.3f}s.'
+        ))
@@ -0,0 +1,52 @@
+# Delete expired sessions from the database in small batches.
+#
+# Usage: python manage.py purge_sessions [--batch-size 5000] [--pause 0.1]
+#
+# Django's clearsessions runs one DELETE over the whole session table, which can hold
+# its locks for a long time once the table is large. This command deletes expired
+# rows by primary key in short transactions and can pause between batches, so
+# requests reading and writing sessions are never blocked for long.
+
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Delete expired database sessions in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Sessions deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE not in ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db'):
+            raise CommandError(f"Session engine '{settings.SESSION_ENGINE}' does not keep sessions in the database.")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        now = timezone.now()
+        start = time.perf_counter()
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                keys = list(
+                    Session.objects
+                    .filter(expire_date__lt=now)
+                    .values_list('session_key', flat=True)[:options['batch_size']]
+                )
+                if not keys:
+                    break
+                deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{deleted} sessions deleted...')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} expired sessions in {time.perf_counter() - start:.2f}s.'
+        ))
@@ -0,0 +1,30 @@
+# Add the loan history recorded since the last run to the daily and monthly rollups.
+#
+# Usage: python manage.py rollup_loans [--batch-size 10000]
+#
+# Meant to run every few minutes, e.g. from cron. Each run only reads the events
+# after the watermark left by the previous one (see catalog/history.py), so it
+# costs about the same however long the history gets.
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.history import roll_up
+
+
+class Command(BaseCommand):
+    help = 'Count new loan history events into the per book, genre and language rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Event ids handled per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        start = time.perf_counter()
+        counted = roll_up(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {counted} checkouts, renewals and returns in {time.perf_counter() - start:.2f}s.'
+        ))
@@ -0,0 +1,223 @@
+# Fill the catalog with synthetic data for load and scale testing.
+#
+# Usage: python manage.py seed_library --books 100000 --copies-per-book 10 --authors 20000 --users 5000 [--seed 42]
+#
+# The same seed on an empty database always produces the same data. Book popularity
+# follows a Zipf-like curve: popular titles get more copies, and more of those copies
+# are on loan. Loans are due from two weeks ago (overdue) to four weeks from today.
+# Rows are generated lazily and written with batched bulk_create(), so a million
+# copies need neither a million model instances in memory nor a million INSERTs.
+
+import datetime
+import random
+import time
+import uuid
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from catalog.availability import recount_books
+from catalog import autocomplete, fuzzy
+from catalog.caching import bump_catalog_version
+from catalog.models import Author, Book, BookInstance, Country, Genre, Language
+from catalog.stats import invalidate_index_stats
+
+GENRES = [
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Thriller', 'Romance', 'Horror', 'History',
+    'Biography', 'Poetry', 'Philosophy', 'Science', 'Travel', 'Children', 'Cooking', 'Art',
+]
+LANGUAGES = ['English', 'French', 'Spanish', 'German', 'Japanese', 'Chinese', 'Italian', 'Portuguese']
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Grace', 'Jane', 'John', 'Mary', 'Leo', 'Iris', 'Omar', 'Yuki', 'Ana', 'Kofi',
+    'Lena', 'Ivan', 'Mei', 'Raj', 'Sara', 'Tom', 'Zoe', 'Hugo',
+]
+LAST_NAMES = [
+    'Smith', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Tanaka', 'Silva', 'Dubois', 'Khan', 'Muller',
+    'Rossi', 'Kowalski', 'Haddad', 'Larsen', 'Moreau', 'Singh', 'Ivanova', 'Brown', 'Kim', 'Nakamura',
+]
+WORDS = [
+    'the', 'night', 'river', 'garden', 'secret', 'winter', 'empire', 'shadow', 'light', 'house',
+    'last', 'city', 'sea', 'stone', 'silent', 'war', 'journey', 'glass', 'golden', 'memory',
+    'forest', 'star', 'letters', 'storm', 'island', 'fire', 'orchard', 'machine', 'song', 'road',
+]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic library (books, authors, copies, loans, users) for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000, help='Number of books to create')
+        parser.add_argument('--copies-per-book', type=int, default=3, help='Average copies per book')
+        parser.add_argument('--authors', type=int, default=200, help='Number of authors to create')
+        parser.add_argument('--users', type=int, default=50, help='Number of borrowers to create')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        for name in ('books', 'copies_per_book', 'authors', 'users'):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} cannot be negative.")
+        if options['books'] and not options['authors']:
+            raise CommandError('Books need at least one author.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = datetime.date.today()
+        start = time.perf_counter()
+
+        if not Country.objects.exists():
+            call_command('load_countries', stdout=self.stdout)
+
+        genre_ids = self.ensure_names(Genre, GENRES)
+        language_ids = self.ensure_names(Language, LANGUAGES)
+        user_ids = self.create_users(options['users'])
+        author_ids = self.create_authors(options['authors'])
+        book_ids = self.create_books(options['books'], author_ids, language_ids)
+        links = self.link_genres(book_ids, genre_ids)
+        copies = self.create_copies(book_ids, options['copies_per_book'], user_ids)
+        if book_ids:
+            recount_books(Book.objects.filter(pk__gte=min(book_ids)), batch_size=self.batch_size)
+
+        # bulk_create() sends no signals, so expire the cached counts, pages and title indexes here.
+        invalidate_index_stats()
+        bump_catalog_version()
+        autocomplete.expire_index()
+        fuzzy.expire_index()
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(user_ids)} users, {len(author_ids)} authors, {len(book_ids)} books, "
+            f"{links} genre links and {copies} copies in {elapsed:.1f}s."
+        ))
+
+    def bulk_insert(self, model, rows, return_pks=True):
+        """ Insert a generator of unsaved instances in batches.
+
+        Returns the new pks, or just how many rows were inserted if return_pks is False.
+        """
+        pks, total = [], 0
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                created = model.objects.bulk_create(batch)
+            total += len(created)
+            if return_pks:
+                pks.extend(obj.pk for obj in created)
+        return pks if return_pks else total
+
+    def ensure_names(self, model, names):
+        """ Create the missing names (case insensitive) and return the pks in the order of `names`. """
+        model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+        pks = dict(model.objects.annotate(key=Lower('name')).values_list('key', 'pk'))
+        return [pks[name.lower()] for name in names]
+
+    def create_users(self, count):
+        User = get_user_model()
+        offset = User.objects.count()
+        # Hashing is slow on purpose, so every synthetic reader shares one password hash.
+        password = make_password('library-reader')
+        return self.bulk_insert(User, (
+            User(username=f'reader{offset + n}', password=password, email=f'reader{offset + n}@example.com')
+            for n in range(count)
+        ))
+
+    def create_authors(self, count):
+        country_ids = list(Country.objects.order_by('code').values_list('pk', flat=True)) or [None]
+        rng = self.rng
+
+        def authors():
+            for n in range(count):
+                born = datetime.date(1800, 1, 1) + datetime.timedelta(days=rng.randrange(200 * 365))
+                died = born + datetime.timedelta(days=rng.randrange(30 * 365, 95 * 365))
+                yield Author(
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=f'{rng.choice(LAST_NAMES)} {n}',
+                    country_id=rng.choice(country_ids),
+                    date_of_birth=born,
+                    date_of_death=died if died < self.today else None,
+                )
+
+        return self.bulk_insert(Author, authors())
+
+    def create_books(self, count, author_ids, language_ids):
+        offset = Book.objects.count()
+        rng = self.rng
+        # Most books are in the first couple of languages.
+        language_weights = [1 / (rank + 1) ** 2 for rank in range(len(language_ids))]
+
+        def books():
+            for n in range(count):
+                title = ' '.join(rng.choice(WORDS) for word in range(rng.randint(1, 5))).capitalize()
+                yield Book(
+                    title=title,
+                    summary=f'{title}. ' + ' '.join(rng.choice(WORDS) for word in range(rng.randint(10, 40))),
+                    isbn=f'9{offset + n:012d}',
+                    author_id=rng.choice(author_ids),
+                    language_id=rng.choices(language_ids, language_weights)[0],
+                )
+
+        return self.bulk_insert(Book, books())
+
+    def link_genres(self, book_ids, genre_ids):
+        Through = Book.genre.through
+        rng = self.rng
+        genre_weights = [1 / (rank + 1) for rank in range(len(genre_ids))]
+
+        def links():
+            for book_id in book_ids:
+                for genre_id in set(rng.choices(genre_ids, genre_weights, k=rng.randint(1, 3))):
+                    yield Through(book_id=book_id, genre_id=genre_id)
+
+        return self.bulk_insert(Through, links(), return_pks=False)
+
+    def popularity(self, rank):
+        """ Zipf-like popularity of the book at `rank` (0 is the most popular), between 0 and 1. """
+        return 1 / (rank + 1) ** 0.8
+
+    def create_copies(self, book_ids, copies_per_book, user_ids):
+        rng = self.rng
+        if not book_ids or not copies_per_book:
+            return 0
+
+        # Scale the popularity curve so the average number of copies per book is copies_per_book.
+        ranks = list(range(len(book_ids)))
+        rng.shuffle(ranks)
+        scale = copies_per_book * len(book_ids) / sum(self.popularity(rank) for rank in ranks)
+        reader_weights = [1 / (rank + 1) ** 0.5 for rank in range(len(user_ids))]
+
+        def copies():
+            for book_id, rank in zip(book_ids, ranks):
+                popularity = self.popularity(rank)
+                # Popular books spend more of their time on loan.
+                weights = (10, 20 + 60 * popularity, 60 - 40 * popularity, 5 + 5 * popularity)
+                for copy in range(max(1, round(scale * popularity))):
+                    status = rng.choices('moar', weights)[0] if user_ids else rng.choice('ma')
+                    due_back = borrower_id = None
+                    if status == 'o':
+                        due_back = self.today + datetime.timedelta(days=rng.randint(-14, 28))
+                        borrower_id = rng.choices(user_ids, reader_weights)[0]
+                    elif status == 'r':
+                        due_back = self.today + datetime.timedelta(days=rng.randint(1, 7))
+                        borrower_id = rng.choices(user_ids, reader_weights)[0]
+                    yield BookInstance(
+                        id=uuid.UUID(int=rng.getrandbits(128), version=4),
+                        book_id=book_id,
+                        imprint=f'Imprint {rng.randint(1, 50)}, {rng.randint(1950, self.today.year)}',
+                        status=status,
+                        due_back=due_back,
+                        borrower_id=borrower_id,
+                    )
+
+        return self.bulk_insert(BookInstance, copies(), return_pks=False)
@@ -0,0 +1,38 @@
+# Record overdue loans and, optionally, email their borrowers (see catalog/overdue.py).
+#
+# Usage: python manage.py sweep_overdue [--notify] [--chunk-size 500]
+#
+# Meant to run once a day, e.g. from cron. Recording is a single INSERT ... SELECT,
+# and a loan is only ever recorded (and its borrower emailed) once, so running it
+# again the same day does nothing. Renewed loans that become overdue again are
+# recorded again.
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.overdue import notify, sweep
+
+
+class Command(BaseCommand):
+    help = 'Record loans that are past their due date, and email the borrowers with --notify.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notify', action='store_true', help='Email borrowers about newly overdue loans')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Borrowers emailed per batch')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        start = time.perf_counter()
+        recorded = sweep()
+        self.stdout.write(f'Recorded {recorded} overdue loans in {time.perf_counter() - start:.2f}s.')
+
+        if options['notify']:
+            start = time.perf_counter()
+            emailed, marked = notify(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f'Emailed {emailed} borrowers about {marked} overdue loans in {time.perf_counter() - start:.2f}s.'
+            )
+        self.stdout.write(self.style.SUCCESS('Done.'))
@@ -0,0 +1,30 @@
+# Update the "Readers also borrowed" lists on the book pages (see catalog/recommendations.py).
+#
+# Usage: python manage.py update_recommendations [--batch-size 20000]
+#
+# Meant to run nightly, e.g. from cron. Only reads the checkouts recorded since
+# the last run, and only rebuilds the lists of the books they touch; the first
+# run reads the whole loan history, archive included.
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from catalog.recommendations import update
+
+
+class Command(BaseCommand):
+    help = 'Count the readers books have in common and rebuild the "Readers also borrowed" lists.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000, help='New readers paired up per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        start = time.perf_counter()
+        added, rebuilt = update(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {added} readers and rebuilt {rebuilt} lists in {time.perf_counter() - start:.2f}s.'
+        ))
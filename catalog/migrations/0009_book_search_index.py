@@ -0,0 +1,97 @@
+# Full-text search index over book titles, summaries and author names (see catalog/search.py).
+# SQLite gets an FTS5 table, PostgreSQL a tsvector column with a GIN index; both are kept
+# up to date by triggers, so bulk inserts and raw updates are indexed too.
+
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE catalog_book_fts USING fts5(
+        title, summary, author, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER catalog_book_fts_insert AFTER INSERT ON catalog_book BEGIN
+        INSERT INTO catalog_book_fts (rowid, title, summary, author)
+        VALUES (new.id, new.title, new.summary,
+                (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id));
+    END""",
+    """CREATE TRIGGER catalog_book_fts_update AFTER UPDATE OF title, summary, author_id ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+        INSERT INTO catalog_book_fts (rowid, title, summary, author)
+        VALUES (new.id, new.title, new.summary,
+                (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = new.author_id));
+    END""",
+    """CREATE TRIGGER catalog_book_fts_delete AFTER DELETE ON catalog_book BEGIN
+        DELETE FROM catalog_book_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER catalog_author_fts_update AFTER UPDATE OF first_name, last_name ON catalog_author BEGIN
+        UPDATE catalog_book_fts SET author = new.first_name || ' ' || new.last_name
+        WHERE rowid IN (SELECT id FROM catalog_book WHERE author_id = new.id);
+    END""",
+    """INSERT INTO catalog_book_fts (rowid, title, summary, author)
+        SELECT catalog_book.id, title, summary, first_name || ' ' || last_name
+        FROM catalog_book LEFT JOIN catalog_author ON catalog_author.id = catalog_book.author_id""",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER catalog_author_fts_update',
+    'DROP TRIGGER catalog_book_fts_delete',
+    'DROP TRIGGER catalog_book_fts_update',
+    'DROP TRIGGER catalog_book_fts_insert',
+    'DROP TABLE catalog_book_fts',
+]
+
+POSTGRES_FORWARD = [
+    'ALTER TABLE catalog_book ADD COLUMN search_vector tsvector',
+    'CREATE INDEX catalog_book_search_idx ON catalog_book USING GIN (search_vector)',
+    """CREATE FUNCTION catalog_book_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(
+                (SELECT first_name || ' ' || last_name FROM catalog_author WHERE id = NEW.author_id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.summary, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER catalog_book_search_vector BEFORE INSERT OR UPDATE OF title, summary, author_id
+        ON catalog_book FOR EACH ROW EXECUTE FUNCTION catalog_book_search_vector()""",
+    """CREATE FUNCTION catalog_author_search_vector() RETURNS trigger AS $$
+    BEGIN
+        -- Touch the author's books so their trigger rebuilds the vectors.
+        UPDATE catalog_book SET title = title WHERE author_id = NEW.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER catalog_author_search_vector AFTER UPDATE OF first_name, last_name
+        ON catalog_author FOR EACH ROW EXECUTE FUNCTION catalog_author_search_vector()""",
+    'UPDATE catalog_book SET title = title',
+]
+
+POSTGRES_BACKWARD = [
+    'DROP TRIGGER catalog_author_search_vector ON catalog_author',
+    'DROP FUNCTION catalog_author_search_vector()',
+    'DROP TRIGGER catalog_book_search_vector ON catalog_book',
+    'DROP FUNCTION catalog_book_search_vector()',
+    'ALTER TABLE catalog_book DROP COLUMN search_vector',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for statement in statements.get(vendor, []):
+            schema_editor.execute(statement, params=None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_bookinstance_loan_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:40
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+search_index = import_module('catalog.migrations.0009_book_search_index')
+
+# SQLite adds these columns by rebuilding catalog_book, which would lose (or trip over) the
+# search index triggers from 0009, so they are dropped first and created again afterwards.
+SEARCH_TRIGGERS = [sql for sql in search_index.SQLITE_FORWARD if sql.startswith('CREATE TRIGGER')]
+DROP_SEARCH_TRIGGERS = [sql for sql in search_index.SQLITE_BACKWARD if sql.startswith('DROP TRIGGER')]
+
+
+def count_copies(apps, schema_editor):
+    """ Fill in the new counters (the same UPDATE as catalog.availability.recount_books()). """
+    Book = apps.get_model('catalog', 'Book')
+    BookInstance = apps.get_model('catalog', 'BookInstance')
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book')
+
+    def count(**filters):
+        return Coalesce(Subquery(copies.filter(**filters).annotate(count=Count('pk')).values('count')), 0)
+
+    Book.objects.update(
+        num_copies=count(),
+        num_available=count(status__exact='a'),
+        num_on_loan=count(status__exact='o'),
+        next_due_back=Subquery(copies.filter(status__exact='o').annotate(due_back=Min('due_back')).values('due_back')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_book_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            search_index.run({'sqlite': DROP_SEARCH_TRIGGERS}), search_index.run({'sqlite': SEARCH_TRIGGERS}),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='next_due_back',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='next due back'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_available',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='available'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_copies',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='copies'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='num_on_loan',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='on loan'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-num_available', 'title', 'author', 'id'], name='book_available_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookinstance',
+            index=models.Index(fields=['book', 'status', 'due_back'], name='bookinst_book_status_idx'),
+        ),
+        migrations.RunPython(count_copies, migrations.RunPython.noop),
+        migrations.RunPython(
+            search_index.run({'sqlite': SEARCH_TRIGGERS}), search_index.run({'sqlite': DROP_SEARCH_TRIGGERS}),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_book_availability_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('placed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('allocated', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('w', 'Waiting'), ('r', 'Ready for collection'), ('f', 'Collected'), ('c', 'Cancelled')], default='w', max_length=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='catalog.book')),
+                ('copy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='catalog.bookinstance')),
+                ('patron', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['placed', 'id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'w')), fields=['book', 'placed', 'id'], name='hold_queue_idx'), models.Index(fields=['patron', 'status'], name='hold_patron_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['w', 'r'])), fields=('book', 'patron'), name='hold_one_open_per_patron')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:56
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_hold'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueLoan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('due_back', models.DateField()),
+                ('recorded', models.DateField(default=datetime.date.today)),
+                ('notified', models.DateTimeField(blank=True, null=True)),
+                ('borrower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_loans', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overdue_loans', to='catalog.bookinstance')),
+            ],
+            options={
+                'ordering': ['due_back'],
+                'indexes': [models.Index(condition=models.Q(('notified__isnull', True)), fields=['borrower', 'id'], name='overdue_unnotified_idx')],
+                'constraints': [models.UniqueConstraint(fields=('copy', 'borrower', 'due_back'), name='overdue_loan_once')],
+            },
+        ),
+    ]
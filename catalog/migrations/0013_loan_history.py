@@ -0,0 +1,72 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_overdueloan'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanEventArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('copy_id', models.UUIDField()),
+                ('book_id', models.IntegerField(null=True)),
+                ('borrower_id', models.IntegerField(null=True)),
+                ('action', models.CharField(choices=[('o', 'Checked out'), ('n', 'Renewed'), ('a', 'Returned'), ('m', 'Sent to maintenance'), ('f', 'Back from maintenance'), ('r', 'Reserved for a hold'), ('c', 'Released from a hold')], max_length=1)),
+                ('day', models.DateField()),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Watermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LoanRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('d', 'Day'), ('m', 'Month')], max_length=1)),
+                ('start', models.DateField()),
+                ('dimension', models.CharField(choices=[('book', 'Book'), ('genre', 'Genre'), ('language', 'Language')], max_length=8)),
+                ('key', models.PositiveIntegerField()),
+                ('checkouts', models.PositiveIntegerField(default=0)),
+                ('renewals', models.PositiveIntegerField(default=0)),
+                ('returns', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['period', 'dimension', 'start', 'key'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'dimension', 'start', 'key'), name='loanrollup_once')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('o', 'Checked out'), ('n', 'Renewed'), ('a', 'Returned'), ('m', 'Sent to maintenance'), ('f', 'Back from maintenance'), ('r', 'Reserved for a hold'), ('c', 'Released from a hold')], max_length=1)),
+                ('occurred', models.DateTimeField(default=django.utils.timezone.now)),
+                ('due_back', models.DateField(blank=True, null=True)),
+                ('book', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.book')),
+                ('borrower', models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('copy', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='catalog.bookinstance')),
+            ],
+            options={
+                'ordering': ['occurred', 'id'],
+                'indexes': [models.Index(fields=['occurred', 'id'], name='loanevent_occurred_idx'), models.Index(fields=['book', 'occurred'], name='loanevent_book_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_loan_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loanrollup',
+            name='loan_days',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='loanrollup',
+            name='returns_timed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='loanrollup',
+            name='dimension',
+            field=models.CharField(choices=[('book', 'Book'), ('genre', 'Genre'), ('language', 'Language'), ('library', 'Whole library')], max_length=8),
+        ),
+        migrations.CreateModel(
+            name='LoanLeader',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('book', 'Book'), ('genre', 'Genre'), ('language', 'Language'), ('library', 'Whole library')], max_length=8)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('key', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=200)),
+                ('checkouts', models.PositiveIntegerField()),
+            ],
+            options={
+                'ordering': ['dimension', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'rank'), name='loanleader_rank_once')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_loan_dashboard'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlsoBorrowed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('borrowers', models.PositiveIntegerField()),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='also_borrowed', to='catalog.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+            ],
+            options={
+                'ordering': ['book_id', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('book', 'rank'), name='alsoborrowed_rank_once')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookReader',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+                ('borrower', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='readings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('borrower', 'book'), name='bookreader_once')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CoBorrowing',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('borrowers', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.book')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('book', 'other'), name='coborrowing_pair_once')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:29
+
+import catalog.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_also_borrowed'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='hold',
+            name='copy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=catalog.models.requeue_holds, related_name='+', to='catalog.bookinstance'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_hold_copy_requeue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookreader',
+            index=models.Index(fields=['borrower', 'id'], name='bookreader_recent'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 21:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_bookreader_recent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'author', 'id'], name='book_title_idx'),
+        ),
+    ]
@@ -3,9 +3,10 @@ import uuid
 from datetime import date
 from django.db import models
 
-from django.db.models import UniqueConstraint
+from django.db.models import Q, UniqueConstraint
 from django.db.models.functions import Lower
 from django.urls import reverse
+from django.utils import timezone
 
 from django.conf import settings
 # Create your models here.
@@ -23,8 +24,8 @@ class Genre(models.Model):
         return self.name
 
     def get_absolute_url(self):
-        """Returns the URL to access a particular genre instance."""
-        return reverse('genre-detail', args=[str(self.id)])
+        """Returns the URL of the book list filtered to this genre."""
+        return f"{reverse('books')}?genre={self.id}"
 
     class Meta:
         constraints = [
@@ -56,7 +57,7 @@ class Language(models.Model):
         return self.name
     
     def get_absolute_url(self):
-        return reverse("language-detail", args=[str(self.id)])
+        return f"{reverse('books')}?language={self.id}"
     
 
 
@@ -76,8 +77,19 @@ class Book(models.Model):
     genre = models.ManyToManyField('Genre', help_text='Select a genre for this book')
     language = models.ForeignKey('Language', on_delete=models.SET_NULL, null=True)
 
+    # Copy counts, kept up to date from BookInstance changes (see catalog/availability.py).
+    num_copies = models.PositiveIntegerField('copies', default=0, editable=False)
+    num_available = models.PositiveIntegerField('available', default=0, editable=False)
+    num_on_loan = models.PositiveIntegerField('on loan', default=0, editable=False)
+    next_due_back = models.DateField('next due back', null=True, blank=True, editable=False)
+
     class Meta:
         ordering = ['title', 'author']
+        indexes = [
+            # Book list, in its default order and sorted by availability.
+            models.Index(fields=['title', 'author', 'id'], name='book_title_idx'),
+            models.Index(fields=['-num_available', 'title', 'author', 'id'], name='book_available_title_idx'),
+        ]
 
     def display_genre(self):
         return ', '.join([genre.name for genre in self.genre.all()[:3]])
@@ -151,6 +163,20 @@ class BookInstance(models.Model):
     class Meta:
         ordering = ['due_back']
         permissions = (("can_mark_returned", "Set book as returned"), ("can_renew", "Renew the due_back of a book"))
+        indexes = [
+            # Loan queues: all copies on loan, and a borrower's copies on loan, by due date.
+            models.Index(fields=['status', 'due_back', 'id'], name='bookinst_status_due_idx'),
+            models.Index(fields=['borrower', 'status', 'due_back', 'id'], name='bookinst_borrower_due_idx'),
+            # Recounting a book's copies by status.
+            models.Index(fields=['book', 'status', 'due_back'], name='bookinst_book_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the book as loaded, so moving a copy to another book recounts both.
+        instance._loaded_book_id = instance.__dict__.get('book_id')
+        return instance
 
     def display_author(self):
         return f'{self.book.author.first_name} {self.book.author.last_name}' 
@@ -165,6 +191,248 @@ class BookInstance(models.Model):
         """ Determines if the book is overdue based on due date and current date. """
         return bool(self.due_back and date.today() > self.due_back)
 
+
+def requeue_holds(collector, field, sub_objs, using):
+    """ on_delete for Hold.copy: a hold the deleted copy was set aside for goes back to waiting in its queue. """
+    models.SET_NULL(collector, field, sub_objs, using)
+    ready = [hold for hold in sub_objs if hold.status == 'r']
+    if ready:
+        collector.add_field_update(field.model._meta.get_field('status'), 'w', ready)
+        collector.add_field_update(field.model._meta.get_field('allocated'), None, ready)
+
+
+class Hold(models.Model):
+    """ Model representing a reader's place in the queue for a book (see catalog/holds.py). """
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='holds')
+    patron = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='holds')
+    placed = models.DateTimeField(default=timezone.now)
+
+    # The copy set aside for the reader, once one has been.
+    copy = models.ForeignKey('BookInstance', on_delete=requeue_holds, null=True, blank=True, related_name='+')
+    allocated = models.DateTimeField(null=True, blank=True)
+
+    HOLD_STATUS = (
+        ('w', 'Waiting'),
+        ('r', 'Ready for collection'),
+        ('f', 'Collected'),
+        ('c', 'Cancelled'),
+    )
+
+    status = models.CharField(max_length=1, choices=HOLD_STATUS, default='w')
+
+    class Meta:
+        ordering = ['placed', 'id']
+        indexes = [
+            # The queue for a book: its waiting holds, oldest first.
+            models.Index(fields=['book', 'placed', 'id'], condition=Q(status='w'), name='hold_queue_idx'),
+            models.Index(fields=['patron', 'status'], name='hold_patron_idx'),
+        ]
+        constraints = [
+            UniqueConstraint(
+                fields=['book', 'patron'], condition=Q(status__in=['w', 'r']), name='hold_one_open_per_patron',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.book} for {self.patron}'
+
+
+class OverdueLoan(models.Model):
+    """ Model recording a loan found overdue by the overdue sweep (see catalog/overdue.py). """
+    copy = models.ForeignKey('BookInstance', on_delete=models.CASCADE, related_name='overdue_loans')
+    borrower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='overdue_loans')
+    due_back = models.DateField()
+    recorded = models.DateField(default=date.today)
+    notified = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['due_back']
+        constraints = [
+            # A loan is the copy, its borrower and the date it was due back (renewing starts a new one).
+            UniqueConstraint(fields=['copy', 'borrower', 'due_back'], name='overdue_loan_once'),
+        ]
+        indexes = [
+            # Borrowers still to be told about their overdue loans.
+            models.Index(fields=['borrower', 'id'], condition=Q(notified__isnull=True), name='overdue_unnotified_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.copy_id} due {self.due_back} ({self.borrower})'
+
+
+class LoanEvent(models.Model):
+    """ Model recording one change to a copy's circulation; rows are only ever added (see catalog/history.py). """
+    id = models.BigAutoField(primary_key=True)
+    # No foreign key constraints, so the history outlives deleted copies, books and users.
+    copy = models.ForeignKey('BookInstance', on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    book = models.ForeignKey(
+        'Book', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, null=True, related_name='+',
+    )
+    borrower = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        null=True, related_name='+',
+    )
+
+    EVENTS = (
+        ('o', 'Checked out'),
+        ('n', 'Renewed'),
+        ('a', 'Returned'),
+        ('m', 'Sent to maintenance'),
+        ('f', 'Back from maintenance'),
+        ('r', 'Reserved for a hold'),
+        ('c', 'Released from a hold'),
+    )
+
+    action = models.CharField(max_length=1, choices=EVENTS)
+    occurred = models.DateTimeField(default=timezone.now)
+    due_back = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['occurred', 'id']
+        indexes = [
+            models.Index(fields=['occurred', 'id'], name='loanevent_occurred_idx'),
+            models.Index(fields=['book', 'occurred'], name='loanevent_book_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()}: {self.copy_id} at {self.occurred}'
+
+
+class LoanEventArchive(models.Model):
+    """ Model keeping old LoanEvents compactly: plain ids, the day rather than the time, and no secondary indexes. """
+    id = models.BigIntegerField(primary_key=True)
+    copy_id = models.UUIDField()
+    book_id = models.IntegerField(null=True)
+    borrower_id = models.IntegerField(null=True)
+    action = models.CharField(max_length=1, choices=LoanEvent.EVENTS)
+    day = models.DateField()
+
+    class Meta:
+        ordering = ['id']
+
+
+class LoanRollup(models.Model):
+    """ Model counting the checkouts, renewals and returns of one book, genre or language over a day or month. """
+    PERIODS = (
+        ('d', 'Day'),
+        ('m', 'Month'),
+    )
+    DIMENSIONS = (
+        ('book', 'Book'),
+        ('genre', 'Genre'),
+        ('language', 'Language'),
+        ('library', 'Whole library'),
+    )
+
+    period = models.CharField(max_length=1, choices=PERIODS)
+    # The day, or the first day of the month.
+    start = models.DateField()
+    dimension = models.CharField(max_length=8, choices=DIMENSIONS)
+    # The id of the book, genre or language (0 for the whole library).
+    key = models.PositiveIntegerField()
+    checkouts = models.PositiveIntegerField(default=0)
+    renewals = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    # Days on loan in total of the returned copies whose checkout is in the history, and how many those were.
+    loan_days = models.PositiveIntegerField(default=0)
+    returns_timed = models.PositiveIntegerField(default=0)
+
+    def average_loan_days(self):
+        return self.loan_days / self.returns_timed if self.returns_timed else None
+
+    class Meta:
+        ordering = ['period', 'dimension', 'start', 'key']
+        constraints = [
+            # Also serves the reports, which read one period and dimension over a range of starts.
+            UniqueConstraint(fields=['period', 'dimension', 'start', 'key'], name='loanrollup_once'),
+        ]
+
+
+class LoanLeader(models.Model):
+    """ Model listing the most borrowed books and genres of recent days, rebuilt by catalog/dashboard.py. """
+    dimension = models.CharField(max_length=8, choices=LoanRollup.DIMENSIONS)
+    rank = models.PositiveSmallIntegerField()
+    key = models.PositiveIntegerField()
+    # The book's title or genre's name when the list was built.
+    name = models.CharField(max_length=200)
+    checkouts = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ['dimension', 'rank']
+        constraints = [
+            UniqueConstraint(fields=['dimension', 'rank'], name='loanleader_rank_once'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension} #{self.rank}: {self.name}'
+
+
+class Watermark(models.Model):
+    """ Model remembering how far an incremental job has got through an append-only table. """
+    name = models.CharField(max_length=50, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.position}'
+
+
+class BookReader(models.Model):
+    """ Model recording that a reader has borrowed a book at least once (see catalog/recommendations.py). """
+    id = models.BigAutoField(primary_key=True)
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    borrower = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False, related_name='readings',
+    )
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['borrower', 'book'], name='bookreader_once'),
+        ]
+        indexes = [
+            # Finds a reader's most recent books when pairing them up.
+            models.Index(fields=['borrower', 'id'], name='bookreader_recent'),
+        ]
+
+    def __str__(self):
+        return f'{self.borrower_id} read {self.book_id}'
+
+
+class CoBorrowing(models.Model):
+    """ Model counting the readers who borrowed both of two books; every pair is stored both ways round. """
+    id = models.BigAutoField(primary_key=True)
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, db_index=False, related_name='+')
+    other = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    borrowers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['book', 'other'], name='coborrowing_pair_once'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} & {self.other_id}: {self.borrowers}'
+
+
+class AlsoBorrowed(models.Model):
+    """ Model listing the books most often borrowed by a book's readers, best first (see catalog/recommendations.py). """
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, db_index=False, related_name='also_borrowed')
+    rank = models.PositiveSmallIntegerField()
+    other = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    # Readers who borrowed both books.
+    borrowers = models.PositiveIntegerField()
+
+    class Meta:
+        # By id, as ordering by the book would use Book's ordering and join its table.
+        ordering = ['book_id', 'rank']
+        constraints = [
+            # The book page's lookup.
+            UniqueConstraint(fields=['book', 'rank'], name='alsoborrowed_rank_once'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} #{self.rank}: {self.other_id}'
+
 # class MyModelName(models.Model):
 #     """A typical class defining a model, derived from the Model class."""
 
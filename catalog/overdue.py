@@ -0,0 +1,90 @@
+""" Finding overdue loans in the database and telling their borrowers.
+
+A loan is overdue when its copy is on loan and was due back before today. The
+condition is plain SQL over the bookinst_status_due_idx (status, due_back)
+index, so lists and counts of overdue loans never call
+BookInstance.is_overdue() on every row.
+
+sweep() records every overdue loan not recorded yet as an OverdueLoan, with a
+single INSERT ... SELECT however many loans there are. notify() then emails
+each borrower about their newly recorded loans, walking the borrowers with
+.iterator() a chunk at a time, so memory use stays flat.
+"""
+from collections import defaultdict
+from datetime import date
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import DateField, Exists, F, OuterRef, Value
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .bulk import insert_select
+from .models import BookInstance, OverdueLoan
+
+
+def overdue_loans(queryset=None, today=None):
+    """ Narrow a BookInstance queryset (all copies by default) to the loans overdue on `today`. """
+    if queryset is None:
+        queryset = BookInstance.objects.all()
+    return queryset.filter(status__exact='o', due_back__lt=today or date.today())
+
+
+def sweep(today=None):
+    """ Record the loans overdue on `today` that are not recorded yet. Returns the number recorded. """
+    today = today or date.today()
+    loans = (
+        overdue_loans(today=today)
+        .filter(borrower__isnull=False)
+        .exclude(Exists(OverdueLoan.objects.filter(
+            copy=OuterRef('pk'), borrower=OuterRef('borrower'), due_back=OuterRef('due_back'),
+        )))
+    )
+    return insert_select(
+        OverdueLoan, loans,
+        copy=F('pk'), borrower=F('borrower'), due_back=F('due_back'),
+        recorded=Value(today, output_field=DateField()),
+    )
+
+
+def overdue_notice(borrower, loans):
+    return EmailMessage(
+        subject='Overdue library books',
+        body=render_to_string('catalog/overdue_notice.txt', {'borrower': borrower, 'loans': loans}),
+        to=[borrower.email],
+    )
+
+
+def notify(chunk_size=500):
+    """ Email every borrower about their recorded overdue loans they have not been told about yet.
+
+    Handles `chunk_size` borrowers at a time: one query for their loans, one
+    batch of emails and one UPDATE marking the loans notified. Borrowers without
+    an email address are skipped, but their loans are still marked. Returns the
+    number of borrowers emailed and of loans marked.
+    """
+    pending = OverdueLoan.objects.filter(notified__isnull=True)
+    borrowers = (
+        get_user_model().objects
+        .filter(Exists(pending.filter(borrower=OuterRef('pk'))))
+        .order_by('pk')
+        .only('pk', 'username', 'first_name', 'last_name', 'email')
+        .iterator(chunk_size=chunk_size)
+    )
+    mail = get_connection()
+    emailed = marked = 0
+    while chunk := list(islice(borrowers, chunk_size)):
+        by_pk = {borrower.pk: borrower for borrower in chunk}
+        loans = defaultdict(list)
+        chunk_loans = pending.filter(borrower__in=list(by_pk)).select_related('copy__book')
+        for loan in chunk_loans.order_by('borrower', 'due_back', 'pk'):
+            loans[loan.borrower_id].append(loan)
+
+        messages = [overdue_notice(by_pk[pk], user_loans) for pk, user_loans in loans.items() if by_pk[pk].email]
+        if messages:
+            emailed += mail.send_messages(messages) or 0
+        marked += OverdueLoan.objects.filter(
+            pk__in=[loan.pk for user_loans in loans.values() for loan in user_loans],
+        ).update(notified=timezone.now())
+    return emailed, marked
@@ -0,0 +1,183 @@
+""" Keyset (cursor) pagination for list views.
+
+Django's default paginator runs a COUNT(*) and an OFFSET scan on every page,
+which gets slower the deeper you page into a large table. Keyset pagination
+instead remembers the ordering values of the last row shown and asks the
+database for the rows that come after it, so every page costs the same.
+"""
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.translation import gettext as _
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """ A page of results, shaped like django.core.paginator.Page where it matters for templates. """
+    is_keyset = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """ Paginates a queryset on a fixed, unique ordering without counting it.
+
+    `ordering` is a sequence of field names (attnames such as 'author_id' are
+    fine), each optionally prefixed with '-' for descending order. The last
+    entry should make the ordering unique, usually 'pk'. NULLs sort where the
+    database puts them by default (last in ascending order on PostgreSQL, first
+    on SQLite), which is also how its indexes order them, so an index on the
+    ordering columns serves every page. Nullable columns can take part in the key.
+    """
+    salt = 'catalog.pagination'
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(name.lstrip('-') for name in ordering)
+        self.descending = tuple(name.startswith('-') for name in ordering)
+        self.fields = [self._get_field(name) for name in self.ordering]
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+
+    def _get_field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _order_by(self, backwards=False):
+        # No explicit NULLS FIRST/LAST: the database's default matches its indexes.
+        return [
+            F(name).desc() if descending != backwards else F(name).asc()
+            for name, descending in zip(self.ordering, self.descending)
+        ]
+
+    def _beyond(self, name, value, greater, inclusive=False):
+        """ The filter selecting `name` values past `value`: greater (or smaller) ones, and NULLs if they sort there. """
+        nulls = Q(**{f'{name}__isnull': True}) if greater == self.nulls_largest else None
+        if value is None:
+            # Nothing is past a NULL on the side NULLs sort to; everything else is on the other.
+            return None if nulls is not None else Q(**{f'{name}__isnull': False})
+        lookup = ('gte' if inclusive else 'gt') if greater else ('lte' if inclusive else 'lt')
+        condition = Q(**{f'{name}__{lookup}': value})
+        return condition if nulls is None else condition | nulls
+
+    def _after(self, values, backwards=False):
+        """ Build the filter selecting rows strictly after `values`, or before them when going backwards. """
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for name, column_descending, value in zip(self.ordering, self.descending, values):
+            step = self._beyond(name, value, greater=column_descending == backwards)
+            if step is not None:
+                condition |= prefix & step
+            if value is None:
+                prefix &= Q(**{f'{name}__isnull': True})
+            else:
+                prefix &= Q(**{name: value})
+
+        # The same rows, but with a range on the first column an index can seek to
+        # rather than walking every entry before it.
+        name, column_descending, value = self.ordering[0], self.descending[0], values[0]
+        if value is not None:
+            condition &= self._beyond(name, value, greater=column_descending == backwards, inclusive=True)
+        return condition
+
+    def _key(self, obj):
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def encode_cursor(self, obj, direction):
+        values = [None if value is None else str(value) for value in self._key(obj)]
+        return signing.dumps({'d': direction, 'k': values}, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+            direction, values = data['d'], list(data['k'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError) as exc:
+            raise InvalidCursor from exc
+
+        if direction not in ('n', 'p') or len(values) != len(self.fields):
+            raise InvalidCursor
+        try:
+            values = [None if value is None else field.to_python(value)
+                      for field, value in zip(self.fields, values)]
+        except ValidationError as exc:
+            raise InvalidCursor from exc
+        return direction, values
+
+    def page(self, cursor=None):
+        """ Return the page following (or preceding) `cursor`; the first page if no cursor is given. """
+        direction, values = ('n', None) if not cursor else self.decode_cursor(cursor)
+        backwards = direction == 'p'
+
+        queryset = self.queryset.order_by(*self._order_by(backwards))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+
+        # Fetch one extra row to find out whether there is another page without counting.
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self.encode_cursor(rows[-1], 'n')
+            if (has_more and backwards) or (values is not None and not backwards):
+                previous_cursor = self.encode_cursor(rows[0], 'p')
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin:
+    """ ListView mixin switching pagination to keyset mode.
+
+    Set `keyset_ordering` on the view (or override get_keyset_ordering()
+    to pick one per request). Requests carrying an old style
+    `?page=N` parameter still get the regular offset paginator.
+    """
+    keyset_ordering = None
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        ordering = self.get_keyset_ordering()
+        if not ordering or (
+            self.page_kwarg in self.request.GET and self.cursor_kwarg not in self.request.GET
+        ):
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, ordering)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404(_('Invalid cursor.'))
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,81 @@
+""" Per-view SQL query budgets.
+
+Views declare how many queries a request may take, either with a
+`query_budget` attribute on the view class or the @query_budget decorator on
+a view function. QueryBudgetMiddleware counts the queries of every request
+and logs a warning (QUERY_BUDGET_MODE = 'warn') or raises QueryBudgetExceeded
+(QUERY_BUDGET_MODE = 'raise') when a view goes over its budget. Savepoint
+statements are not counted, so the numbers match between tests (which wrap
+everything in a transaction) and production.
+"""
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(budget):
+    """ Decorator declaring the query budget of a view function. """
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    """ Return the budget declared on a view function or on the class behind an as_view() function. """
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        budget = getattr(getattr(view_func, 'view_class', None), 'query_budget', None)
+    return budget
+
+
+def is_savepoint(sql):
+    return sql.lstrip().upper().startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+
+
+class QueryCounter:
+    """ Database execute wrapper counting the statements run through it. """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not is_savepoint(sql):
+            self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn' if settings.DEBUG else 'off')
+        if self.mode not in ('warn', 'raise'):
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        response['X-Query-Count'] = str(counter.count)
+        view_name, budget = getattr(request, '_query_budget', (None, None))
+        if budget is not None and counter.count > budget:
+            message = f'{view_name} ran {counter.count} queries for {request.path}, over its budget of {budget}.'
+            if self.mode == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = (view_func.__name__, get_query_budget(view_func))
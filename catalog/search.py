@@ -0,0 +1,136 @@
+""" Full-text search over book titles, summaries and author names.
+
+Each database gets its own backend behind the same interface:
+
+* SQLite: an FTS5 table (catalog_book_fts) ranked with bm25().
+* PostgreSQL: a tsvector column on catalog_book with a GIN index, ranked with ts_rank().
+* Anything else: a plain icontains scan, so search still works everywhere.
+
+The index is kept up to date by database triggers (see migration 0009), so
+bulk_create() and raw updates are covered as well as model saves. Both indexes
+use the same tokenizing rules (case folded, no stemming) and weights (title,
+then author, then summary), and every search term also matches as a prefix,
+so the two databases return the same books for the same query.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Book
+
+# Relative weights of the indexed columns.
+TITLE_WEIGHT, AUTHOR_WEIGHT, SUMMARY_WEIGHT = 10.0, 5.0, 1.0
+
+
+def search_terms(query):
+    """ Split a search box query into terms (letters and digits only). """
+    return re.findall(r'\w+', query.lower())[:16]
+
+
+class SearchBackend:
+    def count(self, terms):
+        raise NotImplementedError
+
+    def ids(self, terms, offset, limit):
+        """ Return the ids of matching books, best match first. """
+        raise NotImplementedError
+
+    def _fetch(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class SQLiteSearchBackend(SearchBackend):
+    def match(self, terms):
+        # Quote each term (so FTS5 operators typed by users are taken literally) and match prefixes.
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def count(self, terms):
+        return self._fetch(
+            'SELECT COUNT(*) FROM catalog_book_fts WHERE catalog_book_fts MATCH %s', [self.match(terms)],
+        )[0][0]
+
+    def ids(self, terms, offset, limit):
+        rows = self._fetch(
+            'SELECT rowid FROM catalog_book_fts WHERE catalog_book_fts MATCH %s '
+            'ORDER BY bm25(catalog_book_fts, %s, %s, %s), rowid LIMIT %s OFFSET %s',
+            [self.match(terms), TITLE_WEIGHT, SUMMARY_WEIGHT, AUTHOR_WEIGHT, limit, offset],
+        )
+        return [row[0] for row in rows]
+
+
+class PostgresSearchBackend(SearchBackend):
+    def match(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def count(self, terms):
+        return self._fetch(
+            "SELECT COUNT(*) FROM catalog_book WHERE search_vector @@ to_tsquery('simple', %s)", [self.match(terms)],
+        )[0][0]
+
+    def ids(self, terms, offset, limit):
+        # ts_rank() weights are given for the D, C, B and A labels, in that order.
+        rows = self._fetch(
+            "SELECT id FROM catalog_book WHERE search_vector @@ to_tsquery('simple', %s) "
+            "ORDER BY ts_rank(%s::float4[], search_vector, to_tsquery('simple', %s)) DESC, id LIMIT %s OFFSET %s",
+            [self.match(terms), [0, SUMMARY_WEIGHT / 10, AUTHOR_WEIGHT / 10, TITLE_WEIGHT / 10],
+             self.match(terms), limit, offset],
+        )
+        return [row[0] for row in rows]
+
+
+class SimpleSearchBackend(SearchBackend):
+    """ Unindexed fallback: every term must appear in the title, summary or author name. """
+
+    def queryset(self, terms):
+        queryset = Book.objects.order_by('title', 'pk')
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(summary__icontains=term)
+                | Q(author__first_name__icontains=term) | Q(author__last_name__icontains=term)
+            )
+        return queryset
+
+    def count(self, terms):
+        return self.queryset(terms).count()
+
+    def ids(self, terms, offset, limit):
+        return list(self.queryset(terms).values_list('pk', flat=True)[offset:offset + limit])
+
+
+def get_search_backend():
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
+
+
+class SearchResults:
+    """ Lazy, sliceable search results, so Django's Paginator only fetches the page it shows. """
+
+    def __init__(self, query, backend=None):
+        self.terms = search_terms(query)
+        self.backend = backend or get_search_backend()
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms) if self.terms else 0
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if not self.terms or stop <= start:
+            return []
+        ids = self.backend.ids(self.terms, start, stop - start)
+        books = Book.objects.select_related('author').order_by().in_bulk(ids)
+        return [books[pk] for pk in ids if pk in books]
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import autocomplete, fuzzy
+from .availability import recount_book
+from .caching import bump_catalog_version, bump_copies_versions, bump_permissions_version
+from .holds import rebalance
+from .models import Book, Author, BookInstance, Genre, Language, Country
+from .stats import invalidate_index_stats
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=BookInstance)
+@receiver([post_save, post_delete], sender=Author)
+@receiver([post_save, post_delete], sender=Genre)
+def clear_index_stats(sender, **kwargs):
+    """ Drop the cached home page counts when a counted model changes. """
+    # Once the change commits: dropped any earlier, they could be recounted from the old rows.
+    transaction.on_commit(invalidate_index_stats)
+
+
+@receiver([post_save, post_delete], sender=BookInstance)
+def expire_cached_copies(sender, instance, **kwargs):
+    """ Make the cached pages showing the copy (and its old book's page, if it moved) stale. """
+    # Read before recount_copies() below forgets the old book; bumped once the change commits,
+    # so no request can cache the old rows under the new versions (as for expire_cached_pages()).
+    book_ids = {instance.book_id, getattr(instance, '_loaded_book_id', None)} - {None}
+    transaction.on_commit(lambda: bump_copies_versions(book_ids))
+
+
+@receiver([post_save, post_delete], sender=BookInstance)
+def recount_copies(sender, instance, update_fields=None, **kwargs):
+    """ Keep the copy counts on the copy's book (and on its old book, if it moved) up to date. """
+    if update_fields is not None and not {'book', 'book_id', 'status', 'due_back'} & set(update_fields):
+        return
+    for book_id in {instance.book_id, getattr(instance, '_loaded_book_id', None)} - {None}:
+        recount_book(book_id)
+    instance._loaded_book_id = instance.book_id
+
+
+@receiver(post_delete, sender=BookInstance)
+def pass_on_deleted_reservation(sender, instance, **kwargs):
+    """ Give a hold whose reserved copy was deleted (so it is waiting again, see Hold.copy) another copy. """
+    # The instance's status may be out of date (reserving is a queryset update), and
+    # rebalance() only touches the book if it has both waiting holds and available copies.
+    rebalance([instance.book_id])
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Author)
+@receiver([post_save, post_delete], sender=Genre)
+@receiver([post_save, post_delete], sender=Language)
+@receiver([post_save, post_delete], sender=Country)
+@receiver(m2m_changed, sender=Book.genre.through)
+def expire_cached_pages(sender, **kwargs):
+    """ Make cached catalog pages stale when anything they show changes.
+
+    Once the change commits: the admin saves inside a transaction, and a request
+    reading the old rows after an earlier bump would cache them under the new version.
+    """
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Author)
+def expire_title_indexes(sender, **kwargs):
+    """ Rebuild the search box suggestions and fuzzy title index once book titles or author names change. """
+    autocomplete.expire_index_on_commit()
+    if sender is Book:
+        fuzzy.expire_index_on_commit()
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def expire_cached_sidebars(sender, update_fields=None, **kwargs):
+    """ Make cached sidebars stale when a user's staff status or permissions may have changed. """
+    # Logging in only updates last_login.
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_permissions_version()
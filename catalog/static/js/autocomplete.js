@@ -0,0 +1,31 @@
+// Fill the search box suggestions from the autocomplete endpoint as the user types.
+document.addEventListener('DOMContentLoaded', function () {
+    const input = document.querySelector('input[data-autocomplete-url]');
+    if (!input) {
+        return;
+    }
+    const datalist = document.getElementById(input.getAttribute('list'));
+    let latest = 0;
+
+    input.addEventListener('input', function () {
+        const query = input.value.trim();
+        const request = ++latest;
+        if (!query) {
+            datalist.replaceChildren();
+            return;
+        }
+        fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query))
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                // Ignore answers to keystrokes the user has already typed past.
+                if (request !== latest) {
+                    return;
+                }
+                datalist.replaceChildren(...data.suggestions.map(function (suggestion) {
+                    const option = document.createElement('option');
+                    option.value = suggestion.label;
+                    return option;
+                }));
+            });
+    });
+});
@@ -0,0 +1,59 @@
+""" Record counts shown on the catalog home page.
+
+All the counts are gathered in a single SELECT and kept in the shared cache.
+The signal handlers in catalog/signals.py drop the cached entry whenever one
+of the counted models changes, so the TTL only bounds how stale the page can
+get if a change slips past the signals (e.g. a queryset .update()).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Book, Author, BookInstance, Genre
+
+INDEX_STATS_CACHE_KEY = 'catalog:index-stats'
+
+# Books whose title contains this word are counted separately on the home page.
+FILTER_WORD = 'the'
+
+
+def _count_querysets():
+    return {
+        'num_books': Book.objects.all(),
+        'num_books_filtered': Book.objects.filter(title__icontains=FILTER_WORD),
+        'num_instances': BookInstance.objects.all(),
+        'num_instances_available': BookInstance.objects.filter(status__exact='a'),
+        'num_authors': Author.objects.all(),
+        'num_genres': Genre.objects.all(),
+    }
+
+
+def compute_index_stats():
+    """ Count everything in one round-trip, as one scalar subquery per statistic. """
+    columns, params = [], []
+    for alias, queryset in _count_querysets().items():
+        sql, sql_params = queryset.order_by().values('pk').query.sql_with_params()
+        columns.append(f'(SELECT COUNT(*) FROM ({sql}) AS {connection.ops.quote_name(alias + "_q")}) '
+                       f'AS {connection.ops.quote_name(alias)}')
+        params.extend(sql_params)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(columns)}', params)
+        row = cursor.fetchone()
+
+    stats = dict(zip(_count_querysets().keys(), row))
+    stats['filter_word'] = FILTER_WORD
+    return stats
+
+
+def get_index_stats():
+    """ Return the home page counts, from the cache when possible. """
+    stats = cache.get(INDEX_STATS_CACHE_KEY)
+    if stats is None:
+        stats = compute_index_stats()
+        cache.set(INDEX_STATS_CACHE_KEY, stats, settings.CATALOG_INDEX_STATS_TTL)
+    return stats
+
+
+def invalidate_index_stats():
+    cache.delete(INDEX_STATS_CACHE_KEY)
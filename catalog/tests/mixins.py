@@ -0,0 +1,43 @@
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from catalog.querybudget import get_query_budget, is_savepoint
+
+
+class QueryBudgetTestMixin:
+    """ TestCase mixin checking views against the query budgets declared in catalog/views.py. """
+
+    def request_queries(self, url, method='get', data=None):
+        """ Request `url` and return the response with the list of SQL statements it ran. """
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, [query['sql'] for query in captured if not is_savepoint(query['sql'])]
+
+    def assertWithinQueryBudget(self, url, method='get', data=None, budget=None):
+        """ Request `url` and fail if it runs more queries than its view's budget. Returns the response and count. """
+        if budget is None:
+            budget = get_query_budget(resolve(urlsplit(url).path).func)
+            self.assertIsNotNone(budget, f'The view for {url} declares no query budget.')
+
+        response, queries = self.request_queries(url, method, data)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} ran {len(queries)} queries, over its budget of {budget}:\n' + '\n'.join(queries),
+        )
+        return response, len(queries)
+
+    def assertQueryBudgetScales(self, url, grow, sizes=(1, 10, 50), **kwargs):
+        """ Call grow(n) for each size, then check `url` stays within budget with the same query count. """
+        counts = {}
+        for size in sizes:
+            # As if committed, so caches expired on commit follow the growth.
+            with self.captureOnCommitCallbacks(execute=True):
+                grow(size)
+            response, counts[size] = self.assertWithinQueryBudget(url, **kwargs)
+        self.assertEqual(len(set(counts.values())), 1, f'The query count of {url} grows with the data: {counts}')
+        return response
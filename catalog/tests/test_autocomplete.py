@@ -0,0 +1,132 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from catalog import autocomplete
+from catalog.autocomplete import PrefixIndex, normalize
+from catalog.caching import ProcessIndex, bump_version
+from catalog.models import Author, Book
+
+
+class PrefixIndexTest(TestCase):
+    def setUp(self):
+        self.index = PrefixIndex(top_k=3)
+        self.index.build([
+            ('book', 1, 'Émile', ['emile']),
+            ('book', 2, 'Emma', ['emma']),
+            ('book', 3, 'Dune', ['dune']),
+        ])
+
+    def labels(self, prefix, limit=None):
+        return [label for kind, pk, label in self.index.lookup(prefix, limit)]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Ÿoung   WIZARD '), 'young wizard')
+
+    def test_lookup_returns_keys_in_order(self):
+        self.assertEqual(self.labels('em'), ['Émile', 'Emma'])
+        self.assertEqual(self.labels('ÉM'), ['Émile', 'Emma'])
+        self.assertEqual(self.labels('em', limit=1), ['Émile'])
+        self.assertEqual(self.labels('x'), [])
+        self.assertEqual(self.labels(' '), [])
+
+    def test_add_and_remove(self):
+        self.index.add('book', 4, 'Emerald', ['emerald'])
+        self.assertEqual(self.labels('em'), ['Emerald', 'Émile', 'Emma'])
+        # Renaming replaces the old key.
+        self.index.add('book', 4, 'Ruby', ['ruby'])
+        self.assertEqual(self.labels('em'), ['Émile', 'Emma'])
+        self.index.remove('book', 2)
+        self.assertEqual(self.labels('em'), ['Émile'])
+        self.assertEqual(len(self.index), 3)
+
+    def test_keeps_top_k_objects_per_key(self):
+        for pk in range(10, 20):
+            self.index.add('book', pk, 'Dune', ['dune'])
+        self.assertEqual(len(self.index.entries['dune']), 3)
+        self.assertEqual(self.labels('d'), ['Dune'])
+        self.index.remove('book', 3)
+        self.assertEqual(self.labels('d'), ['Dune'])
+
+    def test_limit_is_capped_at_top_k(self):
+        for pk in range(10, 20):
+            self.index.add('book', pk, f'Emma {pk}', [f'emma {pk}'])
+        self.assertEqual(len(self.labels('em', limit=50)), 3)
+
+
+class AutocompleteViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.book = Book.objects.create(title='A Wizard of Earthsea', summary='Summary', isbn='ISBN', author=cls.author)
+
+    def setUp(self):
+        # The index outlives the test transactions, so start each test from the database.
+        autocomplete.reset_index()
+        self.addCleanup(autocomplete.reset_index)
+
+    def suggestions(self, prefix):
+        response = self.client.get(reverse('autocomplete'), {'q': prefix})
+        self.assertEqual(response.status_code, 200)
+        return [(suggestion['type'], suggestion['label']) for suggestion in response.json()['suggestions']]
+
+    def test_suggests_titles_and_authors(self):
+        self.assertEqual(self.suggestions('a wiz'), [('book', 'A Wizard of Earthsea')])
+        self.assertEqual(self.suggestions('urs'), [('author', 'Le Guin, Ursula')])
+        self.assertEqual(self.suggestions('le g'), [('author', 'Le Guin, Ursula')])
+        response = self.client.get(reverse('autocomplete'), {'q': 'a wiz'})
+        self.assertEqual(response.json()['suggestions'][0]['url'], self.book.get_absolute_url())
+
+    def test_only_the_first_request_queries_the_database(self):
+        self.suggestions('a')
+        with self.assertNumQueries(0):
+            self.suggestions('ab')
+
+    def test_follows_saves_and_deletes(self):
+        self.suggestions('a')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title='Always Coming Home', summary='Summary', isbn='ISBN2', author=self.author)
+            # Not before the change commits.
+            self.assertEqual(self.suggestions('al'), [])
+        self.assertEqual(self.suggestions('a'), [('book', 'A Wizard of Earthsea'), ('book', 'Always Coming Home')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'U. K.'
+            self.author.save()
+        self.assertEqual(self.suggestions('ursula'), [])
+        self.assertEqual(self.suggestions('u. k'), [('author', 'Le Guin, U. K.')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        self.assertEqual(self.suggestions('al'), [])
+
+    def test_rebuilds_after_changes_in_another_process(self):
+        self.suggestions('a')
+        # Another process renames the book: this process only sees the version change.
+        Book.objects.filter(pk=self.book.pk).update(title='The Tombs of Atuan')
+        bump_version(autocomplete.SUGGESTIONS_VERSION_KEY)
+        self.assertEqual(self.suggestions('a wiz'), [])
+        self.assertEqual(self.suggestions('the t'), [('book', 'The Tombs of Atuan')])
+
+    def test_processes_editing_at_once_both_see_every_edit(self):
+        # Two processes' indexes, sharing the version.
+        first = ProcessIndex(autocomplete.SUGGESTIONS_VERSION_KEY, autocomplete.build_index)
+        second = ProcessIndex(autocomplete.SUGGESTIONS_VERSION_KEY, autocomplete.build_index)
+        first.get(), second.get()
+        Book.objects.create(title='Always Coming Home', summary='Summary', isbn='ISBN2', author=self.author)
+        first.expire()
+        Book.objects.filter(pk=self.book.pk).update(title='Tehanu')
+        second.expire()
+        for index in (first, second):
+            self.assertEqual([label for kind, pk, label in index.get().lookup('al')], ['Always Coming Home'])
+            self.assertEqual([label for kind, pk, label in index.get().lookup('te')], ['Tehanu'])
+
+    def test_bulk_commands_expire_every_index(self):
+        self.suggestions('a')
+        Book.objects.filter(pk=self.book.pk).update(title='Tehanu')
+        autocomplete.expire_index()
+        self.assertEqual(self.suggestions('te'), [('book', 'Tehanu')])
+
+    @override_settings(CATALOG_AUTOCOMPLETE_TOP_K=1)
+    def test_top_k_setting(self):
+        Book.objects.create(title='A Wizard Returns', summary='Summary', isbn='ISBN2', author=self.author)
+        self.assertEqual(self.suggestions('a wiz'), [('book', 'A Wizard of Earthsea')])
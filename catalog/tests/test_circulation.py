@@ -0,0 +1,294 @@
+import datetime
+import json
+import threading
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.caching import AVAILABILITY_VERSION_KEY, CATALOG_VERSION_KEY, copies_version_key, get_versions
+from catalog.circulation import CirculationConflict, batch, checkout, mark_maintenance, renew, return_copy
+from catalog.models import Book, BookInstance
+from catalog.stats import INDEX_STATS_CACHE_KEY
+from catalog.tests.mixins import QueryBudgetTestMixin
+
+User = get_user_model()
+
+
+class CirculationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+
+    def refresh(self):
+        self.copy.refresh_from_db()
+        self.book.refresh_from_db()
+
+    def test_checkout_renew_and_return(self):
+        due = datetime.date.today() + datetime.timedelta(days=10)
+        checkout(self.copy.pk, self.user, due)
+        self.refresh()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('o', self.user, due))
+        self.assertEqual((self.book.num_available, self.book.num_on_loan, self.book.next_due_back), (0, 1, due))
+
+        later = due + datetime.timedelta(days=7)
+        renew(self.copy.pk, later)
+        self.refresh()
+        self.assertEqual(self.copy.due_back, later)
+        self.assertEqual(self.book.next_due_back, later)
+
+        return_copy(self.copy.pk)
+        self.refresh()
+        self.assertEqual((self.copy.status, self.copy.borrower, self.copy.due_back), ('a', None, None))
+        self.assertEqual((self.book.num_available, self.book.num_on_loan), (1, 0))
+
+        mark_maintenance(self.copy.pk)
+        self.refresh()
+        self.assertEqual(self.copy.status, 'm')
+        self.assertEqual(self.book.num_available, 0)
+
+    def test_cached_pages_expire_once_committed(self):
+        cache.set(INDEX_STATS_CACHE_KEY, {'num_books': 1})
+        keys = [CATALOG_VERSION_KEY, AVAILABILITY_VERSION_KEY, copies_version_key(self.book.pk)]
+        catalog, availability, copies = get_versions(keys)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(self.copy.pk, self.user)
+            # A request now still sees the old rows, so must not cache them under a new version.
+            self.assertEqual(get_versions(keys), [catalog, availability, copies])
+            self.assertIsNotNone(cache.get(INDEX_STATS_CACHE_KEY))
+        new_catalog, new_availability, new_copies = get_versions(keys)
+        self.assertIsNone(cache.get(INDEX_STATS_CACHE_KEY))
+        self.assertNotEqual(new_availability, availability)
+        self.assertNotEqual(new_copies, copies)
+        # Pages that show no copies stay cached.
+        self.assertEqual(new_catalog, catalog)
+
+    def test_default_due_date(self):
+        checkout(self.copy.pk, self.user)
+        self.refresh()
+        self.assertEqual(self.copy.due_back, datetime.date.today() + datetime.timedelta(weeks=3))
+
+    def test_conflicts(self):
+        with self.assertRaisesMessage(CirculationConflict, 'it is available'):
+            return_copy(self.copy.pk)
+        with self.assertRaises(CirculationConflict):
+            renew(self.copy.pk, datetime.date.today())
+
+        checkout(self.copy.pk, self.user)
+        with self.assertRaises(CirculationConflict) as raised:
+            checkout(self.copy.pk, self.user)
+        self.assertEqual(raised.exception.status, 'o')
+        with self.assertRaises(CirculationConflict):
+            mark_maintenance(self.copy.pk)
+
+        self.copy.delete()
+        with self.assertRaises(BookInstance.DoesNotExist):
+            return_copy(self.copy.pk)
+
+    def test_writes_only_the_changed_columns(self):
+        with CaptureQueriesContext(connection) as captured:
+            checkout(self.copy.pk, self.user, datetime.date.today())
+        updates = [query['sql'] for query in captured if query['sql'].startswith('UPDATE "catalog_bookinstance"')]
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn('imprint', updates[0])
+        self.assertNotIn('book_id" =', updates[0].split('WHERE')[0])
+
+    def test_renew_view_reports_conflicts(self):
+        self.user.user_permissions.add(Permission.objects.get(codename='can_renew'))
+        self.client.force_login(self.user)
+        url = reverse('renew-book-librarian', args=[self.copy.pk])
+        due = datetime.date.today() + datetime.timedelta(weeks=2)
+
+        # The copy was returned while the librarian had the form open.
+        response = self.client.post(url, {'due_back': due})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Cannot renew copy')
+
+        checkout(self.copy.pk, self.user)
+        response = self.client.post(url, {'due_back': due})
+        self.assertRedirects(response, reverse('all-borrowed'), fetch_redirect_response=False)
+        self.refresh()
+        self.assertEqual(self.copy.due_back, due)
+
+
+class BatchCirculationTest(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(*Permission.objects.filter(codename__in=['can_mark_returned', 'can_renew']))
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+
+    def add_copies(self, count, status='o'):
+        due_back = datetime.date.today() if status == 'o' else None
+        borrower = self.user if status == 'o' else None
+        return [
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status=status, borrower=borrower, due_back=due_back).pk
+            for n in range(count)
+        ]
+
+    def test_reports_each_copy(self):
+        on_loan, available, missing = self.add_copies(2), self.add_copies(1, 'a'), uuid.uuid4()
+        results = batch('return', on_loan + available + [missing, on_loan[0]])
+        self.assertEqual(list(results), on_loan + available + [missing])
+        self.assertEqual([results[pk] for pk in on_loan], [None, None])
+        self.assertEqual(results[available[0]], f'Cannot return copy {available[0]}: it is available.')
+        self.assertEqual(results[missing], f'No copy with id {missing}.')
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.num_available, self.book.num_on_loan), (3, 0))
+        self.assertEqual(BookInstance.objects.filter(status='a', borrower=None, due_back=None).count(), 3)
+
+    def test_checkout_and_renew(self):
+        copies = self.add_copies(3, 'a')
+        batch('checkout', copies, borrower=self.user)
+        due = datetime.date.today() + datetime.timedelta(weeks=3)
+        self.assertEqual(BookInstance.objects.filter(status='o', borrower=self.user, due_back=due).count(), 3)
+
+        later = datetime.date.today() + datetime.timedelta(weeks=4)
+        results = batch('renew', copies, due_back=later)
+        self.assertEqual(set(results.values()), {None})
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.num_on_loan, self.book.next_due_back), (3, later))
+
+    def test_cached_pages_expire_once_committed(self):
+        copies = self.add_copies(50)
+        keys = [CATALOG_VERSION_KEY, copies_version_key(self.book.pk)]
+        catalog, version = get_versions(keys)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            batch('return', copies)
+            self.assertEqual(get_versions(keys), [catalog, version])
+        self.assertEqual(get_versions(keys)[0], catalog)
+        self.assertNotEqual(get_versions(keys)[1], version)
+        # Once for the whole batch, not per copy.
+        self.assertEqual(len(callbacks), 2)
+
+    def test_view(self):
+        url = reverse('circulation-batch')
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.librarian)
+        copies = self.add_copies(1) + self.add_copies(1, 'a')
+        response = self.client.post(url, {'action': 'return', 'copies': '\n'.join(map(str, copies))})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Done')
+        self.assertContains(response, 'it is available')
+
+    def test_renewing_needs_the_renew_permission(self):
+        desk = User.objects.create_user(username='desk')
+        desk.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.client.force_login(desk)
+        url = reverse('circulation-batch')
+        copies = self.add_copies(2)
+        later = datetime.date.today() + datetime.timedelta(weeks=1)
+
+        response = self.client.post(url, {'action': 'renew', 'copies': ' '.join(map(str, copies)), 'due_back': later})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(url, json.dumps({
+            'action': 'renew', 'copies': [str(pk) for pk in copies], 'due_back': str(later),
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(BookInstance.objects.filter(due_back=later).exists())
+
+        # Returning is still allowed.
+        response = self.client.post(url, {'action': 'return', 'copies': ' '.join(map(str, copies))})
+        self.assertContains(response, 'Done', count=2)
+
+    def test_json(self):
+        self.client.force_login(self.librarian)
+        url = reverse('circulation-batch')
+        copies = self.add_copies(2, 'a')
+        response = self.client.post(url, json.dumps({
+            'action': 'checkout', 'borrower': 'reader', 'copies': [str(pk) for pk in copies],
+        }), content_type='application/json')
+        self.assertEqual(response.json()['results'], [
+            {'id': str(pk), 'title': 'Book', 'ok': True, 'error': None} for pk in copies
+        ])
+
+        response = self.client.post(url, json.dumps({
+            'action': 'renew', 'copies': [str(pk) for pk in copies],
+            'due_back': str(datetime.date.today() - datetime.timedelta(days=1)),
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors']['due_back'], ['Invalid date - Due date cannot be in the past'])
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        self.client.force_login(self.librarian)
+        url = reverse('circulation-batch')
+        counts = set()
+        for size in (1, 10, 50):
+            copies = self.add_copies(size)
+            response, count = self.assertWithinQueryBudget(
+                url, method='post', data={'action': 'return', 'copies': ' '.join(map(str, copies))},
+            )
+            self.assertContains(response, 'Done', count=size)
+            counts.add(count)
+        self.assertEqual(len(counts), 1, counts)
+
+
+class ConcurrentCirculationTest(TransactionTestCase):
+    """ Several librarians acting on the same copy at the same moment. """
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'reader{n}') for n in range(6)]
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+        self.copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+    def race(self, operations):
+        """ Run the callables in `operations` in threads released at the same moment; return their outcomes. """
+        barrier = threading.Barrier(len(operations))
+        outcomes = [None] * len(operations)
+
+        def run(index, operation):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        operation()
+                        outcomes[index] = 'ok'
+                        break
+                    except OperationalError:
+                        # SQLite's shared in-memory test database reports busy tables rather than waiting.
+                        continue
+                    except CirculationConflict:
+                        outcomes[index] = 'conflict'
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index, operation)) for index, operation in enumerate(operations)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_only_one_checkout_wins(self):
+        outcomes = self.race([lambda user=user: checkout(self.copy.pk, user) for user in self.users])
+        self.assertEqual(sorted(outcomes), ['conflict'] * 5 + ['ok'])
+
+        self.copy.refresh_from_db()
+        self.assertEqual(self.copy.status, 'o')
+        self.assertEqual(self.copy.borrower, self.users[outcomes.index('ok')])
+        book = Book.objects.get()
+        self.assertEqual((book.num_available, book.num_on_loan), (0, 1))
+
+    def test_return_and_maintenance_race(self):
+        checkout(self.copy.pk, self.users[0])
+        outcomes = self.race([lambda: return_copy(self.copy.pk)] * 3 + [lambda: mark_maintenance(self.copy.pk)] * 3)
+        self.copy.refresh_from_db()
+        # Exactly one return; maintenance can only win after it.
+        self.assertEqual(outcomes[:3].count('ok'), 1)
+        self.assertLessEqual(outcomes[3:].count('ok'), 1)
+        self.assertEqual(self.copy.status, 'm' if 'ok' in outcomes[3:] else 'a')
+        self.assertIsNone(self.copy.borrower)
@@ -0,0 +1,323 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.management.commands.load_countries import countries
+from catalog.models import Country
+
+
+class LoadCountriesCommandTest(TestCase):
+    def call(self):
+        out = StringIO()
+        call_command('load_countries', stdout=out)
+        return out.getvalue()
+
+    def test_loads_all_countries(self):
+        output = self.call()
+        self.assertEqual(Country.objects.count(), len(countries))
+        self.assertIn(f'{len(countries)} added', output)
+
+    def test_is_idempotent(self):
+        self.call()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('load_countries', stdout=StringIO())
+        # Nothing to write: a single read of the existing rows (besides the savepoint).
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(Country.objects.count(), len(countries))
+
+    def test_renames_changed_country(self):
+        Country.objects.create(name='Old Canada', code='CAN')
+        output = self.call()
+        self.assertEqual(Country.objects.get(code='CAN').name, 'Canada')
+        self.assertIn('1 renamed', output)
+        self.assertEqual(Country.objects.count(), len(countries))
+
+    def test_reports_rows_skipped_on_a_name_conflict(self):
+        Country.objects.create(name='Canada', code='XCA')
+        output = self.call()
+        self.assertFalse(Country.objects.filter(code='CAN').exists())
+        self.assertIn(f'{len(countries) - 1} added', output)
+        self.assertIn('1 skipped', output)
+
+    def test_skips_renames_to_a_name_used_by_another_code(self):
+        Country.objects.create(name='Old Canada', code='CAN')
+        Country.objects.create(name='Canada', code='XCA')
+        output = self.call()
+        self.assertEqual(Country.objects.get(code='CAN').name, 'Old Canada')
+        self.assertIn('0 renamed', output)
+        self.assertIn('1 skipped', output)
+        self.assertEqual(Country.objects.count(), len(countries) + 1)
+
+
+import json
+import os
+import tempfile
+
+from django.core.management.base import CommandError
+
+from catalog import autocomplete
+from catalog.caching import CATALOG_VERSION_KEY, get_version
+from catalog.models import Author, Book, BookInstance, Genre, Hold, Language
+from catalog.stats import get_index_stats
+
+
+class ImportCatalogCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Country.objects.create(name='Canada', code='CAN')
+        Genre.objects.create(name='Fantasy')
+
+    def write(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def call(self, path, *args):
+        out = StringIO()
+        call_command('import_catalog', path, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        path = self.write('.csv', (
+            'title,isbn,summary,author_first_name,author_last_name,author_country,language,genre,imprint,copies,status\n'
+            'Book One,ISBN1,Summary,John,Smith,CAN,English,fantasy;Horror,Imprint,3,a\n'
+            'Book Two,ISBN2,Summary,John,Smith,CAN,english,Horror,Imprint,1,\n'
+            'Book Three,ISBN3,Summary,Jane,Doe,,French,,Imprint,0,\n'
+        ))
+        output = self.call(path, '--batch-size', '2')
+
+        self.assertIn('Imported 3 books and 4 copies from 3 records', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Author.objects.get(last_name='Smith').country.code, 'CAN')
+        self.assertEqual(Language.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 2)
+
+        book = Book.objects.get(isbn='ISBN1')
+        self.assertEqual(sorted(genre.name for genre in book.genre.all()), ['Fantasy', 'Horror'])
+        self.assertEqual(book.bookinstance_set.filter(status='a').count(), 3)
+        self.assertEqual(Book.objects.get(isbn='ISBN2').bookinstance_set.get().status, 'm')
+        self.assertEqual((book.num_copies, book.num_available, book.num_on_loan), (3, 3, 0))
+        self.assertEqual(Book.objects.get(isbn='ISBN2').num_copies, 1)
+
+    def test_import_jsonl_skips_existing_isbns(self):
+        record = {'title': 'Book One', 'isbn': 'ISBN1', 'author_last_name': 'Smith', 'genre': ['Fantasy'], 'copies': 2}
+        path = self.write('.jsonl', '\n'.join(json.dumps(record) for _ in range(3)) + '\n')
+        self.call(path)
+        self.call(path)
+
+        self.assertEqual(Book.objects.count(), 1)
+        self.assertEqual(BookInstance.objects.count(), 2)
+        self.assertEqual(Author.objects.count(), 1)
+
+    def test_bad_record_still_expires_the_caches_for_committed_batches(self):
+        path = self.write('.csv', (
+            'title,isbn,author_last_name,copies,status\n'
+            'Book One,ISBN1,Smith,1,a\n'
+            'Book Two,ISBN2,Smith,1,a\n'
+            'Book Three,ISBN3,Smith,1,lost\n'
+        ))
+        self.assertEqual(get_index_stats()['num_books'], 0)
+        version = get_version(CATALOG_VERSION_KEY)
+        self.assertEqual(autocomplete.suggest('book'), [])
+        self.addCleanup(autocomplete.reset_index)
+
+        with self.assertRaisesMessage(CommandError, 'Bad input after record 2'):
+            self.call(path, '--batch-size', '2')
+
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(get_index_stats()['num_books'], 2)
+        self.assertNotEqual(get_version(CATALOG_VERSION_KEY), version)
+        self.assertEqual(len(autocomplete.suggest('book')), 2)
+
+
+from django.contrib.auth import get_user_model
+
+
+class SeedLibraryCommandTest(TestCase):
+    def seed(self, seed=7):
+        call_command(
+            'seed_library', '--books', '30', '--copies-per-book', '4', '--authors', '5', '--users', '6',
+            '--seed', str(seed), stdout=StringIO(),
+        )
+
+    def test_creates_requested_volumes(self):
+        self.seed()
+        self.assertEqual(Book.objects.count(), 30)
+        self.assertEqual(Author.objects.count(), 5)
+        self.assertEqual(get_user_model().objects.count(), 6)
+        self.assertGreaterEqual(BookInstance.objects.count(), 30)
+        self.assertTrue(all(book.genre.exists() for book in Book.objects.all()))
+        # Copies on loan always have a borrower and a due date.
+        self.assertFalse(BookInstance.objects.filter(status='o', borrower__isnull=True).exists())
+        self.assertFalse(BookInstance.objects.filter(status='o', due_back__isnull=True).exists())
+        for book in Book.objects.all():
+            self.assertEqual(book.num_copies, book.bookinstance_set.count())
+            self.assertEqual(book.num_on_loan, book.bookinstance_set.filter(status='o').count())
+
+    def test_is_deterministic(self):
+        self.seed()
+        first = list(BookInstance.objects.order_by('id').values_list('id', 'book__isbn', 'status'))
+        BookInstance.objects.all().delete()
+        Book.objects.all().delete()
+        Author.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self.seed()
+        self.assertEqual(list(BookInstance.objects.order_by('id').values_list('id', 'book__isbn', 'status')), first)
+
+
+class BenchmarkViewsCommandTest(TestCase):
+    def test_writes_results_for_every_view(self):
+        call_command('seed_library', '--books', '5', '--authors', '2', '--users', '3', stdout=StringIO())
+        output = os.path.join(tempfile.mkdtemp(), 'bench.json')
+        self.addCleanup(os.remove, output)
+
+        call_command('benchmark_views', '--requests', '2', '--warmup', '0', '--output', output, stdout=StringIO())
+
+        with open(output, encoding='utf-8') as stream:
+            report = json.load(stream)
+        names = [result['name'] for result in report['results']]
+        self.assertIn('index', names)
+        self.assertIn('renew-book-librarian-post', names)
+        for result in report['results']:
+            self.assertLess(result['status'], 400, result['name'])
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(report['meta']['rows']['books'], 5)
+        # The views are timed, not the caches in front of them.
+        self.assertFalse(report['meta']['cached'])
+        for result in report['results']:
+            self.assertGreater(result['queries'], 0, result['name'])
+        # The benchmark rolls back everything it wrote.
+        self.assertFalse(get_user_model().objects.filter(username='benchmark-librarian').exists())
+
+
+
+class BenchmarkSearchCommandTest(TestCase):
+    def test_reports_every_method(self):
+        call_command('seed_library', '--books', '20', '--authors', '2', '--users', '3', stdout=StringIO())
+        out = StringIO()
+        call_command('benchmark_search', '--queries', '5', stdout=out)
+        for name in ('icontains', 'full-text', 'fuzzy'):
+            self.assertIn(name, out.getvalue())
+
+
+
+class RecountAvailabilityCommandTest(TestCase):
+    def test_rebuilds_the_counts(self):
+        call_command('seed_library', '--books', '12', '--authors', '2', '--users', '3', stdout=StringIO())
+        expected = list(Book.objects.order_by('pk').values_list('num_copies', 'num_available', 'num_on_loan', 'next_due_back'))
+        Book.objects.update(num_copies=0, num_available=99, num_on_loan=0, next_due_back=None)
+
+        out = StringIO()
+        call_command('recount_availability', '--batch-size', '5', stdout=out)
+        self.assertIn('Recounted the copies of 12 books', out.getvalue())
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('num_copies', 'num_available', 'num_on_loan', 'next_due_back')),
+            expected,
+        )
+
+
+class RebalanceHoldsCommandTest(TestCase):
+    def test_reserves_available_copies(self):
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+        BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        Hold.objects.create(book=book, patron=get_user_model().objects.create_user(username='reader'))
+
+        out = StringIO()
+        call_command('rebalance_holds', stdout=out)
+        self.assertIn('Reserved copies for 1 holds', out.getvalue())
+        self.assertEqual(Hold.objects.get().status, 'r')
+
+
+import datetime
+
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+
+class PurgeSessionsCommandTest(TestCase):
+    def test_deletes_only_expired_sessions(self):
+        for number in range(7):
+            session = SessionStore()
+            session['number'] = number
+            session.create()
+        Session.objects.filter(pk__in=list(Session.objects.values_list('pk', flat=True)[:5])).update(
+            expire_date=timezone.now() - datetime.timedelta(days=1),
+        )
+
+        out = StringIO()
+        call_command('purge_sessions', '--batch-size', '2', stdout=out)
+
+        self.assertIn('Deleted 5 expired sessions', out.getvalue())
+        self.assertEqual(Session.objects.count(), 2)
+
+
+from django.core import mail
+
+
+class SweepOverdueCommandTest(TestCase):
+    def test_records_and_notifies(self):
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+        reader = get_user_model().objects.create_user(username='reader', email='reader@example.com')
+        BookInstance.objects.create(
+            book=book, imprint='Imprint', status='o', borrower=reader, due_back=datetime.date(2000, 1, 1),
+        )
+
+        out = StringIO()
+        call_command('sweep_overdue', '--notify', stdout=out)
+        self.assertIn('Recorded 1 overdue loans', out.getvalue())
+        self.assertIn('Emailed 1 borrowers about 1 overdue loans', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+from catalog.circulation import checkout, return_copy
+from catalog.models import LoanEvent, LoanEventArchive, LoanLeader, LoanRollup
+
+
+class LoanHistoryCommandsTest(TestCase):
+    def test_rollup_and_archive(self):
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+        copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        checkout(copy.pk, get_user_model().objects.create_user(username='reader'))
+        return_copy(copy.pk)
+        LoanEvent.objects.update(occurred=timezone.now() - datetime.timedelta(days=400))
+
+        out = StringIO()
+        call_command('rollup_loans', stdout=out)
+        self.assertIn('Rolled up 2 checkouts, renewals and returns', out.getvalue())
+        self.assertEqual(LoanRollup.objects.filter(period='m', dimension='book').get().checkouts, 1)
+
+        call_command('archive_loan_history', '--months', '12', stdout=out)
+        self.assertIn('Archived 2 events', out.getvalue())
+        self.assertEqual(LoanEventArchive.objects.count(), 2)
+
+    def test_refresh_dashboard(self):
+        book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+        copy = BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+        checkout(copy.pk, get_user_model().objects.create_user(username='reader'))
+        LoanEvent.objects.update(occurred=timezone.now() - datetime.timedelta(hours=1))
+
+        out = StringIO()
+        call_command('refresh_dashboard', stdout=out)
+        self.assertIn('Counted 1 new events', out.getvalue())
+        self.assertEqual(list(LoanLeader.objects.values_list('dimension', 'name', 'checkouts')), [('book', 'Book', 1)])
+
+    def test_update_recommendations(self):
+        books = [Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'ISBN{n}') for n in range(2)]
+        reader = get_user_model().objects.create_user(username='reader')
+        for book in books:
+            checkout(BookInstance.objects.create(book=book, imprint='Imprint', status='a').pk, reader)
+        LoanEvent.objects.update(occurred=timezone.now() - datetime.timedelta(hours=1))
+
+        out = StringIO()
+        call_command('update_recommendations', stdout=out)
+        self.assertIn('Added 2 readers and rebuilt 2 lists', out.getvalue())
+        self.assertEqual(books[0].also_borrowed.get().other, books[1])
+
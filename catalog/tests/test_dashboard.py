@@ -0,0 +1,89 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog.circulation import batch
+from catalog.dashboard import LEADERS, WINDOW_DAYS, dashboard, refresh
+from catalog.models import Book, BookInstance, Genre, LoanEvent, LoanLeader, Watermark
+
+User = get_user_model()
+
+
+class DashboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader', password='1X<ISRUkw+tuK')
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.genre = Genre.objects.create(name='Fantasy')
+        cls.books = []
+        for n in range(3):
+            book = Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'ISBN{n}')
+            book.genre.set([cls.genre])
+            cls.books.append(book)
+
+    def lend(self, book, copies, days_ago=1):
+        """ Check out `copies` new copies of `book`, dated `days_ago` days back. """
+        ids = [BookInstance.objects.create(book=book, imprint='Imprint', status='a').pk for n in range(copies)]
+        batch('checkout', ids, borrower=self.reader)
+        LoanEvent.objects.filter(copy__in=ids).update(occurred=timezone.now() - datetime.timedelta(days=days_ago))
+        return ids
+
+    def test_refresh_ranks_recent_checkouts(self):
+        self.lend(self.books[0], 1)
+        self.lend(self.books[1], 3)
+        # Outside the window.
+        self.lend(self.books[2], 5, days_ago=WINDOW_DAYS + 5)
+
+        self.assertEqual(refresh(), 9)
+        self.assertEqual(
+            list(LoanLeader.objects.filter(dimension='book').values_list('rank', 'key', 'name', 'checkouts')),
+            [(1, self.books[1].pk, 'Book 1', 3), (2, self.books[0].pk, 'Book 0', 1)],
+        )
+        self.assertEqual(
+            list(LoanLeader.objects.filter(dimension='genre').values_list('name', 'checkouts')), [('Fantasy', 4)],
+        )
+        self.assertTrue(Watermark.objects.filter(name='dashboard').exists())
+
+        # Rebuilt, not added to, on the next run.
+        self.lend(self.books[0], 3)
+        self.assertEqual(refresh(), 3)
+        self.assertEqual(
+            list(LoanLeader.objects.filter(dimension='book').values_list('name', 'checkouts')),
+            [('Book 0', 4), ('Book 1', 3)],
+        )
+        self.assertLessEqual(LoanLeader.objects.filter(dimension='book').count(), LEADERS)
+
+    def test_dashboard_reads_the_rollups(self):
+        copies = self.lend(self.books[0], 2, days_ago=3)
+        batch('return', copies)
+        LoanEvent.objects.filter(action='a').update(occurred=timezone.now() - datetime.timedelta(hours=1))
+        refresh()
+
+        context = dashboard()
+        self.assertEqual(len(context['days']), WINDOW_DAYS)
+        self.assertEqual(context['days'][-1]['rollup'].start, timezone.localdate())
+        self.assertEqual(context['window_checkouts'], 2)
+        self.assertEqual([day['percent'] for day in context['days'] if day['percent']], [100])
+        self.assertEqual(context['average_loan_days'], 3)
+        self.assertEqual([leader.name for leader in context['top_books']], ['Book 0'])
+
+    def test_view(self):
+        dashboard_url = reverse('circulation-dashboard')
+        self.assertRedirects(self.client.get(dashboard_url), f'/accounts/login/?next={dashboard_url}')
+        self.client.login(username='reader', password='1X<ISRUkw+tuK')
+        self.assertEqual(self.client.get(dashboard_url).status_code, 403)
+
+        self.lend(self.books[1], 2)
+        refresh()
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(dashboard_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/circulation_dashboard.html')
+        self.assertContains(response, 'Book 1</a> (2)')
+        self.assertContains(response, 'Fantasy (2)')
+        self.assertContains(response, 'Last refreshed')
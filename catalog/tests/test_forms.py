@@ -3,7 +3,11 @@ import datetime
 from django.test import TestCase
 from django.utils import timezone
 
-from catalog.forms import RenewBookForm
+import uuid
+
+from django.contrib.auth import get_user_model
+
+from catalog.forms import BatchCirculationForm, RenewBookForm, RenewBookModelForm
 
 class RenewBookFormTest(TestCase):
     def test_renew_form_date_field_label(self):
@@ -33,3 +37,48 @@ class RenewBookFormTest(TestCase):
         date = timezone.localtime() + datetime.timedelta(weeks=4)
         form = RenewBookForm(data={'renewal_date': date})
         self.assertTrue(form.is_valid())
+
+
+class BatchCirculationFormTest(TestCase):
+    def test_parses_copy_ids(self):
+        ids = [uuid.uuid4() for n in range(3)]
+        form = BatchCirculationForm(data={'action': 'return', 'copies': f'{ids[0]}\n{ids[1]}, {ids[2]}\n'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['copies'], ids)
+
+    def test_rejects_invalid_copy_ids(self):
+        form = BatchCirculationForm(data={'action': 'return', 'copies': f'{uuid.uuid4()} not-an-id'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('not-an-id', form.errors['copies'][0])
+
+    def test_rejects_too_many_copies(self):
+        copies = ' '.join(str(uuid.uuid4()) for n in range(BatchCirculationForm.MAX_COPIES + 1))
+        form = BatchCirculationForm(data={'action': 'return', 'copies': copies})
+        self.assertFalse(form.is_valid())
+
+    def test_due_date_rules_match_renewal_form(self):
+        for days in (-1, 0, 28, 29):
+            date = datetime.date.today() + datetime.timedelta(days=days)
+            batch_form = BatchCirculationForm(data={'action': 'renew', 'copies': str(uuid.uuid4()), 'due_back': date})
+            renew_form = RenewBookModelForm(data={'due_back': date})
+            self.assertEqual(batch_form.is_valid(), renew_form.is_valid(), days)
+            self.assertEqual(batch_form.errors.get('due_back'), renew_form.errors.get('due_back'), days)
+
+    def test_renewal_needs_due_date(self):
+        form = BatchCirculationForm(data={'action': 'renew', 'copies': str(uuid.uuid4())})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['due_back'], ['This field cannot be empty.'])
+
+    def test_checkout_needs_known_borrower(self):
+        form = BatchCirculationForm(data={'action': 'checkout', 'copies': str(uuid.uuid4())})
+        self.assertFalse(form.is_valid())
+        self.assertIn('borrower', form.errors)
+
+        form = BatchCirculationForm(data={'action': 'checkout', 'copies': str(uuid.uuid4()), 'borrower': 'nobody'})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['borrower'], ['No user with this username.'])
+
+        user = get_user_model().objects.create_user(username='reader')
+        form = BatchCirculationForm(data={'action': 'checkout', 'copies': str(uuid.uuid4()), 'borrower': 'reader'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['borrower'], user)
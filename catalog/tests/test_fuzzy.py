@@ -0,0 +1,77 @@
+from django.test import TestCase
+
+from catalog import fuzzy
+from catalog.caching import bump_version
+from catalog.fuzzy import TrigramIndex, edit_distance, trigrams
+from catalog.models import Author, Book
+
+
+class TrigramIndexTest(TestCase):
+    def setUp(self):
+        self.index = TrigramIndex()
+        for pk, title in enumerate(['The Lord of the Rings', 'The Lord of the Flies', 'Lords and Ladies', 'Dune'], 1):
+            self.index.add(pk, title)
+
+    def test_trigrams_and_edit_distance(self):
+        self.assertEqual(trigrams('dune'), {'  d', ' du', 'dun', 'une', 'ne '})
+        self.assertEqual(edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(edit_distance('', 'abc'), 3)
+
+    def test_finds_misspelled_titles(self):
+        self.assertEqual(self.index.search('lord of the rigns')[0], 1)
+        self.assertEqual(self.index.search('the lrod of the flys')[0], 2)
+        self.assertEqual(self.index.search('dunne'), [4])
+        self.assertEqual(self.index.search('zzz'), [])
+
+    def test_books_sharing_a_title_are_all_returned(self):
+        self.index.add(5, 'DUNE')
+        self.assertEqual(sorted(self.index.search('dun')), [4, 5])
+        self.assertEqual(len(self.index), 4)
+
+    def test_remove_and_rename(self):
+        self.index.remove(4)
+        self.assertEqual(self.index.search('dune'), [])
+        self.index.add(1, 'Dune Messiah')
+        self.assertEqual(self.index.search('lord of the rings')[0], 2)
+        self.assertEqual(self.index.search('dune mesiah'), [1])
+
+
+class BookSearchFallbackTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = Author.objects.create(first_name='Frank', last_name='Herbert')
+        cls.book = Book.objects.create(title='Dune Messiah', summary='Summary', isbn='ISBN', author=author)
+
+    def setUp(self):
+        fuzzy.reset_index()
+        self.addCleanup(fuzzy.reset_index)
+
+    def test_misspelled_search_falls_back_to_fuzzy_matches(self):
+        response = self.client.get('/catalog/search/', {'q': 'dnue mesiah'})
+        self.assertTrue(response.context['fuzzy'])
+        self.assertEqual(list(response.context['book_list']), [self.book])
+        self.assertContains(response, 'Did you mean')
+
+    def test_full_text_hits_skip_the_fallback(self):
+        response = self.client.get('/catalog/search/', {'q': 'messiah'})
+        self.assertFalse(response.context['fuzzy'])
+        self.assertEqual(list(response.context['book_list']), [self.book])
+
+    def test_index_follows_saves(self):
+        self.client.get('/catalog/search/', {'q': 'xx'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'Children of Dune'
+            self.book.save()
+        self.assertEqual(fuzzy.fuzzy_search('chidlren of dune'), [self.book])
+
+    def test_rebuilds_after_changes_in_another_process(self):
+        fuzzy.get_index()
+        Book.objects.filter(pk=self.book.pk).update(title='Children of Dune')
+        bump_version(fuzzy.TITLES_VERSION_KEY)
+        self.assertEqual(fuzzy.fuzzy_search('chidlren of dune'), [self.book])
+
+    def test_long_queries_are_cut_short(self):
+        query = 'dnue mesiah ' + 'x' * 100_000
+        self.assertEqual(fuzzy.fuzzy_search(query), [self.book])
+        response = self.client.get('/catalog/search/', {'q': query})
+        self.assertEqual(list(response.context['book_list']), [self.book])
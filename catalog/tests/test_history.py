@@ -0,0 +1,141 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalog.circulation import CirculationConflict, batch, checkout, renew, return_copy
+from catalog.history import archive, loan_totals, months_ago, roll_up
+from catalog.models import Book, BookInstance, Genre, Language, LoanEvent, LoanEventArchive, LoanRollup, Watermark
+
+User = get_user_model()
+
+
+class LoanHistoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.language = Language.objects.create(name='English')
+        cls.genres = [Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Poetry')]
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN', language=cls.language)
+        cls.book.genre.set(cls.genres)
+
+    def setUp(self):
+        self.copies = [BookInstance.objects.create(book=self.book, imprint='Imprint', status='a').pk for n in range(3)]
+
+    def settle(self, when=None):
+        """ Date every event back, past the time roll_up() waits for. """
+        LoanEvent.objects.update(occurred=when or timezone.now() - datetime.timedelta(hours=1))
+
+    def test_records_every_change(self):
+        due = datetime.date.today() + datetime.timedelta(days=7)
+        later = due + datetime.timedelta(days=7)
+        checkout(self.copies[0], self.reader, due)
+        renew(self.copies[0], later)
+        return_copy(self.copies[0])
+        self.assertEqual(
+            list(LoanEvent.objects.order_by('pk').values_list('action', 'copy', 'book', 'borrower', 'due_back')),
+            [
+                ('o', self.copies[0], self.book.pk, self.reader.pk, due),
+                ('n', self.copies[0], self.book.pk, self.reader.pk, later),
+                # A return keeps the loan's borrower and due date.
+                ('a', self.copies[0], self.book.pk, self.reader.pk, later),
+            ],
+        )
+
+    def test_conflicts_record_nothing(self):
+        with self.assertRaises(CirculationConflict):
+            return_copy(self.copies[0])
+        self.assertFalse(LoanEvent.objects.exists())
+
+    def test_batch_records_with_one_statement(self):
+        with CaptureQueriesContext(connection) as captured:
+            batch('checkout', self.copies, borrower=self.reader)
+        inserts = [query for query in captured if query['sql'].startswith('INSERT INTO "catalog_loanevent"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(LoanEvent.objects.filter(action='o', borrower=self.reader).count(), 3)
+
+    def test_rollups(self):
+        batch('checkout', self.copies, borrower=self.reader)
+        batch('return', self.copies[:2])
+        # Too recent to be rolled up yet.
+        self.assertEqual(roll_up(), 0)
+
+        self.settle()
+        self.assertEqual(roll_up(batch_size=2), 5)
+        today = timezone.localdate()
+        for period, start in (('d', today), ('m', today.replace(day=1))):
+            for dimension, key in [('book', self.book.pk), ('language', self.language.pk)] + [
+                ('genre', genre.pk) for genre in self.genres
+            ]:
+                rollup = LoanRollup.objects.get(period=period, dimension=dimension, key=key)
+                self.assertEqual((rollup.start, rollup.checkouts, rollup.returns), (start, 3, 2))
+
+        # Only new events are counted, added to the existing rows.
+        self.assertEqual(roll_up(), 0)
+        return_copy(self.copies[2])
+        self.settle()
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(roll_up(), 1)
+        self.assertTrue(all('catalog_loanevent' not in query['sql'] or 'WHERE' in query['sql'] for query in captured))
+        self.assertEqual(LoanRollup.objects.get(period='m', dimension='book').returns, 3)
+        self.assertEqual(
+            list(loan_totals('genre')), [
+                {'key': genre.pk, 'checkouts': 3, 'renewals': 0, 'returns': 3} for genre in self.genres
+            ],
+        )
+
+    def test_library_totals_and_loan_length(self):
+        batch('checkout', self.copies, borrower=self.reader)
+        LoanEvent.objects.update(occurred=timezone.now() - datetime.timedelta(days=5))
+        batch('return', self.copies[:2])
+        self.settle(timezone.now() - datetime.timedelta(hours=1))
+        LoanEvent.objects.filter(action='o').update(occurred=timezone.now() - datetime.timedelta(days=5))
+        roll_up()
+
+        today = timezone.localdate()
+        library = LoanRollup.objects.get(period='d', dimension='library', start=today)
+        self.assertEqual(
+            (library.key, library.returns, library.loan_days, library.returns_timed, library.average_loan_days()),
+            (0, 2, 10, 2, 5),
+        )
+        # The checkouts are counted on the day they happened.
+        checked_out = LoanRollup.objects.get(
+            period='d', dimension='library', start=timezone.localdate(timezone.now() - datetime.timedelta(days=5)),
+        )
+        self.assertEqual((checked_out.checkouts, checked_out.average_loan_days()), (3, None))
+
+    def test_archives_closed_events(self):
+        batch('checkout', self.copies, borrower=self.reader)
+        batch('return', self.copies[:2])
+        old = timezone.now() - datetime.timedelta(days=400)
+        self.settle(old)
+        # Not rolled up yet, so nothing can move.
+        self.assertEqual(archive(months_ago(12)), 0)
+
+        roll_up()
+        self.assertEqual(archive(months_ago(12), batch_size=2), 4)
+        # The checkout of the copy still on loan stays.
+        self.assertEqual(list(LoanEvent.objects.values_list('copy', 'action')), [(self.copies[2], 'o')])
+
+        # Once returned it can move, but the recent return stays.
+        return_copy(self.copies[2])
+        roll_up()
+        self.assertEqual(archive(months_ago(12)), 1)
+        self.assertEqual(list(LoanEvent.objects.values_list('copy', 'action')), [(self.copies[2], 'a')])
+        self.assertEqual(
+            set(LoanEventArchive.objects.values_list('copy_id', 'book_id', 'borrower_id', 'action', 'day')),
+            {
+                (copy, self.book.pk, self.reader.pk, action, timezone.localdate(old))
+                for copy in self.copies[:2] for action in ('o', 'a')
+            } | {(self.copies[2], self.book.pk, self.reader.pk, 'o', timezone.localdate(old))},
+        )
+        # The rollups are untouched.
+        self.assertEqual(LoanRollup.objects.get(period='m', dimension='book').checkouts, 3)
+
+    def test_months_ago(self):
+        self.assertEqual(months_ago(0, datetime.date(2024, 3, 15)).date(), datetime.date(2024, 3, 1))
+        self.assertEqual(months_ago(14, datetime.date(2024, 3, 15)).date(), datetime.date(2023, 1, 1))
+        self.assertFalse(Watermark.objects.exists())
@@ -0,0 +1,219 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from catalog.caching import copies_version_key, get_version
+from catalog.circulation import batch, checkout, collect_hold, complete_maintenance, mark_maintenance, return_copy
+from catalog.holds import allocate, cancel_hold, place_hold, rebalance
+from catalog.models import Book, BookInstance, Hold
+
+User = get_user_model()
+
+
+class HoldQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [User.objects.create_user(username=f'reader{n}') for n in range(4)]
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN')
+
+    def setUp(self):
+        self.copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+
+    def refresh(self):
+        self.copy.refresh_from_db()
+        self.book.refresh_from_db()
+
+    def test_available_copy_is_reserved_when_the_hold_is_placed(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        self.refresh()
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copy.pk))
+        self.assertEqual(self.copy.status, 'r')
+        self.assertEqual(self.book.num_available, 0)
+
+        # Placing it again returns the open hold.
+        self.assertEqual(place_hold(self.book.pk, self.readers[0]), hold)
+
+    def test_returned_copy_goes_to_the_oldest_hold(self):
+        checkout(self.copy.pk, self.readers[3])
+        holds = [place_hold(self.book.pk, reader) for reader in self.readers[:3]]
+        self.assertEqual({hold.status for hold in holds}, {'w'})
+
+        return_copy(self.copy.pk)
+        self.refresh()
+        self.assertEqual(self.copy.status, 'r')
+        self.assertEqual(
+            list(Hold.objects.order_by('placed', 'id').values_list('status', 'copy')),
+            [('r', self.copy.pk), ('w', None), ('w', None)],
+        )
+
+        # Collecting lends the copy to the reader; the next return goes to the next hold.
+        collect_hold(holds[0].pk)
+        self.refresh()
+        self.assertEqual((self.copy.status, self.copy.borrower), ('o', self.readers[0]))
+        self.assertEqual(Hold.objects.get(pk=holds[0].pk).status, 'f')
+        return_copy(self.copy.pk)
+        self.assertEqual(Hold.objects.get(pk=holds[1].pk).status, 'r')
+
+    def test_copy_back_from_maintenance_is_reserved(self):
+        mark_maintenance(self.copy.pk)
+        hold = place_hold(self.book.pk, self.readers[0])
+        self.assertEqual(hold.status, 'w')
+        complete_maintenance(self.copy.pk)
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id), ('r', self.copy.pk))
+
+    def test_reserved_copy_sent_to_maintenance_releases_its_hold(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        mark_maintenance(self.copy.pk)
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id, hold.allocated), ('w', None, None))
+        with self.assertRaises(Hold.DoesNotExist):
+            collect_hold(hold.pk)
+
+        # Back from maintenance, the copy goes to the same hold, not to a second one as well.
+        later = place_hold(self.book.pk, self.readers[1])
+        complete_maintenance(self.copy.pk)
+        self.assertEqual(
+            list(Hold.objects.order_by('placed', 'id').values_list('pk', 'status', 'copy')),
+            [(hold.pk, 'r', self.copy.pk), (later.pk, 'w', None)],
+        )
+
+    def test_released_hold_gets_another_available_copy(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        other = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        mark_maintenance(self.copy.pk)
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id), ('r', other.pk))
+        self.assertEqual(BookInstance.objects.get(pk=other.pk).status, 'r')
+
+    def test_deleting_a_reserved_copy_requeues_its_hold(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        other = BookInstance.objects.create(book=self.book, imprint='Imprint', status='m')
+        self.copy.delete()
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.copy_id, hold.allocated), ('w', None, None))
+
+        # The reader keeps their place, and gets the next copy available.
+        self.assertEqual(place_hold(self.book.pk, self.readers[0]), hold)
+        complete_maintenance(other.pk)
+        self.assertEqual(Hold.objects.get(pk=hold.pk).copy_id, other.pk)
+
+        # Collected holds keep the copy they were given until it goes.
+        collect_hold(hold.pk)
+        other.delete()
+        self.assertEqual(Hold.objects.filter(pk=hold.pk).values_list('status', 'copy').get(), ('f', None))
+
+    def test_deleted_reserved_copy_is_replaced_by_an_available_one(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        other = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        self.copy.delete()
+        self.assertEqual(Hold.objects.filter(pk=hold.pk).values_list('status', 'copy').get(), ('r', other.pk))
+
+    def test_rebalance_requeues_holds_without_a_copy(self):
+        hold = place_hold(self.book.pk, self.readers[0])
+        # As left behind by deleting the copy before holds were requeued.
+        Hold.objects.filter(pk=hold.pk).update(copy=None)
+        BookInstance.objects.filter(pk=self.copy.pk).update(status='a')
+        self.assertEqual(rebalance(), 1)
+        self.assertEqual(Hold.objects.filter(pk=hold.pk).values_list('status', 'copy').get(), ('r', self.copy.pk))
+
+    def test_cancelling_a_ready_hold_passes_the_copy_on(self):
+        first = place_hold(self.book.pk, self.readers[0])
+        second = place_hold(self.book.pk, self.readers[1])
+        cancel_hold(first.pk)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, 'c')
+        self.assertEqual((second.status, second.copy_id), ('r', self.copy.pk))
+
+        cancel_hold(second.pk)
+        self.refresh()
+        self.assertEqual(self.copy.status, 'a')
+        self.assertEqual(self.book.num_available, 1)
+
+    def test_finds_the_oldest_hold_with_one_lookup(self):
+        mark_maintenance(self.copy.pk)
+        other = Book.objects.create(title='Other', summary='Summary', isbn='ISBN2')
+        now = timezone.now()
+        Hold.objects.bulk_create(
+            [Hold(book=other, patron=self.readers[0], status='f', placed=now) for n in range(50)]
+            + [Hold(book=self.book, patron=reader, placed=now - datetime.timedelta(minutes=n)) for n, reader in enumerate(self.readers)]
+        )
+        BookInstance.objects.filter(pk=self.copy.pk).update(status='a')
+        with CaptureQueriesContext(connection) as captured:
+            hold_id = allocate(self.copy.pk)
+        self.assertEqual(Hold.objects.get(pk=hold_id).patron, self.readers[3])
+        lookups = [query['sql'] for query in captured if 'FROM "catalog_hold"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertIn('LIMIT 1', lookups[0])
+
+
+class RebalanceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [User.objects.create_user(username=f'reader{n}') for n in range(5)]
+        cls.books = [Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'ISBN{n}') for n in range(3)]
+
+    def add_copies(self, book, count, status='a'):
+        return [BookInstance.objects.create(book=book, imprint='Imprint', status=status).pk for n in range(count)]
+
+    def wait(self, book, readers):
+        """ Queue `readers` for `book`, oldest first, without reserving anything. """
+        now = timezone.now()
+        Hold.objects.bulk_create([
+            Hold(book=book, patron=reader, placed=now + datetime.timedelta(minutes=n)) for n, reader in enumerate(readers)
+        ])
+
+    def test_pairs_copies_with_the_oldest_holds(self):
+        self.add_copies(self.books[0], 2)
+        self.add_copies(self.books[1], 3)
+        self.add_copies(self.books[2], 1)
+        self.wait(self.books[0], self.readers[:4])
+        self.wait(self.books[1], self.readers[:1])
+
+        self.assertEqual(rebalance(batch_size=1), 3)
+        self.assertEqual(
+            list(Hold.objects.filter(book=self.books[0]).order_by('placed').values_list('status', flat=True)),
+            ['r', 'r', 'w', 'w'],
+        )
+        self.assertEqual(Hold.objects.get(book=self.books[1]).status, 'r')
+        self.assertEqual(
+            set(Hold.objects.filter(status='r').values_list('copy__book', flat=True)), {self.books[0].pk, self.books[1].pk},
+        )
+        self.assertEqual(
+            list(Book.objects.order_by('pk').values_list('num_available', flat=True)), [0, 2, 1],
+        )
+        self.assertEqual(rebalance(), 0)
+
+    def test_query_count_does_not_grow_with_the_books(self):
+        counts = set()
+        for book in self.books:
+            self.add_copies(book, 2)
+            self.wait(book, self.readers)
+            Hold.objects.filter(status='r').update(status='w', copy=None)
+            BookInstance.objects.update(status='a')
+            with CaptureQueriesContext(connection) as captured:
+                rebalance()
+            counts.add(len(captured))
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_cached_pages_expire_once_committed(self):
+        self.add_copies(self.books[0], 1, status='a')
+        self.wait(self.books[0], self.readers[:1])
+        key = copies_version_key(self.books[0].pk)
+        version = get_version(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(rebalance(), 1)
+            self.assertEqual(get_version(key), version)
+        self.assertNotEqual(get_version(key), version)
+
+    def test_batch_return_allocates(self):
+        copies = self.add_copies(self.books[0], 3, status='o')
+        self.wait(self.books[0], self.readers[:2])
+        batch('return', copies)
+        self.assertEqual(Hold.objects.filter(status='r').count(), 2)
+        self.assertEqual(BookInstance.objects.filter(status='a').count(), 1)
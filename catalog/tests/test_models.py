@@ -44,3 +44,56 @@ class AuthorModelTest(TestCase):
         # This will also fail if the urlconf is not defined
         self.assertEqual(author.get_absolute_url(), '/catalog/author/1')
 
+
+
+import datetime
+
+from catalog.availability import recount_books
+from catalog.models import Book, BookInstance
+
+
+class BookAvailabilityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title='Book', summary='Summary', isbn='ISBN1')
+        cls.other_book = Book.objects.create(title='Other', summary='Summary', isbn='ISBN2')
+
+    def counts(self, book=None):
+        book = Book.objects.get(pk=(book or self.book).pk)
+        return book.num_copies, book.num_available, book.num_on_loan, book.next_due_back
+
+    def test_counts_follow_copy_changes(self):
+        soon = datetime.date.today() + datetime.timedelta(days=3)
+        later = soon + datetime.timedelta(days=7)
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        BookInstance.objects.create(book=self.book, imprint='Imprint', status='o', due_back=later)
+        self.assertEqual(self.counts(), (2, 1, 1, later))
+
+        copy.status, copy.due_back = 'o', soon
+        copy.save()
+        self.assertEqual(self.counts(), (2, 0, 2, soon))
+
+        copy.due_back = later + datetime.timedelta(days=1)
+        copy.save(update_fields=['due_back'])
+        self.assertEqual(self.counts(), (2, 0, 2, later))
+
+        copy.delete()
+        self.assertEqual(self.counts(), (1, 0, 1, later))
+
+    def test_moving_a_copy_recounts_both_books(self):
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        copy = BookInstance.objects.get(pk=copy.pk)
+        copy.book = self.other_book
+        copy.save()
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+        self.assertEqual(self.counts(self.other_book), (1, 1, 0, None))
+
+    def test_recount_books_after_bulk_writes(self):
+        BookInstance.objects.bulk_create([
+            BookInstance(book=self.book, imprint='Imprint', status=status) for status in 'aamo'
+        ])
+        self.assertEqual(self.counts(), (0, 0, 0, None))
+        self.assertEqual(recount_books(batch_size=1), 2)
+        self.assertEqual(self.counts(), (4, 2, 1, None))
@@ -0,0 +1,76 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from catalog.overdue import notify, overdue_loans, sweep
+from catalog.models import Book, BookInstance, OverdueLoan
+
+User = get_user_model()
+
+
+class OverdueSweepTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [User.objects.create_user(username=f'reader{n}', email=f'reader{n}@example.com') for n in range(3)]
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ISBN')
+
+    def lend(self, reader, days_overdue, status='o'):
+        return BookInstance.objects.create(
+            book=self.book, imprint='Imprint', status=status, borrower=reader,
+            due_back=datetime.date.today() - datetime.timedelta(days=days_overdue),
+        )
+
+    def test_overdue_loans(self):
+        late = self.lend(self.readers[0], 1)
+        self.lend(self.readers[0], 0)
+        self.lend(self.readers[0], 5, status='m')
+        self.assertEqual(list(overdue_loans()), [late])
+
+    def test_records_each_loan_once_with_one_statement(self):
+        late = [self.lend(reader, 3) for reader in self.readers]
+        self.lend(self.readers[0], -1)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(sweep(), 3)
+        self.assertEqual(len(captured), 1)
+        self.assertTrue(captured[0]['sql'].startswith('INSERT INTO "catalog_overdueloan"'))
+        self.assertEqual(
+            set(OverdueLoan.objects.values_list('copy', 'borrower', 'due_back', 'recorded')),
+            {(copy.pk, copy.borrower_id, copy.due_back, datetime.date.today()) for copy in late},
+        )
+        self.assertEqual(sweep(), 0)
+
+        # A renewed loan that becomes overdue again is a new loan.
+        BookInstance.objects.filter(pk=late[0].pk).update(due_back=datetime.date.today() - datetime.timedelta(days=1))
+        self.assertEqual(sweep(), 1)
+
+    def test_notifies_each_borrower_once(self):
+        for reader in self.readers:
+            self.lend(reader, 2)
+            self.lend(reader, 4)
+        no_email = User.objects.create_user(username='noemail')
+        self.lend(no_email, 1)
+        sweep()
+
+        self.assertEqual(notify(chunk_size=2), (3, 7))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(mail.outbox[0].to, ['reader0@example.com'])
+        self.assertEqual(mail.outbox[0].body.count('Book Title'), 2)
+        self.assertFalse(OverdueLoan.objects.filter(notified__isnull=True).exists())
+
+        self.assertEqual(notify(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_notification_queries_do_not_grow_with_borrowers(self):
+        counts = set()
+        for reader in self.readers:
+            self.lend(reader, 2)
+            sweep()
+            OverdueLoan.objects.update(notified=None)
+            with CaptureQueriesContext(connection) as captured:
+                notify(chunk_size=10)
+            counts.add(len(captured))
+        self.assertEqual(len(counts), 1, counts)
@@ -0,0 +1,114 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from catalog import recommendations
+from catalog.history import archive, months_ago, roll_up
+from catalog.models import AlsoBorrowed, Author, Book, BookInstance, BookReader, CoBorrowing, LoanEvent
+from catalog.recommendations import NEIGHBOURS, update
+
+User = get_user_model()
+
+
+class RecommendationsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.readers = [User.objects.create_user(username=f'reader{n}') for n in range(3)]
+        author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.books = [
+            Book.objects.create(title=f'Book {n}', summary='Summary', isbn=f'ISBN{n}', author=author) for n in range(4)
+        ]
+        cls.copies = [BookInstance.objects.create(book=book, imprint='Imprint', status='a') for book in cls.books]
+
+    def setUp(self):
+        cache.clear()
+
+    def borrow(self, reader, *books, days_ago=1):
+        for book in books:
+            LoanEvent.objects.create(
+                copy=self.copies[book], book=self.books[book], borrower=self.readers[reader], action='o',
+                occurred=timezone.now() - datetime.timedelta(days=days_ago),
+            )
+
+    def neighbours(self, book):
+        return [
+            (self.books.index(neighbour.other), neighbour.borrowers)
+            for neighbour in AlsoBorrowed.objects.filter(book=self.books[book])
+        ]
+
+    def test_counts_readers_in_common(self):
+        self.borrow(0, 0, 1, 2)
+        self.borrow(1, 0, 1)
+        self.borrow(2, 0, 3)
+        # Borrowing a book again adds no reader.
+        self.borrow(1, 0)
+
+        self.assertEqual(update(batch_size=2), (7, 4))
+        self.assertEqual(BookReader.objects.count(), 7)
+        self.assertEqual(self.neighbours(0), [(1, 2), (2, 1), (3, 1)])
+        self.assertEqual(self.neighbours(1), [(0, 2), (2, 1)])
+        self.assertEqual(self.neighbours(3), [(0, 1)])
+        # Stored both ways round.
+        self.assertEqual(CoBorrowing.objects.count(), 8)
+
+    def test_updates_incrementally(self):
+        self.borrow(0, 0, 1)
+        update()
+        self.assertEqual(update(), (0, 0))
+
+        self.borrow(1, 0, 1, 3)
+        self.borrow(0, 1)
+        # Only the books the new readers touch are rebuilt.
+        self.assertEqual(update(), (3, 3))
+        self.assertEqual(self.neighbours(0), [(1, 2), (3, 1)])
+        self.assertEqual(self.neighbours(3), [(0, 1), (1, 1)])
+        self.assertFalse(AlsoBorrowed.objects.filter(book=self.books[2]).exists())
+
+    def test_lists_are_short(self):
+        books = [Book.objects.create(title=f'Other {n}', summary='Summary', isbn=f'OTHER{n}') for n in range(8)]
+        for book in books:
+            LoanEvent.objects.create(
+                copy=self.copies[0], book=book, borrower=self.readers[0], action='o',
+                occurred=timezone.now() - datetime.timedelta(days=1),
+            )
+        self.borrow(0, 0)
+        update()
+        self.assertEqual(AlsoBorrowed.objects.filter(book=self.books[0]).count(), NEIGHBOURS)
+
+    def test_pairs_only_recent_readings(self):
+        self.borrow(0, 0, 1, 2, 3)
+        with mock.patch.object(recommendations, 'RECENT_READINGS', 2):
+            self.assertEqual(update(batch_size=3), (4, 4))
+        # Book 3 was borrowed three books after book 0.
+        self.assertEqual(self.neighbours(0), [(1, 1), (2, 1)])
+        self.assertEqual(self.neighbours(3), [(1, 1), (2, 1)])
+        self.assertEqual(CoBorrowing.objects.count(), 10)
+
+    def test_first_run_reads_the_archive(self):
+        self.borrow(0, 0, 1, days_ago=400)
+        roll_up()
+        self.assertEqual(archive(months_ago(12)), 2)
+        self.borrow(1, 0, 1)
+        update()
+        self.assertEqual(self.neighbours(0), [(1, 2)])
+
+        # Once in use, events it has not read are not archived.
+        self.borrow(2, 0, 1, days_ago=400)
+        roll_up()
+        self.assertEqual(archive(months_ago(12)), 0)
+        update()
+        self.assertEqual(self.neighbours(0), [(1, 3)])
+
+    def test_book_page(self):
+        self.borrow(0, 0, 1)
+        url = reverse('book-detail', args=[self.books[0].pk])
+        self.assertNotContains(self.client.get(url), 'Readers also borrowed')
+        update()
+        response = self.client.get(url)
+        self.assertContains(response, 'Readers also borrowed')
+        self.assertContains(response, f'<a href="{self.books[1].get_absolute_url()}">Book 1</a>')
@@ -170,3 +170,734 @@ class LoanedBookInstancesByUserListViewTest(TestCase):
             else:
                 self.assertTrue(last_date <= book.due_back)
                 last_date = book.due_back
+
+
+import uuid
+from unittest import skipUnless
+
+from django.db import connection
+
+from catalog.pagination import KeysetPaginator
+
+
+class BookListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Create 23 books, some sharing a title and one without an author, for keyset pagination tests
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        other_author = Author.objects.create(first_name='Jane', last_name='Doe')
+        for book_id in range(23):
+            Book.objects.create(
+                title=f'Book {book_id % 8:02d}',
+                summary='My book summary',
+                isbn=f'ISBN{book_id:09d}',
+                author=None if book_id == 5 else (test_author if book_id % 2 else other_author),
+            )
+
+    def walk(self, url):
+        """ Follow the next cursors from `url` and return every page seen. """
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page_obj']
+            pages.append(page)
+            url = f"{reverse('books')}?cursor={page.next_cursor}" if page.has_next() else None
+        return pages
+
+    def test_first_page_uses_keyset_pagination(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_paginated'])
+        self.assertTrue(response.context['page_obj'].is_keyset)
+        self.assertFalse(response.context['page_obj'].has_previous())
+        self.assertEqual(len(response.context['book_list']), 10)
+
+    def test_cursor_walk_visits_every_book_once_in_order(self):
+        pages = self.walk(reverse('books'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 3])
+
+        seen = [book for page in pages for book in page]
+        expected = list(Book.objects.order_by('title', 'author_id', 'pk'))
+        self.assertEqual(len(seen), 23)
+        self.assertEqual({book.pk for book in seen}, {book.pk for book in expected})
+        titles = [book.title for book in seen]
+        self.assertEqual(titles, sorted(titles))
+
+    def test_previous_cursor_returns_previous_page(self):
+        pages = self.walk(reverse('books'))
+        response = self.client.get(f"{reverse('books')}?cursor={pages[2].previous_cursor}")
+        self.assertEqual(
+            [book.pk for book in response.context['book_list']],
+            [book.pk for book in pages[1]],
+        )
+        self.assertTrue(response.context['page_obj'].has_previous())
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('books') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_still_supported(self):
+        response = self.client.get(reverse('books') + '?page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'Checks an SQLite query plan.')
+    def test_pages_seek_through_an_index(self):
+        """ Deep pages start from the cursor in an index, rather than sorting or walking every earlier row. """
+        ordering = ('title', 'author_id', 'pk')
+        paginator = KeysetPaginator(Book.objects.all(), 10, ordering)
+        book = Book.objects.order_by(*ordering)[15]
+        queryset = Book.objects.order_by(*paginator._order_by()).filter(paginator._after(paginator._key(book)))
+        plan = queryset.explain()
+        self.assertIn('USING INDEX book_title_idx (title>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+        copies = BookInstance.objects.filter(status__exact='o')
+        paginator = KeysetPaginator(copies, 10, ('due_back', 'pk'))
+        plan = copies.order_by(*paginator._order_by()).filter(paginator._after([datetime.date.today(), uuid.uuid4()])).explain()
+        self.assertIn('USING INDEX bookinst_status_due_idx (status=? AND due_back>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import override_settings
+
+from catalog.stats import get_index_stats
+
+
+class IndexViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        Genre.objects.create(name='Fantasy')
+        for book_id, title in enumerate(['The Hobbit', 'Dune', 'Other Worlds']):
+            book = Book.objects.create(title=title, summary='Summary', isbn=f'ISBN{book_id}', author=test_author)
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a' if book_id else 'o')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_shows_counts(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['num_books'], 3)
+        self.assertEqual(response.context['num_books_filtered'], 2)
+        self.assertEqual(response.context['num_instances'], 3)
+        self.assertEqual(response.context['num_instances_available'], 2)
+        self.assertEqual(response.context['num_authors'], 1)
+        self.assertEqual(response.context['num_genres'], 1)
+
+    def test_stats_use_one_query_then_cache(self):
+        with self.assertNumQueries(1):
+            get_index_stats()
+        with self.assertNumQueries(0):
+            get_index_stats()
+
+    def test_visits_counted_without_session_writes(self):
+        for visit in range(1, 4):
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.context['num_visits'], visit)
+        self.assertFalse(Session.objects.exists())
+
+    def signed_visits(self, value):
+        response = HttpResponse()
+        response.set_signed_cookie('num_visits', value, salt='catalog.visits')
+        return response.cookies['num_visits'].value
+
+    def test_bad_visits_cookie_starts_over(self):
+        with override_settings(SECRET_KEY='rotated-away'):
+            old_key = self.signed_visits(5)
+        for value in ('5:tampered', old_key, self.signed_visits('five')):
+            self.client.cookies['num_visits'] = value
+            response = self.client.get(reverse('index'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['num_visits'], 1)
+
+    @override_settings(CATALOG_VISIT_COUNTER='session')
+    def test_visits_counted_in_session(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['num_visits'], 2)
+        self.assertEqual(self.client.session['num_visits'], 2)
+
+    def test_stats_invalidated_on_save_and_delete(self):
+        self.assertEqual(get_index_stats()['num_genres'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            genre = Genre.objects.create(name='Horror')
+            # Not before the change commits.
+            self.assertEqual(get_index_stats()['num_genres'], 1)
+        self.assertEqual(get_index_stats()['num_genres'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.delete()
+        self.assertEqual(get_index_stats()['num_genres'], 1)
+
+
+class AuthorDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+
+    def add_books(self, count):
+        for book_id in range(Book.objects.count(), Book.objects.count() + count):
+            book = Book.objects.create(title=f'Book {book_id}', summary='Summary', isbn=f'ISBN{book_id}', author=self.author)
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+            BookInstance.objects.create(book=book, imprint='Imprint', status='o')
+
+    def test_book_copy_counts(self):
+        self.add_books(1)
+        response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+        self.assertEqual(response.status_code, 200)
+        book = response.context['author'].books[0]
+        self.assertEqual(book.num_copies, 2)
+        self.assertEqual(book.num_available, 1)
+        self.assertContains(response, '1 of 2 available')
+
+    def test_query_count_does_not_grow_with_books(self):
+        # One query for the author (and country), one for the books with their copy counts.
+        for count in (1, 10, 30):
+            self.add_books(count)
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('author-detail', args=[self.author.pk]))
+            self.assertEqual(len(response.context['author'].books), Book.objects.count())
+
+
+from catalog.views import BookDetailView
+
+
+class BookDetailViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        test_language = Language.objects.create(name='English')
+        cls.book = Book.objects.create(
+            title='Book Title', summary='Summary', isbn='ABCDEFG', author=test_author, language=test_language,
+        )
+        cls.book.genre.set([Genre.objects.create(name='Fantasy'), Genre.objects.create(name='Horror')])
+
+    def add_copies(self, count, status='a'):
+        for copy in range(count):
+            BookInstance.objects.create(book=self.book, imprint='Imprint', status=status)
+
+    def test_copies_ordered_by_status(self):
+        self.add_copies(2, status='o')
+        self.add_copies(2, status='a')
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([copy.status for copy in response.context['book'].copies], ['a', 'a', 'o', 'o'])
+
+    def test_query_count_does_not_grow_with_copies(self):
+        # Book with author, language and copy count; genres; copies; readers also borrowed.
+        for count in (1, 20, 100):
+            self.add_copies(count)
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_copies_list_is_capped(self):
+        self.add_copies(BookDetailView.copies_limit + 5)
+        response = self.client.get(reverse('book-detail', args=[self.book.pk]))
+        self.assertEqual(len(response.context['book'].copies), BookDetailView.copies_limit)
+        self.assertContains(response, f'Showing {BookDetailView.copies_limit} of {BookDetailView.copies_limit + 5} copies.')
+
+
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class LoanedBookByAllUsersListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        cls.borrower = User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=test_author)
+
+    def add_loans(self, count):
+        for copy in range(count):
+            BookInstance.objects.create(
+                book=self.book,
+                imprint='Imprint',
+                status='o',
+                borrower=self.borrower,
+                due_back=datetime.date.today() + datetime.timedelta(days=copy),
+            )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('all-borrowed'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_forbidden_without_permission(self):
+        self.client.login(username='borrower', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('all-borrowed'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_query_count_does_not_grow_with_loans(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        self.add_loans(1)
+        baseline = self.count_queries()
+        self.add_loans(9)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_overdue_filter(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        self.add_loans(2)
+        late = BookInstance.objects.create(
+            book=self.book, imprint='Late', status='o', borrower=self.borrower,
+            due_back=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        response = self.client.get(reverse('all-borrowed'), {'overdue': '1'})
+        self.assertEqual(list(response.context['bookinstance_list']), [late])
+        self.assertTrue(response.context['overdue'])
+        self.assertEqual(len(self.client.get(reverse('all-borrowed')).context['bookinstance_list']), 3)
+
+    def test_admin_overdue_filter(self):
+        self.add_loans(1)
+        BookInstance.objects.create(
+            book=self.book, imprint='Late', status='o', borrower=self.borrower,
+            due_back=datetime.date.today() - datetime.timedelta(days=1),
+        )
+        admin = User.objects.create_superuser(username='admin', password='3oV#dq8Rk!x2L')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:catalog_bookinstance_changelist'), {'overdue': 'yes'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+import json
+
+
+class ExportLoansViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        User.objects.create_user(username='borrower', password='1X<ISRUkw+tuK')
+        test_author = Author.objects.create(first_name='John', last_name='Smith')
+        book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=test_author)
+        for copy in range(3):
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=cls.librarian, due_back=datetime.date(2024, 1, 1 + copy),
+            )
+
+    def test_requires_permission(self):
+        response = self.client.get(reverse('loans-export'))
+        self.assertEqual(response.status_code, 302)
+        self.client.login(username='borrower', password='1X<ISRUkw+tuK')
+        response = self.client.get(reverse('loans-export'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_streams_csv(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('loans-export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,title,isbn,author_last_name,author_first_name,imprint,status,due_back,borrower')
+        self.assertEqual(len(lines), 4)
+        self.assertIn('Book Title,ABCDEFG,Smith,John,Imprint,o,2024-01-0', lines[1])
+
+    def test_streams_jsonl(self):
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+        response = self.client.get(reverse('loans-export') + '?format=jsonl')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['borrower'], 'librarian')
+
+
+from unittest import mock
+
+from django.urls import get_resolver
+
+from catalog.dashboard import refresh
+from catalog.querybudget import QueryBudgetExceeded, get_query_budget
+from catalog.tests.mixins import QueryBudgetTestMixin
+from catalog.views import BookListView
+
+
+class QueryBudgetTest(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_user(username='librarian', password='2HJ1vRV0Z&3iD')
+        cls.librarian.user_permissions.set(Permission.objects.filter(content_type__app_label='catalog'))
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.genre = Genre.objects.create(name='Fantasy')
+        Language.objects.create(name='English')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='librarian', password='2HJ1vRV0Z&3iD')
+
+    def add_books(self, count):
+        """ Add `count` books, each with a copy on loan to the librarian and an available copy. """
+        start = Book.objects.count()
+        for book_id in range(start, start + count):
+            book = Book.objects.create(title=f'Book {book_id}', summary='Summary', isbn=f'ISBN{book_id}', author=self.author)
+            book.genre.set([self.genre])
+            BookInstance.objects.create(
+                book=book, imprint='Imprint', status='o', borrower=self.librarian, due_back=datetime.date.today(),
+            )
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+    def test_every_catalog_view_declares_a_budget(self):
+        for pattern in get_resolver('catalog.urls').url_patterns:
+            self.assertIsNotNone(get_query_budget(pattern.callback), pattern.name)
+
+    def test_index(self):
+        self.assertQueryBudgetScales(reverse('index'), self.add_books)
+
+    def test_book_list(self):
+        self.assertQueryBudgetScales(reverse('books'), self.add_books)
+
+    def test_book_search(self):
+        self.assertQueryBudgetScales(reverse('search') + '?q=book', self.add_books)
+
+    def test_book_detail(self):
+        book = Book.objects.create(title='Popular', summary='Summary', isbn='POPULAR', author=self.author)
+
+        def add_copies(count):
+            for copy in range(count):
+                BookInstance.objects.create(book=book, imprint='Imprint', status='a')
+
+        self.assertQueryBudgetScales(reverse('book-detail', args=[book.pk]), add_copies)
+
+    def test_author_detail(self):
+        self.assertQueryBudgetScales(reverse('author-detail', args=[self.author.pk]), self.add_books)
+
+    def test_borrowed_lists(self):
+        self.assertQueryBudgetScales(reverse('my-borrowed'), self.add_books)
+        self.assertQueryBudgetScales(reverse('all-borrowed'), self.add_books)
+
+    def test_export(self):
+        self.assertQueryBudgetScales(reverse('loans-export'), self.add_books)
+
+    def test_dashboard(self):
+        def add_books_and_refresh(count):
+            self.add_books(count)
+            refresh()
+
+        self.assertQueryBudgetScales(reverse('circulation-dashboard'), add_books_and_refresh)
+
+    def test_forms(self):
+        self.add_books(1)
+        loan = BookInstance.objects.filter(status='o').first()
+        book = Book.objects.first()
+        self.assertWithinQueryBudget(reverse('renew-book-librarian', args=[loan.pk]))
+        self.assertWithinQueryBudget(
+            reverse('renew-book-librarian', args=[loan.pk]), method='post',
+            data={'due_back': datetime.date.today() + datetime.timedelta(weeks=1)},
+        )
+        self.assertWithinQueryBudget(reverse('book-create'))
+        self.assertWithinQueryBudget(reverse('book-update', args=[book.pk]))
+        self.assertWithinQueryBudget(reverse('author-create'))
+        self.assertWithinQueryBudget(reverse('author-update', args=[self.author.pk]))
+        response, count = self.assertWithinQueryBudget(reverse('book-create'), method='post', data={
+            'title': 'New book', 'summary': 'Summary', 'isbn': 'NEWBOOK', 'author': self.author.pk,
+            'genre': [self.genre.pk], 'language': Language.objects.get().pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        response, count = self.assertWithinQueryBudget(reverse('author-create'), method='post', data={
+            'first_name': 'Jane', 'last_name': 'Doe',
+        })
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(QUERY_BUDGET_MODE='raise')
+    def test_middleware_raises_over_budget(self):
+        self.add_books(1)
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('books'))
+
+    @override_settings(QUERY_BUDGET_MODE='warn')
+    def test_middleware_warns_over_budget(self):
+        with mock.patch.object(BookListView, 'query_budget', 1):
+            with self.assertLogs('catalog.querybudget', 'WARNING'):
+                response = self.client.get(reverse('books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Count', response)
+
+
+from catalog.circulation import checkout
+
+
+@override_settings(CATALOG_PAGE_CACHE_TIMEOUT=300, CATALOG_FRAGMENT_CACHE_TIMEOUT=300)
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.book = Book.objects.create(title='Book Title', summary='Summary', isbn='ABCDEFG', author=cls.author)
+        cls.user = User.objects.create_user(username='testuser1', password='1X<ISRUkw+tuK')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached(self):
+        for url in (reverse('books'), reverse('book-detail', args=[self.book.pk]),
+                    reverse('authors'), reverse('author-detail', args=[self.author.pk])):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+
+    def test_edits_expire_cached_pages(self):
+        url = reverse('book-detail', args=[self.book.pk])
+        self.assertContains(self.client.get(url), 'Book Title')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = 'New Title'
+            self.book.save()
+            # A request before the commit sees the old rows, which must not be cached under the new version.
+            self.assertContains(self.client.get(url), 'Book Title')
+        self.assertContains(self.client.get(url), 'New Title')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.create(book=self.book, imprint='Fresh Imprint', status='a')
+        self.assertContains(self.client.get(url), 'Fresh Imprint')
+
+    def test_copy_changes_only_expire_pages_showing_copies(self):
+        other = Book.objects.create(title='Other Title', summary='Summary', isbn='OTHER', author=self.author)
+        copy = BookInstance.objects.create(book=self.book, imprint='Imprint', status='a')
+        urls = {
+            name: url for name, url in (
+                ('detail', reverse('book-detail', args=[self.book.pk])),
+                ('other', reverse('book-detail', args=[other.pk])),
+                ('books', reverse('books')),
+                ('authors', reverse('authors')),
+                ('author', reverse('author-detail', args=[self.author.pk])),
+            )
+        }
+        for url in urls.values():
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(copy.pk, self.user)
+
+        for name in ('other', 'authors'):
+            with self.assertNumQueries(0):
+                self.client.get(urls[name])
+        for name in ('detail', 'books', 'author'):
+            self.assertContains(self.client.get(urls[name]), '0 of 1')
+
+    def test_logged_in_pages_are_not_cached(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.client.get(reverse('books'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('books'))
+        self.assertGreater(len(queries), 0)
+
+    def test_sidebar_follows_permission_changes(self):
+        self.client.login(username='testuser1', password='1X<ISRUkw+tuK')
+        self.assertNotContains(self.client.get(reverse('books')), 'All borrowed')
+        self.user.user_permissions.add(Permission.objects.get(codename='can_mark_returned'))
+        self.assertContains(self.client.get(reverse('books')), 'All borrowed')
+
+
+from catalog.search import SearchResults
+
+
+class BookSearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(first_name='Ursula', last_name='Le Guin')
+        cls.other_author = Author.objects.create(first_name='John', last_name='Smith')
+        cls.in_title = Book.objects.create(
+            title='The Lighthouse', summary='A story.', isbn='TITLE', author=cls.other_author,
+        )
+        cls.in_summary = Book.objects.create(
+            title='Harbour Tales', summary='A lighthouse keeper remembers.', isbn='SUMMARY', author=cls.other_author,
+        )
+        cls.by_author = Book.objects.create(
+            title='A Wizard of Earthsea', summary='A young wizard.', isbn='AUTHOR', author=cls.author,
+        )
+
+    def titles(self, query):
+        return [book.title for book in SearchResults(query)[:20]]
+
+    def test_title_matches_rank_above_summary_matches(self):
+        self.assertEqual(self.titles('lighthouse'), ['The Lighthouse', 'Harbour Tales'])
+
+    def test_searches_author_names(self):
+        self.assertEqual(self.titles('guin'), ['A Wizard of Earthsea'])
+
+    def test_terms_match_prefixes(self):
+        self.assertEqual(self.titles('earth wiz'), ['A Wizard of Earthsea'])
+
+    def test_index_follows_book_changes(self):
+        self.in_title.title = 'The Beacon'
+        self.in_title.save()
+        self.assertEqual(self.titles('lighthouse'), ['Harbour Tales'])
+        self.assertEqual(self.titles('beacon'), ['The Beacon'])
+
+        self.in_summary.delete()
+        self.assertEqual(self.titles('lighthouse'), [])
+
+    def test_index_follows_author_renames(self):
+        self.author.last_name = 'Kroeber'
+        self.author.save()
+        self.assertEqual(self.titles('guin'), [])
+        self.assertEqual(self.titles('kroeber'), ['A Wizard of Earthsea'])
+
+    def test_bulk_created_books_are_indexed(self):
+        Book.objects.bulk_create([
+            Book(title=f'Lantern {book_id}', summary='Summary', isbn=f'BULK{book_id}', author=self.author)
+            for book_id in range(3)
+        ])
+        self.assertEqual(SearchResults('lantern').count(), 3)
+
+    def test_view_paginates_and_keeps_the_query(self):
+        for book_id in range(12):
+            Book.objects.create(title=f'Lantern {book_id}', summary='Summary', isbn=f'LAMP{book_id}', author=self.author)
+        response = self.client.get(reverse('search'), {'q': 'lantern'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'catalog/search_results.html')
+        self.assertEqual(len(response.context['book_list']), 10)
+        self.assertContains(response, '?q=lantern&amp;page=2')
+
+        response = self.client.get(reverse('search'), {'q': 'lantern', 'page': 2})
+        self.assertEqual(len(response.context['book_list']), 2)
+
+    def test_empty_query(self):
+        self.assertContains(self.client.get(reverse('search')), 'Enter a title')
+        # Search syntax characters are ignored rather than passed on to the database.
+        response = self.client.get(reverse('search'), {'q': ' "* '})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['book_list']), 0)
+
+
+from catalog.facets import get_facet_counts
+from catalog.models import Country
+
+
+class FacetedBookListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fantasy = Genre.objects.create(name='Fantasy')
+        cls.poetry = Genre.objects.create(name='Poetry')
+        cls.english = Language.objects.create(name='English')
+        cls.french = Language.objects.create(name='French')
+        cls.france = Country.objects.create(name='France', code='FRA')
+        english_author = Author.objects.create(first_name='John', last_name='Smith')
+        french_author = Author.objects.create(first_name='Jules', last_name='Verne', country=cls.france)
+
+        # 12 fantasy books in English by John Smith, every third with a copy available.
+        for book_id in range(12):
+            book = Book.objects.create(
+                title=f'Fantasy {book_id:02d}', summary='Summary', isbn=f'FANTASY{book_id}',
+                author=english_author, language=cls.english,
+            )
+            book.genre.set([cls.fantasy])
+            BookInstance.objects.create(book=book, imprint='Imprint', status='a' if book_id % 3 == 0 else 'm')
+        # 2 French books by Jules Verne, both fantasy and poetry, none available.
+        for book_id in range(2):
+            book = Book.objects.create(
+                title=f'Poésie {book_id}', summary='Summary', isbn=f'POETRY{book_id}',
+                author=french_author, language=cls.french,
+            )
+            book.genre.set([cls.fantasy, cls.poetry])
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, **params):
+        response = self.client.get(reverse('books'), params)
+        self.assertEqual(response.status_code, 200)
+        return [book.title for book in response.context['book_list']]
+
+    def facet(self, response, label):
+        return {value['name']: value['count'] for facet in response.context['facets']
+                if facet['label'] == label for value in facet['values']}
+
+    def test_filters(self):
+        self.assertEqual(self.titles(genre=self.poetry.pk), ['Poésie 0', 'Poésie 1'])
+        self.assertEqual(self.titles(language=self.french.pk), ['Poésie 0', 'Poésie 1'])
+        self.assertEqual(self.titles(country=self.france.pk), ['Poésie 0', 'Poésie 1'])
+        self.assertEqual(self.titles(available='1'), ['Fantasy 00', 'Fantasy 03', 'Fantasy 06', 'Fantasy 09'])
+        self.assertEqual(self.titles(genre=self.fantasy.pk, language=self.french.pk), ['Poésie 0', 'Poésie 1'])
+        self.assertEqual(self.titles(genre=self.poetry.pk, available='1'), [])
+        # Malformed values are ignored.
+        self.assertEqual(len(self.titles(genre='x', available='yes')), 10)
+
+    def test_facet_counts(self):
+        response = self.client.get(reverse('books'))
+        self.assertEqual(self.facet(response, 'Genre'), {'Fantasy': 14, 'Poetry': 2})
+        self.assertEqual(self.facet(response, 'Language'), {'English': 12, 'French': 2})
+        self.assertEqual(self.facet(response, 'Author country'), {'France': 2})
+        self.assertEqual(self.facet(response, 'Availability'), {'Has a copy available': 4})
+
+        # A facet's own filter is left out of its counts, so the alternatives stay visible.
+        response = self.client.get(reverse('books'), {'language': self.french.pk})
+        self.assertEqual(self.facet(response, 'Language'), {'English': 12, 'French': 2})
+        self.assertEqual(self.facet(response, 'Genre'), {'Fantasy': 2, 'Poetry': 2})
+        self.assertEqual(self.facet(response, 'Availability'), {'Has a copy available': 0})
+
+    def test_counts_take_one_query_per_facet_and_are_cached(self):
+        filters = {'genre': self.fantasy.pk}
+        with self.assertNumQueries(4):
+            get_facet_counts(Book.objects.all(), filters)
+        with self.assertNumQueries(0):
+            get_facet_counts(Book.objects.all(), filters)
+        with self.assertNumQueries(4):
+            get_facet_counts(Book.objects.all(), {'genre': self.poetry.pk})
+
+        # Edits make the cached counts stale once they commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(title='Fantasy 01').genre.add(self.poetry)
+        self.assertEqual(dict((name, count) for pk, name, count in get_facet_counts(Book.objects.all(), filters)['genre']),
+                         {'Fantasy': 14, 'Poetry': 3})
+
+    def test_checkouts_only_expire_the_counts_they_change(self):
+        filters = {'genre': self.fantasy.pk}
+        available = {**filters, 'available': True}
+        get_facet_counts(Book.objects.all(), filters)
+        get_facet_counts(Book.objects.all(), available)
+        copy = BookInstance.objects.filter(status='a').order_by('book__title').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(copy.pk, User.objects.create_user(username='reader'))
+
+        # The genre, language and country counts are kept, and only the available count is redone.
+        with self.assertNumQueries(1):
+            self.assertEqual(get_facet_counts(Book.objects.all(), filters)['available'], 3)
+        # Under the available filter every count can change, but the available count was just redone.
+        with self.assertNumQueries(3):
+            counts = get_facet_counts(Book.objects.all(), available)
+        self.assertEqual(dict((name, count) for pk, name, count in counts['genre']), {'Fantasy': 3})
+
+    def test_links_keep_the_filters(self):
+        response = self.client.get(reverse('books'), {'genre': self.fantasy.pk})
+        self.assertContains(response, f'?genre={self.fantasy.pk}&amp;cursor=')
+        self.assertContains(response, f'?genre={self.fantasy.pk}&amp;language={self.french.pk}"')
+        self.assertContains(response, '<a href="?">Any</a>', html=True)
+
+        page = response.context['page_obj']
+        response = self.client.get(reverse('books'), {'genre': self.fantasy.pk, 'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['book_list']), 4)
+
+    def test_sort_by_availability(self):
+        response = self.client.get(reverse('books'), {'sort': 'available'})
+        books = list(response.context['book_list'])
+        self.assertEqual([book.title for book in books[:4]], ['Fantasy 00', 'Fantasy 03', 'Fantasy 06', 'Fantasy 09'])
+        self.assertContains(response, '1 of 1 available')
+
+        # Keyset pages follow the same order, and keep the sort and the filters.
+        response = self.client.get(reverse('books'), {'sort': 'available', 'genre': self.fantasy.pk})
+        self.assertContains(response, f'?sort=available&amp;genre={self.fantasy.pk}&amp;cursor=')
+        cursor = response.context['page_obj'].next_cursor
+        response = self.client.get(reverse('books'), {'sort': 'available', 'genre': self.fantasy.pk, 'cursor': cursor})
+        self.assertEqual(
+            [book.title for book in response.context['book_list']],
+            ['Fantasy 10', 'Fantasy 11', 'Poésie 0', 'Poésie 1'],
+        )
+        response = self.client.get(reverse('books'), {
+            'sort': 'available', 'genre': self.fantasy.pk, 'cursor': response.context['page_obj'].previous_cursor,
+        })
+        self.assertEqual([book.title for book in response.context['book_list']][:4], [book.title for book in books[:4]])
+
+    def test_genre_and_language_urls(self):
+        self.assertEqual(self.poetry.get_absolute_url(), f'/catalog/books/?genre={self.poetry.pk}')
+        self.assertEqual(self.titles(genre=self.poetry.pk), ['Poésie 0', 'Poésie 1'])
+        response = self.client.get(self.french.get_absolute_url())
+        self.assertEqual(len(response.context['book_list']), 2)
@@ -9,6 +9,8 @@ urlpatterns = [
     # Using generic views
     path('books/', views.BookListView.as_view(), name='books'),
     path('books/<int:pk>', views.BookDetailView.as_view(), name='book-detail'),
+    path('search/', views.BookSearchView.as_view(), name='search'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
     path('authors/', views.AuthorListView.as_view(), name='authors'),
     path('author/<int:pk>', views.AuthorDetailView.as_view(), name='author-detail')
 ]
@@ -16,10 +18,13 @@ urlpatterns = [
 urlpatterns += [
     path('mybooks/', views.LoanedBookByUserListView.as_view(), name='my-borrowed'),
     path('borrowed/', views.LoanedBookByAllUsersListView.as_view(), name='all-borrowed'),
+    path('borrowed/export/', views.export_loans, name='loans-export'),
 ]
 
 urlpatterns += [
     path('book/<uuid:pk>/renew/', views.renew_book_librarian, name='renew-book-librarian'),
+    path('circulation/batch/', views.circulation_batch, name='circulation-batch'),
+    path('circulation/dashboard/', views.circulation_dashboard, name='circulation-dashboard'),
 ]
 
 urlpatterns += [
@@ -1,27 +1,54 @@
+import csv
 import datetime
+import itertools
+import json
 
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
+from django.core.exceptions import PermissionDenied
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseBadRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.db.models import Prefetch
 from django.urls import reverse, reverse_lazy
 from django.views import generic
 
-from .forms import RenewBookForm, RenewBookModelForm
-from .models import Book, Author, BookInstance, Genre, Country, Language
+from .autocomplete import suggest
+from .caching import AVAILABILITY_VERSION_KEY, CATALOG_VERSION_KEY, CachedPageMixin, copies_version_key
+from .dashboard import dashboard
+from .circulation import BatchConflict, CirculationConflict, batch, renew
+from .facets import build_facets, filter_books, get_facet_counts, parse_filters
+from .forms import BatchCirculationForm, RenewBookForm, RenewBookModelForm
+from .fuzzy import fuzzy_search
+from .models import Book, Author, BookInstance, Country, Language
+from .overdue import overdue_loans
+from .pagination import KeysetPaginationMixin
+from .querybudget import query_budget
+from .search import SearchResults
+from .stats import get_index_stats
+from .visits import get_visits, set_visits
 
 # Create your views here.
 
-class BookListView(generic.ListView):
+class BookListView(CachedPageMixin, KeysetPaginationMixin, generic.ListView):
     model = Book
+    query_budget = 9
+    page_cache_versions = (CATALOG_VERSION_KEY, AVAILABILITY_VERSION_KEY)
     context_object_name = 'book_list'
     paginate_by = 10
+    keyset_ordering = ('title', 'author_id', 'pk')
+    # ?sort=available lists the books with the most copies available first.
+    sort_orderings = {'available': ('-num_available', 'title', 'author_id', 'pk')}
+
+    def get_keyset_ordering(self):
+        return self.sort_orderings.get(self.request.GET.get('sort'), self.keyset_ordering)
 
     # queryset = Book.objects.filter(title__icontains='var')[:5]
     def get_queryset(self):
         # return Book.objects.filter(title__icontains='war')[:5]
-        return Book.objects.filter()
+        self.filters = parse_filters(self.request.GET)
+        books = filter_books(Book.objects.select_related('author'), self.filters)
+        return books.order_by(*self.get_keyset_ordering())
     
 
     # Demo for changing the get_context_data function
@@ -33,38 +60,103 @@ class BookListView(generic.ListView):
 
         # Create any data and add it to the context
         context['some_data'] = 'This is some data'
+        counts = get_facet_counts(Book.objects.order_by(), self.filters)
+        context['facets'] = build_facets(counts, self.filters, self.request.GET)
+        return context
+
+
+
+class BookSearchView(CachedPageMixin, generic.ListView):
+    """ Books matching the search box, best match first (see catalog/search.py). """
+    template_name = 'catalog/search_results.html'
+    context_object_name = 'book_list'
+    paginate_by = 10
+    query_budget = 7
+
+    def get_queryset(self):
+        results = SearchResults(self.request.GET.get('q', ''))
+        # Nothing found: the query may be a misspelled title.
+        self.fuzzy = bool(results.terms) and not results.count()
+        if self.fuzzy:
+            return fuzzy_search(self.request.GET['q'])
+        return results
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        context['fuzzy'] = self.fuzzy
         return context
 
     
-class BookDetailView(generic.DetailView):
+# Only the first request in a process queries the database, to build the index.
+@query_budget(2)
+def autocomplete(request):
+    """ Search box suggestions (book titles and author names) for the prefix in ?q=. """
+    query = request.GET.get('q', '')
+    return JsonResponse({'query': query, 'suggestions': suggest(query[:100])})
+
+
+class BookDetailView(CachedPageMixin, generic.DetailView):
     model = Book
+    query_budget = 8
 
+    # Titles with many copies only list the first ones on the page.
+    copies_limit = 50
 
-class AuthorListView(generic.ListView):
+    def get_page_cache_versions(self):
+        return (CATALOG_VERSION_KEY, copies_version_key(self.kwargs['pk']))
+
+    def get_queryset(self):
+        copies = BookInstance.objects.order_by('status', 'due_back', 'id')[:self.copies_limit]
+        return (
+            Book.objects
+            .select_related('author', 'language')
+            .prefetch_related('genre', Prefetch('bookinstance_set', queryset=copies, to_attr='copies'))
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Precomputed by `manage.py update_recommendations` (see catalog/recommendations.py).
+        context['also_borrowed'] = self.object.also_borrowed.select_related('other')
+        return context
+
+
+class AuthorListView(CachedPageMixin, generic.ListView):
     model = Author
+    query_budget = 5
 
 
-class AuthorDetailView(generic.DetailView):
+class AuthorDetailView(CachedPageMixin, generic.DetailView):
     model = Author
-    
-    # def get_context_data(self):
-    #     return Book.objects.all().annotate(available_count = models.Count('bookinstance', filter=models.Q(bookinstance__status='a')))
+    query_budget = 6
+    page_cache_versions = (CATALOG_VERSION_KEY, AVAILABILITY_VERSION_KEY)
 
-class LoanedBookByUserListView(LoginRequiredMixin, generic.ListView):
+    def get_queryset(self):
+        # Load the author's books (which carry their copy counts) in one extra query.
+        return (
+            Author.objects
+            .select_related('country')
+            .prefetch_related(Prefetch('book_set', to_attr='books'))
+        )
+
+class LoanedBookByUserListView(LoginRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """ Generic class-based view listing books on loan to current user. """
     model = BookInstance
+    query_budget = 5
     template_name = 'catalog/bookinstance_list_borrowed_user.html'
     paginate_by = 10
+    keyset_ordering = ('due_back', 'pk')
 
     def get_queryset(self):
         return (
             BookInstance.objects
+            .select_related('book', 'borrower')
             .filter(borrower=self.request.user)
             .filter(status__exact='o')
             .order_by('due_back')
         )
     
-class LoanedBookByAllUsersListView(PermissionRequiredMixin, generic.ListView):
+class LoanedBookByAllUsersListView(PermissionRequiredMixin, KeysetPaginationMixin, generic.ListView):
     """ Permission required to specific users who has the permission. """
     permission_required = 'catalog.can_mark_returned'
     permission_denied_message = 'Sorry, you do not have permission to access this page.'
@@ -73,15 +165,29 @@ class LoanedBookByAllUsersListView(PermissionRequiredMixin, generic.ListView):
     """ Generic class-based view listing books on loan to all users. """
     model = BookInstance
     template_name = 'catalog/bookinstance_list_borrowed_all_users.html'
+    query_budget = 5
     paginate_by = 10
+    keyset_ordering = ('due_back', 'pk')
 
     def get_queryset(self):
-        return (
+        queryset = (
             BookInstance.objects
+            .select_related('book', 'borrower')
             .filter(status__exact='o')
             .order_by('due_back')
         )
+        # ?overdue=1 lists only the loans past their due date.
+        if self.request.GET.get('overdue') == '1':
+            queryset = overdue_loans(queryset)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['overdue'] = self.request.GET.get('overdue') == '1'
+        return context
     
+# Renewing looks up the copy's book to expire only the cached pages showing it.
+@query_budget(9)
 @login_required
 @permission_required('catalog.can_renew', raise_exception=True)
 def renew_book_librarian(request, pk):
@@ -99,11 +205,14 @@ def renew_book_librarian(request, pk):
         if form.is_valid():
             # process the data in form.clean_data as required (here we just write it to the model due_back field)
             # book_instance.due_back = form.cleaned_data['renewal_date']  # replaced by ModelForm
-            book_instance.due_back = form.cleaned_data['due_back']
-            book_instance.save()
-
-            # Redirect to a new URL:
-            return HttpResponseRedirect(reverse('all-borrowed'))
+            # Only update due_back, and only if the copy is still on loan (see catalog/circulation.py).
+            try:
+                renew(book_instance.pk, form.cleaned_data['due_back'])
+            except CirculationConflict as e:
+                form.add_error(None, str(e))
+            else:
+                # Redirect to a new URL:
+                return HttpResponseRedirect(reverse('all-borrowed'))
     
     # If this is a GET (or any other method) create the default form.
     else:
@@ -118,50 +227,148 @@ def renew_book_librarian(request, pk):
     return render(request, 'catalog/book_renew_librarian.html', context)
 
 
+# Changing copies looks up their books to expire only the cached pages showing them.
+@query_budget(11)
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def circulation_batch(request):
+    """ Return, renew or check out many copies at once (see catalog/circulation.py).
+
+    Takes the form, or a JSON body such as {"action": "renew", "copies": [...],
+    "due_back": "2024-01-31"}, which is answered with JSON. The number of queries
+    does not depend on how many copies are sent. Renewing also needs the
+    permission renew_book_librarian() asks for.
+    """
+    wants_json = request.content_type == 'application/json'
+    results = None
+    if request.method == 'POST':
+        if wants_json:
+            try:
+                data = json.loads(request.body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return JsonResponse({'errors': {'__all__': ['Expected a JSON object.']}}, status=400)
+            if isinstance(data.get('copies'), list):
+                data['copies'] = '\n'.join(map(str, data['copies']))
+        else:
+            data = request.POST
+        if data.get('action') == 'renew' and not request.user.has_perm('catalog.can_renew'):
+            if wants_json:
+                return JsonResponse({'errors': {'action': ['You may not renew loans.']}}, status=403)
+            raise PermissionDenied
+        form = BatchCirculationForm(data)
+        if form.is_valid():
+            try:
+                outcome = batch(
+                    form.cleaned_data['action'], form.cleaned_data['copies'],
+                    borrower=form.cleaned_data['borrower'], due_back=form.cleaned_data['due_back'],
+                )
+            except BatchConflict as e:
+                form.add_error(None, str(e))
+            else:
+                titles = dict(BookInstance.objects.filter(pk__in=list(outcome)).values_list('pk', 'book__title'))
+                results = [
+                    {'id': str(copy_id), 'title': titles.get(copy_id), 'ok': error is None, 'error': error}
+                    for copy_id, error in outcome.items()
+                ]
+        if wants_json:
+            if results is None:
+                return JsonResponse({'errors': form.errors}, status=400)
+            return JsonResponse({'action': form.cleaned_data['action'], 'results': results})
+    else:
+        form = BatchCirculationForm()
 
-def index(request):
-    # return HttpResponse("This is the context from catalog index.")
-    # Generate counts of some of the main objects.
-    num_books = Book.objects.all().count()
-    num_instances = BookInstance.objects.all().count()
+    return render(request, 'catalog/circulation_batch.html', {'form': form, 'results': results})
 
-    # Available books (status = 'a')
-    num_instances_available = BookInstance.objects.filter(status__exact='a').count()
 
-    # The 'all()' is implied by default.
-    num_authors = Author.objects.count()
+@query_budget(8)
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def circulation_dashboard(request):
+    """ Loans per day, average loan length and the most borrowed books and genres.
 
-    # Number of visitors to this view, as counted in the session variable.
-    num_visits = request.session.get('num_visits', 0)
-    num_visits += 1
-    request.session['num_visits'] = num_visits
+    Everything is read from the tables kept up to date by `manage.py
+    refresh_dashboard` (see catalog/dashboard.py), so the page costs the same
+    few queries however large the catalog and its loan history grow.
+    """
+    return render(request, 'catalog/circulation_dashboard.html', dashboard())
 
-    # Genre count
-    num_genre = Genre.objects.count()
 
-    # Books which title contains the, case insensitive
-    filter_word = 'the'
-    num_books_filtered = Book.objects.filter(title__icontains=filter_word).count()
 
+class Echo:
+    """ An object that implements just the write method of the file-like interface, for csv.writer. """
+    def write(self, value):
+        return value
 
-    context = {
-        'num_books': num_books,
-        'num_instances': num_instances,
-        'num_instances_available': num_instances_available,
-        'num_authors': num_authors,
-        'num_genre': num_genre,
-        'filter_word': filter_word,
-        'num_books_filtered': num_books_filtered,
-        'num_visits': num_visits,
-    }
+
+# Columns of the circulation ledger export, in output order.
+LOAN_EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('title', 'book__title'),
+    ('isbn', 'book__isbn'),
+    ('author_last_name', 'book__author__last_name'),
+    ('author_first_name', 'book__author__first_name'),
+    ('imprint', 'imprint'),
+    ('status', 'status'),
+    ('due_back', 'due_back'),
+    ('borrower', 'borrower__username'),
+)
+
+
+@query_budget(5)
+@login_required
+@permission_required('catalog.can_mark_returned', raise_exception=True)
+def export_loans(request):
+    """ Stream every BookInstance with its book, author and borrower as CSV (default) or JSON Lines. """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return HttpResponseBadRequest('Unknown export format.')
+
+    # values_list() skips model instances, and iterator() fetches the rows in chunks
+    # (a server-side cursor on PostgreSQL), so memory stays bounded for any table size.
+    header = [name for name, lookup in LOAN_EXPORT_FIELDS]
+    rows = (
+        BookInstance.objects
+        .order_by()
+        .values_list(*[lookup for name, lookup in LOAN_EXPORT_FIELDS])
+        .iterator(chunk_size=2000)
+    )
+
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        lines = (writer.writerow(row) for row in itertools.chain([header], rows))
+        content_type = 'text/csv'
+    else:
+        lines = (json.dumps(dict(zip(header, row)), default=str) + '\n' for row in rows)
+        content_type = 'application/x-ndjson'
+
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="loans.{export_format}"'
+    return response
+
+
+@query_budget(5)
+def index(request):
+    # return HttpResponse("This is the context from catalog index.")
+    # Counts of the main objects (books, copies, authors, genres) come from
+    # one aggregate query and are cached between requests.
+    context = dict(get_index_stats())
+
+    # Number of visits to this view, as counted in a signed cookie (or the session).
+    num_visits = get_visits(request) + 1
+    context['num_visits'] = num_visits
 
     # Render the HTML template index.html with the data in the context variable.
-    return render(request, 'index.html', context=context)
+    response = render(request, 'index.html', context=context)
+    set_visits(request, response, num_visits)
+    return response
 
 """ Author Forms """
 
 class AuthorCreate(PermissionRequiredMixin, CreateView):
     model = Author
+    query_budget = 8
     fields = ['first_name', 'last_name','country', 'date_of_birth', 'date_of_death']
     initial = {'date_of_death': '11/11/2023'}
     permission_required = 'catalog.add_author'
@@ -176,6 +383,7 @@ class AuthorCreate(PermissionRequiredMixin, CreateView):
 
 class AuthorUpdate(PermissionRequiredMixin, UpdateView):
     model = Author
+    query_budget = 8
 
     # Not recommended (potential security issue if more fields added)
     fields = '__all__'
@@ -184,6 +392,7 @@ class AuthorUpdate(PermissionRequiredMixin, UpdateView):
 
 class AuthorDelete(PermissionRequiredMixin, DeleteView):
     model = Author
+    query_budget = 8
     success_url = reverse_lazy('authors')
     permission_required = 'catalog.delete_author'
 
@@ -201,6 +410,7 @@ class AuthorDelete(PermissionRequiredMixin, DeleteView):
 
 class BookCreate(PermissionRequiredMixin, CreateView):
     model = Book
+    query_budget = 15
     permission_required = 'catalog.add_book'
     fields = '__all__'
     
@@ -211,6 +421,7 @@ class BookCreate(PermissionRequiredMixin, CreateView):
 
 class BookUpdate(PermissionRequiredMixin, UpdateView):
     model = Book
+    query_budget = 15
     permission_required = 'catalog.change_book'
     fields = '__all__'
 
@@ -218,6 +429,7 @@ class BookUpdate(PermissionRequiredMixin, UpdateView):
 
 class BookDelete(PermissionRequiredMixin, DeleteView):
     model = Book
+    query_budget = 8
     permission_required = 'catalog.delete_book'
     success_url = reverse_lazy('books')
 
@@ -0,0 +1,36 @@
+""" Home page visit counter.
+
+With CATALOG_VISIT_COUNTER = 'cookie' (the default) the count lives in a signed
+cookie, so counting a visit costs no database work at all and anonymous
+visitors no longer get a row in the session table. 'session' keeps the old
+behaviour of storing the count in the session.
+"""
+from django.conf import settings
+
+VISITS_COOKIE = 'num_visits'
+VISITS_SALT = 'catalog.visits'
+VISITS_COOKIE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def get_visits(request):
+    """ Return how many times this visitor has seen the home page before. """
+    if settings.CATALOG_VISIT_COUNTER == 'session':
+        return request.session.get('num_visits', 0)
+    # None for a missing cookie, and for a tampered or expired one, or one signed with an old SECRET_KEY.
+    value = request.get_signed_cookie(VISITS_COOKIE, default=None, salt=VISITS_SALT, max_age=VISITS_COOKIE_MAX_AGE)
+    if value is not None and value.isdigit():
+        return int(value)
+    # No valid cookie yet: carry over a count kept by the session mode. This only
+    # reads the session, and only hits the database when the visitor already has
+    # a session cookie.
+    return request.session.get('num_visits', 0)
+
+
+def set_visits(request, response, num_visits):
+    """ Remember the new visit count. """
+    if settings.CATALOG_VISIT_COUNTER == 'session':
+        request.session['num_visits'] = num_visits
+    else:
+        response.set_signed_cookie(
+            VISITS_COOKIE, num_visits, salt=VISITS_SALT, max_age=VISITS_COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+        )
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -76,6 +77,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Listed first so that it counts every query of the request (see QUERY_BUDGET_MODE below)
+    'catalog.querybudget.QueryBudgetMiddleware',
+
     'django.middleware.security.SecurityMiddleware',
 
     #  Whitenoise
@@ -89,6 +93,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Compare the SQL queries of each request with the budget declared on its view.
+# 'warn' logs views going over budget, 'raise' turns it into an error, 'off' disables counting.
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'warn' if DEBUG else 'off')
+
 ROOT_URLCONF = 'locallibrary.urls'
 
 TEMPLATES = [
@@ -102,6 +110,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'catalog.context_processors.sidebar_cache',
             ],
         },
     },
@@ -165,6 +174,45 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Redirect to home URL after login (Default direct to /accounts/profile/)
 LOGIN_REDIRECT_URL = '/'
 
+# Cache shared by all the gunicorn workers of a host, with no external service needed.
+# (Tests get a private in-memory cache instead, see locallibrary/test_runner.py.)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(tempfile.gettempdir(), 'locallibrary-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# How long (in seconds) whole pages of the book/author lists and details are cached for
+# anonymous visitors, and the per-user part of the sidebar for logged in users.
+# Edits expire the cached pages immediately (see catalog/caching.py); 0 disables the cache.
+CATALOG_PAGE_CACHE_TIMEOUT = int(os.environ.get('CATALOG_PAGE_CACHE_TIMEOUT', 300))
+CATALOG_FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('CATALOG_FRAGMENT_CACHE_TIMEOUT', 300))
+
+TEST_RUNNER = 'locallibrary.test_runner.TestRunner'
+
+# How long (in seconds) the book list facet counts are cached for each combination of filters.
+# Edits make the cached counts stale immediately (see catalog/facets.py).
+CATALOG_FACET_CACHE_TIMEOUT = int(os.environ.get('CATALOG_FACET_CACHE_TIMEOUT', 300))
+
+# How long (in seconds) the home page record counts are cached.
+# The cache entry is also dropped whenever a book, copy, author or genre changes.
+CATALOG_INDEX_STATS_TTL = int(os.environ.get('CATALOG_INDEX_STATS_TTL', 60))
+
+# Where the home page visit counter is kept: 'cookie' (a signed cookie, no database
+# write per visit) or 'session' (a session-table write on every visit).
+CATALOG_VISIT_COUNTER = os.environ.get('CATALOG_VISIT_COUNTER', 'cookie')
+
+
+# Most suggestions the search box autocomplete returns for a prefix, and most books
+# or authors its in-memory index keeps for any one title or name (see catalog/autocomplete.py).
+CATALOG_AUTOCOMPLETE_TOP_K = int(os.environ.get('CATALOG_AUTOCOMPLETE_TOP_K', 10))
+
+# How alike (0 to 1, the share of trigrams in common) a title must be to a search that found
+# nothing to be offered as a "did you mean" match (see catalog/fuzzy.py).
+CATALOG_FUZZY_MIN_SIMILARITY = float(os.environ.get('CATALOG_FUZZY_MIN_SIMILARITY', 0.3))
+
 
 # Update database configuration from $DATABASE_URL environment variable (if defined)
 import dj_database_url
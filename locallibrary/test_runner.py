@@ -0,0 +1,22 @@
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """ The default test runner, with a private in-memory cache and no page or fragment caching.
+
+    Tests that exercise the page or fragment caches enable them with override_settings().
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+            CATALOG_PAGE_CACHE_TIMEOUT=0,
+            CATALOG_FRAGMENT_CACHE_TIMEOUT=0,
+        )
+        self.cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        super().teardown_test_environment(**kwargs)